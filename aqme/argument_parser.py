@@ -13,6 +13,7 @@ var_dict = {
     "name": None,
     "path": "",
     "output": ".sdf",
+    "ens_store": False,
     "csearch": False,
     "cmin": False,
     "qprep": False,
@@ -27,6 +28,7 @@ var_dict = {
     "constraints_angle": [],
     "constraints_dihedral": [],
     "ewin_cmin": 5.0,
+    "cmin_checkpoint": 0,
     "ewin_csearch": 5.0,
     "opt_fmax": 0.05,
     "opt_steps": 1000,
@@ -57,6 +59,17 @@ var_dict = {
     "program": None,
     "nprocs": None,
     "mem": "16GB",
+    "cost_report": "",
+    "workers_qprep": 1,
+    "pack_inputs": 1,
+    "dup_qprep": False,
+    "boltz_pop": None,
+    "boltz_temp": 298.15,
+    "boltz_cluster_rms": None,
+    "job_array": "",
+    "array_tasks": None,
+    "job_template": "",
+    "job_status": "",
     "mol": None,
     "destination": None,
     "qm_input": "",
@@ -109,6 +122,16 @@ var_dict = {
     "nmr_intercept": [181.7815,31.8723],  # [C,H]
     "nmr_experim": None,
     "nodup_check": False,
+    "compress_json": False,
+    "json_profile": "full",
+    "restart_inputs": False,
+    "split_outputs": False,
+    "bundle": "",
+    "results_db": False,
+    "incremental": False,
+    "watch": False,
+    "watch_interval": 60,
+    "stats_checkpoint": 1000,
     "qdescp_atoms": [],
     "xtb_opt": True,
     "dbstep_r": 3.5,
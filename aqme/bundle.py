@@ -0,0 +1,290 @@
+######################################################.
+#        This file stores functions related to       #
+#         the archives used to bundle AQME files      #
+######################################################.
+
+# Bundles are ZIP or TAR archives that replace the folders with thousands of small
+# files created by QPREP (input files) and QCORR (JSON files). Each bundle has an
+# index (BUNDLE.zip.idx, in JSON format) with the files stored and, for TAR archives, the offset,
+# size and modification time of their data, so single files are read without
+# scanning the archive. The index also stores the size and modification time of the
+# archive, and TAR archives are scanned again when they changed after the index was
+# written (i.e. runs that stopped before closing the bundle or archives modified with
+# other programs).
+# The files inside a bundle are used through virtual paths (PATH/BUNDLE.zip/FILE),
+# which are accepted by aqme.utils.open_file().
+
+import os
+import io
+import json
+import tarfile
+import time
+import warnings
+import zipfile
+from collections import OrderedDict
+
+
+bundle_formats = {".zip": "zip", ".tar": "tar"}
+index_suffix = ".idx"
+# number of bundle readers kept open (see get_bundle_reader())
+max_bundle_readers = 8
+bundle_readers = OrderedDict()
+
+
+def get_bundle_format(bundle_file):
+    """
+    Returns the format of a bundle from its extension ('zip' or 'tar', None for other files)
+    """
+
+    return bundle_formats.get(os.path.splitext(str(bundle_file))[1].lower())
+
+
+def split_bundle_path(file):
+    """
+    Splits a virtual path (PATH/BUNDLE.zip/FILE) into the bundle and the name of the file
+    inside the bundle. Returns None if the path doesn't point to a file inside a bundle.
+    """
+
+    bundle_file = os.path.dirname(str(file))
+    if get_bundle_format(bundle_file) is None or not os.path.isfile(bundle_file):
+        return None
+
+    return bundle_file, os.path.basename(str(file))
+
+
+class BundleWriter:
+    """
+    Writes files into a ZIP (compressed with deflate) or TAR bundle. Existing bundles are
+    extended, and files with the same name replace the previous ones when the bundle is read.
+
+    Parameters
+    ----------
+    bundle_file : str or Path
+        Bundle to create (the format is set by the extension, .zip or .tar)
+    index_interval : int, default=100
+        Number of files written between updates of the index (the index is also
+        written when the bundle is closed)
+    """
+
+    def __init__(self, bundle_file, index_interval=100):
+        self.bundle_file = str(bundle_file)
+        self.index_interval = index_interval
+        self.n_unindexed = 0
+        self.bundle_format = get_bundle_format(self.bundle_file)
+        if self.bundle_format is None:
+            raise ValueError(f"{self.bundle_file} is not a valid bundle (formats: {', '.join(bundle_formats)})")
+        self.index = {}
+        if os.path.exists(self.bundle_file):
+            reader = BundleReader(self.bundle_file)
+            self.index = reader.index
+            reader.close()
+
+        mode = "a" if os.path.exists(self.bundle_file) else "w"
+        if self.bundle_format == "zip":
+            self.archive = zipfile.ZipFile(self.bundle_file, mode, compression=zipfile.ZIP_DEFLATED)
+        else:
+            self.archive = tarfile.open(self.bundle_file, mode, format=tarfile.PAX_FORMAT)
+
+    def write(self, name, data):
+        """
+        Adds a file to the bundle (data as str or bytes)
+        """
+
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        if self.bundle_format == "zip":
+            with warnings.catch_warnings():
+                # files written again replace the previous ones when the bundle is read
+                warnings.simplefilter("ignore", UserWarning)
+                self.archive.writestr(name, data)
+            self.index[name] = [None, len(data), None]
+        else:
+            tarinfo = tarfile.TarInfo(name)
+            tarinfo.size = len(data)
+            tarinfo.mtime = int(time.time())
+            self.archive.addfile(tarinfo, io.BytesIO(data))
+            # the data is placed right before the end of the archive (padded to blocks of 512 bytes)
+            data_offset = self.archive.offset - -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            self.index[name] = [data_offset, len(data), tarinfo.mtime * 10**9]
+
+        self.n_unindexed += 1
+        if self.n_unindexed >= self.index_interval:
+            self.write_index()
+
+    def write_index(self):
+        """
+        Writes the index of the files stored so far, with the size and modification time of
+        the archive (the index is replaced atomically, so it's never read half-written)
+        """
+
+        if self.bundle_format == "tar" and not self.archive.closed:
+            self.archive.fileobj.flush()
+        bundle_stat = os.stat(self.bundle_file)
+        index_data = {
+            "format": self.bundle_format,
+            "size": bundle_stat.st_size,
+            "mtime_ns": bundle_stat.st_mtime_ns,
+            "files": self.index,
+        }
+        index_file = f"{self.bundle_file}{index_suffix}"
+        with open(f"{index_file}.tmp", "w") as F:
+            json.dump(index_data, F)
+        os.replace(f"{index_file}.tmp", index_file)
+        self.n_unindexed = 0
+        clear_bundle_readers()
+
+    def close(self):
+        # the end of the TAR archive is added when it's closed, so the index is updated again
+        self.write_index()
+        self.archive.close()
+        self.write_index()
+
+
+def read_bundle_index(bundle_file):
+    """
+    Reads the index of a bundle (empty if the bundle or the index don't exist, or if the
+    bundle changed after the index was written)
+    """
+
+    index_file = f"{bundle_file}{index_suffix}"
+    if not os.path.exists(bundle_file) or not os.path.exists(index_file):
+        return {}
+    with open(index_file, "r") as F:
+        index_data = json.load(F)
+
+    bundle_stat = os.stat(bundle_file)
+    if index_data.get("size") != bundle_stat.st_size or index_data.get("mtime_ns") != bundle_stat.st_mtime_ns:
+        return {}
+
+    return index_data["files"]
+
+
+class BundleReader:
+    """
+    Reads files from a ZIP or TAR bundle without extracting it. The files of TAR bundles
+    are read directly from their offsets in the index (the archive is only scanned when
+    the index is missing or outdated).
+
+    Parameters
+    ----------
+    bundle_file : str or Path
+        Bundle to read
+    """
+
+    def __init__(self, bundle_file):
+        self.bundle_file = str(bundle_file)
+        self.bundle_format = get_bundle_format(self.bundle_file)
+        self.index = read_bundle_index(self.bundle_file)
+
+        self.archive = None
+        if self.bundle_format == "zip":
+            self.archive = zipfile.ZipFile(self.bundle_file, "r")
+            self.index = {
+                info.filename: [None, info.file_size, int(time.mktime(info.date_time + (0, 0, -1))) * 10**9]
+                for info in self.archive.infolist()
+            }
+        elif len(self.index) == 0:
+            bundle_size = os.stat(self.bundle_file).st_size
+            with tarfile.open(self.bundle_file, "r") as archive:
+                try:
+                    for tarinfo in archive:
+                        # files cut at the end of the archive (i.e. from runs that stopped while writing) are skipped
+                        if tarinfo.isfile() and tarinfo.offset_data + tarinfo.size <= bundle_size:
+                            self.index[tarinfo.name] = [tarinfo.offset_data, tarinfo.size, int(tarinfo.mtime) * 10**9]
+                except tarfile.ReadError:
+                    pass
+
+    def names(self):
+        return list(self.index)
+
+    def read(self, name):
+        """
+        Returns the content of a file of the bundle (as bytes)
+        """
+
+        if name not in self.index:
+            raise FileNotFoundError(f"{name} is not included in {self.bundle_file}")
+        if self.bundle_format == "zip":
+            return self.archive.read(name)
+
+        offset, size, _ = self.index[name]
+        with open(self.bundle_file, "rb") as F:
+            F.seek(offset)
+            return F.read(size)
+
+    def close(self):
+        # only ZIP bundles are kept open (the files of TAR bundles are opened in each read)
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
+
+def get_bundle_reader(bundle_file, mtime_ns):
+    """
+    Readers of the bundles used recently (a bundle is loaded again when it's modified). The
+    readers that are dropped from the cache are closed.
+    """
+
+    reader_key = (bundle_file, mtime_ns)
+    if reader_key in bundle_readers:
+        bundle_readers.move_to_end(reader_key)
+        return bundle_readers[reader_key]
+
+    reader = BundleReader(bundle_file)
+    bundle_readers[reader_key] = reader
+    while len(bundle_readers) > max_bundle_readers:
+        _, old_reader = bundle_readers.popitem(last=False)
+        old_reader.close()
+
+    return reader
+
+
+def clear_bundle_readers():
+    """
+    Closes and removes all the bundle readers from the cache of get_bundle_reader()
+    """
+
+    while len(bundle_readers) > 0:
+        _, reader = bundle_readers.popitem()
+        reader.close()
+
+
+def get_file_mtime(file):
+    """
+    Returns the modification time (in ns) of a file, including files inside bundles
+    """
+
+    if os.path.exists(file):
+        return os.stat(file).st_mtime_ns
+    bundle_file, name = split_bundle_path(file)
+
+    return get_bundle_reader(bundle_file, os.stat(bundle_file).st_mtime_ns).index[name][2]
+
+
+def open_bundle_file(file, mode="r"):
+    """
+    Opens a file inside a bundle from its virtual path (PATH/BUNDLE.zip/FILE)
+    """
+
+    bundle_file, name = split_bundle_path(file)
+    reader = get_bundle_reader(bundle_file, os.stat(bundle_file).st_mtime_ns)
+    stream = io.BytesIO(reader.read(name))
+    if "b" in mode:
+        return stream
+
+    return io.TextIOWrapper(stream, encoding="utf-8", errors="replace")
+
+
+def list_bundle(bundle_file, extensions=None):
+    """
+    Returns the virtual paths of the files of a bundle (only the files with the extensions
+    specified, i.e. ['.json', '.json.gz'], if extensions is not None)
+    """
+
+    reader = get_bundle_reader(str(bundle_file), os.stat(bundle_file).st_mtime_ns)
+    names = reader.names()
+    if extensions is not None:
+        names = [name for name in names if name.lower().endswith(tuple(extensions))]
+
+    return [os.path.join(str(bundle_file), name) for name in names]
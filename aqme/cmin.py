@@ -6,7 +6,7 @@ General
 +++++++
 
    files : str or list of str, default=None
-     Input files. Formats accepted: XYZ, SDF, GJF, COM and PDB. Also, lists can
+     Input files. Formats accepted: XYZ, SDF, ENS, GJF, COM and PDB. Also, lists can
      be used (i.e. [FILE1.sdf, FILE2.sdf] or \*.FORMAT such as \*.sdf).  
    program : str, default=None
      Program required in the conformational refining. 
@@ -41,6 +41,11 @@ General
      filter of E + RMS  
    rms_threshold : float, default=0.25
      RMS difference between unique conformers for the second filter of E + RMS  
+   cmin_checkpoint : int, default=0
+     Number of optimization steps (ANI) or xTB cycles between checkpoints. At each 
+     checkpoint, the conformers that converged onto another conformer (using 
+     energy_threshold and rms_threshold) stop their optimizations. Set to 0 to 
+     disable the checkpoints. In xTB, the total number of cycles is limited by opt_steps  
    stacksize : str, default='1G'
      Controls the stack size used (especially relevant for xTB/CREST 
      calculations of large systems, where high stack sizes are needed)
@@ -48,6 +53,9 @@ General
       Prefix added to all the names  
    suffix : str, default=''  
       Suffix added to all the names  
+   ens_store : bool, default=False
+     Write the output conformers as binary ensemble stores (ENS files) instead 
+     of SDF files. ENS files can be used as inputs in CMIN, QPREP and QDESCP  
 
 xTB only
 ++++++++
@@ -104,9 +112,11 @@ from aqme.utils import (
     add_prefix_suffix,
     check_xtb,
     check_dependencies,
-    set_destination
+    set_destination,
+    get_sdf_index
 )
-from aqme.filter import conformer_filters
+from aqme.filter import conformer_filters, checkpoint_filter
+from aqme.ensemble import EnsembleStore, EnsembleWriter, ens_extension
 from aqme.csearch.crest import xtb_opt_main
 from aqme.csearch.utils import prepare_com_files
 
@@ -181,10 +191,10 @@ class cmin:
                     stderr=subprocess.DEVNULL,
                 )
             files_cmin = glob.glob('*.sdf')
-        elif file_format.lower() == 'sdf':
+        elif file_format.lower() in ['sdf', 'ens']:
             files_cmin = self.args.files
         else:
-            self.args.log.write(f"\nx  The input format {file_format} is not supported for CMIN refinement! Formats allowed: SDF, XYZ, COM, GJF and PDB")
+            self.args.log.write(f"\nx  The input format {file_format} is not supported for CMIN refinement! Formats allowed: SDF, ENS, XYZ, COM, GJF and PDB")
             self.args.log.finalize()
             sys.exit()
 
@@ -202,15 +212,21 @@ class cmin:
             self.cmin_folder.mkdir(exist_ok=True, parents=True)
             self.cmin_folder.joinpath('All_confs').mkdir(exist_ok=True, parents=True)
 
+            # ENS writers only create the files when they are closed
+            if self.args.ens_store:
+                output_ext, output_writer = ens_extension, EnsembleWriter
+            else:
+                output_ext, output_writer = self.args.output, Chem.SDWriter
+
             self.cmin_all_file = self.cmin_folder.joinpath(
-                f"All_confs/{self.name}_{self.args.program.lower()}_all_confs{self.args.output}"
+                f"All_confs/{self.name}_{self.args.program.lower()}_all_confs{output_ext}"
             )
-            self.sdwriterall = Chem.SDWriter(str(self.cmin_all_file))
+            self.sdwriterall = output_writer(str(self.cmin_all_file))
 
             self.cmin_file = self.cmin_folder.joinpath(
-                self.name + "_" + self.args.program.lower() + self.args.output
+                self.name + "_" + self.args.program.lower() + output_ext
             )
-            self.sdwriter = Chem.SDWriter(str(self.cmin_file))
+            self.sdwriter = output_writer(str(self.cmin_file))
 
             # run the optimizations
             _ = self.compute_cmin(file)
@@ -248,7 +264,7 @@ class cmin:
             file_path = file_path.as_posix()
             inmols = mol_from_sdf_or_mol_or_mol2(file_path, 'cmin', self.args)
 
-        name_mol = os.path.basename(file).split(".sdf")[0]
+        name_mol = os.path.basename(file).split(".sdf")[0].split(ens_extension)[0]
 
         return inmols, name_mol
 
@@ -271,20 +287,22 @@ class cmin:
             # sets charge and mult
             file_format = os.path.basename(Path(file)).split('.')[-1]
             charge_input, mult_input, final_mult = None, None, None
-            if file_format.lower() == 'sdf':
+            if file_format.lower() in ['sdf', 'ens']:
                 if self.args.charge is None or self.args.mult is None:
                     # read charge and mult from SDF if possible (i.e. charge/mult of SDFs created with CSEARCH)
-                    with open(file, "r") as F:
-                        lines = F.readlines()
-                    charge_found, mult_found = False, False
-                    for i, line in enumerate(lines):
-                        if line.find(">  <Real charge>") > -1:
-                            charge_input = lines[i + 1].split()[0]
-                            charge_found = True
-                        if line.find(">  <Mult>") > -1:
-                            mult_input = lines[i + 1].split()[0]
-                            mult_found = True
-                        if charge_found and mult_found:
+                    if file_format.lower() == 'ens':
+                        ens_store = EnsembleStore(file)
+                        charges_sdf, mults_sdf = ens_store.get_prop("Real charge"), ens_store.get_prop("Mult")
+                    else:
+                        sdf_index = get_sdf_index(file)
+                        charges_sdf, mults_sdf = sdf_index.charges, sdf_index.mults
+                    for charge_sdf in charges_sdf:
+                        if charge_sdf is not None:
+                            charge_input = charge_sdf.split()[0]
+                            break
+                    for mult_sdf in mults_sdf:
+                        if mult_sdf is not None:
+                            mult_input = mult_sdf.split()[0]
                             break
             if self.args.charge is None and charge_input is None:
                 # if no charge/mult was specified or found, the charge is calculated using the mol object
@@ -302,38 +320,54 @@ class cmin:
             else:
                 mult = self.args.mult
 
-        for i, mol in enumerate(self.mols):
-            if mol is not None:
-                # ANI calculations use ASE to run
-                if self.args.program.lower() == "ani":
-                    mol, energy, cmin_valid = self.ani_optimize(mol,charge,mult)
-                # xTB calculations use the xTB program directly
-                elif self.args.program.lower() == "xtb":
-                    # for contrained optimizations
-                    complex_ts = False
-                    if len(self.args.constraints_atoms) >= 1 or len(self.args.constraints_dist) >= 1 or len(self.args.constraints_angle) >= 1 or len(self.args.constraints_dihedral) >= 1:
-                        complex_ts = True
-                    name_init = mol.GetProp('_Name')
-                    mol, energy, cmin_valid = xtb_opt_main(
-                        f'{self.name}_conf_{i}',
-                        self,
-                        charge,
-                        mult,
-                        None,
-                        self.args.constraints_atoms,
-                        self.args.constraints_dist,
-                        self.args.constraints_angle,
-                        self.args.constraints_dihedral,
-                        'xtb',
-                        self.args.geom,
-                        complex_ts=complex_ts,
-                        mol=mol,
-                        name_init=name_init
-                    )
-                if cmin_valid:
-                    pmol = PropertyMol(mol)
-                    outmols.append(pmol)
-                    cenergy.append(energy)
+        # checkpoints to stop the optimization of conformers that converge onto the same minimum
+        use_checkpoints = False
+        if self.args.cmin_checkpoint > 0:
+            use_checkpoints = True
+            if self.args.program.lower() == "xtb":
+                if len(self.args.constraints_atoms) >= 1 or len(self.args.constraints_dist) >= 1 or len(self.args.constraints_angle) >= 1 or len(self.args.constraints_dihedral) >= 1:
+                    self.args.log.write(f"\nx  The cmin_checkpoint option is not compatible with constrained xTB optimizations, the checkpoints will be turned off!")
+                    use_checkpoints = False
+
+        if use_checkpoints:
+            if self.args.program.lower() == "ani":
+                outmols, cenergy = self.ani_optimize_checkpoint(charge, mult)
+            elif self.args.program.lower() == "xtb":
+                outmols, cenergy = self.xtb_optimize_checkpoint(charge, mult)
+
+        else:
+            for i, mol in enumerate(self.mols):
+                if mol is not None:
+                    # ANI calculations use ASE to run
+                    if self.args.program.lower() == "ani":
+                        mol, energy, cmin_valid = self.ani_optimize(mol,charge,mult)
+                    # xTB calculations use the xTB program directly
+                    elif self.args.program.lower() == "xtb":
+                        # for contrained optimizations
+                        complex_ts = False
+                        if len(self.args.constraints_atoms) >= 1 or len(self.args.constraints_dist) >= 1 or len(self.args.constraints_angle) >= 1 or len(self.args.constraints_dihedral) >= 1:
+                            complex_ts = True
+                        name_init = mol.GetProp('_Name')
+                        mol, energy, cmin_valid = xtb_opt_main(
+                            f'{self.name}_conf_{i}',
+                            self,
+                            charge,
+                            mult,
+                            None,
+                            self.args.constraints_atoms,
+                            self.args.constraints_dist,
+                            self.args.constraints_angle,
+                            self.args.constraints_dihedral,
+                            'xtb',
+                            self.args.geom,
+                            complex_ts=complex_ts,
+                            mol=mol,
+                            name_init=name_init
+                        )
+                    if cmin_valid:
+                        pmol = PropertyMol(mol)
+                        outmols.append(pmol)
+                        cenergy.append(energy)
 
         if len(cenergy) >= 1:
             # if SQM energy exists, overwrite RDKit energies and geometries
@@ -444,6 +478,170 @@ class cmin:
 
         return mol, energy, cmin_valid
 
+    # ANI OPTIMIZATIONS WITH CHECKPOINTS
+    def ani_optimize_checkpoint(self, charge, mult):
+        """
+        Runs the ANI optimizations of all the conformers in blocks of cmin_checkpoint steps.
+        At each checkpoint, the conformers that converged onto another conformer are stopped.
+        """
+
+        import torch
+        import ase
+        self.args.log.write(f"\no  Starting ANI optimizations with checkpoints every {self.args.cmin_checkpoint} steps")
+
+        os.environ["KMP_DUPLICATE_LIB_OK"] = "True"
+        DEVICE = torch.device("cpu")
+
+        # if a large system is used, you might need to increase the stack size
+        os.environ["OMP_STACKSIZE"] = self.args.stacksize
+
+        model = self.get_cmin_model()
+        ev_to_kcal = ase.units.mol / ase.units.kcal
+
+        # set up one BFGS optimizer per conformer, the optimizers are run step by step with irun()
+        mols_ckpt, ase_mols, optimizers, opt_runs, cenergy_ckpt = [], [], [], [], []
+        for mol in self.mols:
+            if mol is not None:
+                elements = ""
+                for _, atom in enumerate(mol.GetAtoms()):
+                    elements += atom.GetSymbol()
+                ase_molecule = ase.Atoms(
+                    elements, positions=mol.GetConformers()[0].GetPositions().tolist(), calculator=model.ase()
+                )
+                for i, atom in enumerate(ase_molecule):
+                    atom.charge = charge[i]
+                    atom.magmom = mult[i]
+                optimizer = ase.optimize.BFGS(ase_molecule, logfile="cmin.opt")
+                mols_ckpt.append(mol)
+                ase_mols.append(ase_molecule)
+                optimizers.append(optimizer)
+                opt_runs.append(optimizer.irun(fmax=self.args.opt_fmax, steps=self.args.opt_steps))
+                cenergy_ckpt.append(0)
+
+        alive = list(range(len(mols_ckpt)))
+        active = list(range(len(mols_ckpt)))
+        n_stopped = 0
+        while len(active) > 0:
+            for idx in list(active):
+                target_steps = optimizers[idx].nsteps + self.args.cmin_checkpoint
+                try:
+                    while optimizers[idx].nsteps < target_steps:
+                        next(opt_runs[idx])
+                except StopIteration:
+                    # converged or reached opt_steps
+                    active.remove(idx)
+                except KeyError:
+                    self.args.log.write(f"\nx  {self.args.ani_method} could not optimize this molecule (i.e. check if all the atoms used are compatible with ANI)")
+                    active.remove(idx)
+                    alive.remove(idx)
+                    continue
+
+                # update the geometry of the mol object and get the current energy
+                cartesians = ase_mols[idx].get_positions()
+                for j in range(mols_ckpt[idx].GetNumAtoms()):
+                    [x, y, z] = cartesians[j]
+                    mols_ckpt[idx].GetConformer().SetAtomPosition(j, Point3D(x, y, z))
+                cenergy_ckpt[idx] = ase_mols[idx].get_potential_energy() * ev_to_kcal
+
+            duplicates = checkpoint_filter(self, mols_ckpt, cenergy_ckpt, alive, active)
+            for idx in duplicates:
+                active.remove(idx)
+                alive.remove(idx)
+            n_stopped += len(duplicates)
+
+        if n_stopped > 0:
+            self.args.log.write(f"\no  {n_stopped} conformer(s) stopped at the checkpoints since they converged onto other conformers")
+
+        # compute the final energies
+        outmols, cenergy = [], []
+        for idx in alive:
+            elements = ""
+            for _, atom in enumerate(mols_ckpt[idx].GetAtoms()):
+                elements += atom.GetSymbol()
+            coordinates = torch.tensor(
+                [ase_mols[idx].get_positions().tolist()], requires_grad=True, device=DEVICE
+            )
+            species = model.species_to_tensor(elements).to(DEVICE).unsqueeze(0)
+            _, ani_energy = model((species, coordinates))
+            outmols.append(PropertyMol(mols_ckpt[idx]))
+            cenergy.append(ani_energy.item() * hartree_to_kcal)  # Hartree to kcal/mol
+
+        return outmols, cenergy
+
+    # xTB OPTIMIZATIONS WITH CHECKPOINTS
+    def xtb_optimize_checkpoint(self, charge, mult):
+        """
+        Runs staged xTB optimizations of cmin_checkpoint cycles for all the conformers (up to
+        opt_steps cycles). Between stages, the conformers that converged onto another conformer
+        are stopped.
+        """
+
+        self.args.log.write(f"\no  Starting xTB optimizations with checkpoints every {self.args.cmin_checkpoint} cycles")
+
+        mols_ckpt, names_ckpt, names_init, cenergy_ckpt, cycles = [], [], [], [], []
+        for i, mol in enumerate(self.mols):
+            if mol is not None:
+                mols_ckpt.append(mol)
+                names_ckpt.append(f'{self.name}_conf_{i}')
+                names_init.append(mol.GetProp('_Name'))
+                cenergy_ckpt.append(0)
+                cycles.append(0)
+
+        alive = list(range(len(mols_ckpt)))
+        active = list(range(len(mols_ckpt)))
+        n_stopped = 0
+        while len(active) > 0:
+            for idx in list(active):
+                mol, energy, cmin_valid = xtb_opt_main(
+                    names_ckpt[idx],
+                    self,
+                    charge,
+                    mult,
+                    None,
+                    [],
+                    [],
+                    [],
+                    [],
+                    'xtb',
+                    self.args.geom,
+                    complex_ts=False,
+                    mol=mols_ckpt[idx],
+                    name_init=names_init[idx],
+                    opt_cycles=self.args.cmin_checkpoint
+                )
+                if not cmin_valid:
+                    active.remove(idx)
+                    alive.remove(idx)
+                    continue
+                mols_ckpt[idx] = mol
+                cenergy_ckpt[idx] = energy
+                cycles[idx] += self.args.cmin_checkpoint
+
+                # the output of the last stage shows whether the optimization converged
+                xtb_out = self.cmin_folder.joinpath(f'xtb_xyz/{names_ckpt[idx]}_xtb_xtb1.out')
+                converged = False
+                if os.path.exists(xtb_out):
+                    with open(xtb_out, "r") as F:
+                        converged = 'GEOMETRY OPTIMIZATION CONVERGED' in F.read()
+                if converged or cycles[idx] >= self.args.opt_steps:
+                    active.remove(idx)
+
+            duplicates = checkpoint_filter(self, mols_ckpt, cenergy_ckpt, alive, active)
+            for idx in duplicates:
+                active.remove(idx)
+                alive.remove(idx)
+            n_stopped += len(duplicates)
+
+        if n_stopped > 0:
+            self.args.log.write(f"\no  {n_stopped} conformer(s) stopped at the checkpoints since they converged onto other conformers")
+
+        outmols, cenergy = [], []
+        for idx in alive:
+            outmols.append(PropertyMol(mols_ckpt[idx]))
+            cenergy.append(cenergy_ckpt[idx])
+
+        return outmols, cenergy
+
     # generate the CMIN optimization model
     def get_cmin_model(self):
         """
@@ -37,6 +37,9 @@ General
       Prefix added to all the names  
    suffix : str, default=''  
       Suffix added to all the names  
+   ens_store : bool, default=False  
+      Store the final conformers as binary ensemble stores (ENS files) instead 
+      of SDF files. ENS files can be used as inputs in CMIN, QPREP and QDESCP  
    stacksize : str, default='1G'  
       Controls the stack size used (especially relevant for xTB/CREST 
       calculations of large systems, where high stack sizes are needed)  
@@ -201,7 +204,7 @@ from rdkit.Chem import rdmolfiles, rdMolTransforms, PropertyMol, rdDistGeom, Lip
 from aqme.filter import (
     filters,
     conformer_filters,
-    geom_filter,
+    get_geom_rule,
     cluster_conformers
     )
 from aqme.csearch.utils import (
@@ -233,6 +236,7 @@ from aqme.utils import (
     load_sdf
     )
 from aqme.csearch.crest import xtb_opt_main
+from aqme.ensemble import sdf_to_ensemble
 
 
 class csearch:
@@ -325,6 +329,10 @@ class csearch:
             for sdf_file in glob.glob(f'{self.csearch_folder}/*.sdf'):
                 if os.path.getsize(sdf_file) == 0:
                     os.remove(sdf_file)
+                # the SDF files are replaced by binary ENS files
+                elif self.args.ens_store:
+                    if sdf_to_ensemble(sdf_file) is not None:
+                        os.remove(sdf_file)
 
         elapsed_time = round(time.time() - start_time_overall, 2)
         self.args.log.write(f"\nTime CSEARCH: {elapsed_time} seconds\n")
@@ -353,6 +361,7 @@ class csearch:
             "yml",
             "rtf",
             "pdb",
+            "ens",
         ]
 
         file_format = os.path.basename(Path(csearch_file)).split('.')[-1]
@@ -374,6 +383,7 @@ class csearch:
         Extension2inputgen["sdf"] = prepare_sdf_files
         Extension2inputgen["mol"] = prepare_sdf_files
         Extension2inputgen["mol2"] = prepare_sdf_files
+        Extension2inputgen["ens"] = prepare_sdf_files
         Extension2inputgen["pdb"] = prepare_pdb_files
 
         # Prepare the jobs
@@ -1122,11 +1132,27 @@ class csearch:
     def min_and_E_calc(self, mol, cids, coord_Map, alg_Map, mol_template, 
                        ff, geom, metal_atoms, metal_idx, metal_sym):
         """
-        Minimization and E calculation with RDKit after embeding
+        Minimization and E calculation with RDKit after embeding. Returns the
+        indexes of the conformers that pass the filters of the geom option
         """
 
         cenergy, outmols = [], []
 
+        # the atoms of the geometry rule are resolved only once, if the topology can't
+        # pass the rule (i.e. missing atoms) the minimizations are skipped
+        geom_rule = None
+        if geom != []:
+            geom_rule = get_geom_rule(self,geom)
+            if geom_rule.valid:
+                mol_geom = Chem.Mol(mol)
+                # setting the metal back instead of I
+                if len(metal_atoms) >= 1:
+                    set_metal_atomic_number(mol_geom, metal_idx, metal_sym)
+                if geom_rule.get_atoms(mol_geom) is None:
+                    return outmols, cenergy, []
+            else:
+                geom_rule = None
+
         for _, conf in enumerate(cids):
             if coord_Map is None and alg_Map is None and mol_template is None:
                 energy = minimize_rdkit_energy(
@@ -1142,19 +1168,21 @@ class csearch:
                     self.args.opt_steps_rdkit,
                 )
 
-            # removes geometries that do not pass the filters (geom option)
+            cenergy.append(energy)
+            pmol = PropertyMol.PropertyMol(mol)
+            outmols.append(pmol)
+
+        # removes geometries that do not pass the filters (geom option), all the
+        # conformers are evaluated at once
+        passing_cids = list(range(len(outmols)))
+        if geom_rule is not None:
             mol_geom = Chem.Mol(mol)
-            # setting the metal back instead of I
             if len(metal_atoms) >= 1:
                 set_metal_atomic_number(mol_geom, metal_idx, metal_sym)
+            passing_geom = geom_rule.evaluate(mol_geom, list(cids))
+            passing_cids = [i for i, passing in enumerate(passing_geom) if passing]
 
-            passing_geom = geom_filter(self,mol_geom,geom)
-            if passing_geom:
-                cenergy.append(energy)
-                pmol = PropertyMol.PropertyMol(mol)
-                outmols.append(pmol)
-
-        return outmols, cenergy
+        return outmols, cenergy, passing_cids
 
     def min_after_embed(
         self,
@@ -1184,9 +1212,12 @@ class csearch:
         # gets optimized mol objects and energies
         if geom != []:
             self.args.log.write(f"o  Applying geometry filters ({geom}) ({os.path.basename(Path(name))})")
-        outmols, cenergy = self.min_and_E_calc(
+        outmols, cenergy, passing_cids = self.min_and_E_calc(
             mol, cids, coord_Map, alg_Map, mol_template, ff, geom, metal_atoms, metal_idx, metal_sym
         )
+        if len(passing_cids) == 0:
+            self.args.log.write(f"\nx  No conformers passed the geometry filters ({os.path.basename(Path(name))})")
+            return -1, None
 
         for i, cid in enumerate(cids):
             outmols[cid].SetProp("_Name", name + " " + str(i + 1))
@@ -1196,8 +1227,7 @@ class csearch:
             outmols[cid].SetProp("SMILES", str(smi))
 
         # sorts the energies
-        cids = list(range(len(outmols)))
-        sorted_all_cids = sorted(cids, key=lambda cid: cenergy[cid])
+        sorted_all_cids = sorted(passing_cids, key=lambda cid: cenergy[cid])
 
         self.args.log.write(f"\no  Applying filters to initial conformers ({os.path.basename(Path(name))})")
         selectedcids_rdkit = conformer_filters(self,sorted_all_cids,cenergy,outmols)
@@ -15,7 +15,7 @@ import subprocess
 import rdkit
 from pathlib import Path
 import shutil
-from aqme.utils import read_file, run_command, mol_from_sdf_or_mol_or_mol2,set_destination,load_sdf
+from aqme.utils import run_command, mol_from_sdf_or_mol_or_mol2,set_destination,load_sdf
 from aqme.filter import geom_filter,cluster_conformers
 from rdkit.Chem import rdMolTransforms
 
@@ -79,11 +79,14 @@ def xtb_opt_main(
     complex_ts=False,
     mol=None,
     name_init=None,
+    opt_cycles=None,
 
 ):
 
     """
-    Run xTB using subprocess to perform CREST/CREGEN conformer sampling
+    Run xTB using subprocess to perform CREST/CREGEN conformer sampling. If opt_cycles
+    is used, the xTB optimization stops after that number of cycles (used in the
+    checkpoints of CMIN) and the last geometry is returned
     """
 
     name_no_path = os.path.basename(Path(name)).split(".xyz")[0]
@@ -235,6 +238,8 @@ def xtb_opt_main(
                 "-P",
                 str(self.args.nprocs), 
             ]
+            if opt_cycles is not None:
+                command += ["--cycles", str(opt_cycles)]
 
             if self.args.xtb_keywords is not None:
                 for keyword in self.args.xtb_keywords.split():
@@ -244,7 +249,11 @@ def xtb_opt_main(
             xtb_out1 = f'{os.path.dirname(Path(xyzin))}/{os.path.basename(Path(xyzin)).split(".xyz")[0]}'
             run_command(command, f"{xtb_out1}_xtb1.out")
 
-            os.rename(str(dat_dir) + "/xtbopt.xyz", xyzoutxtb1)
+            # optimizations stopped at a checkpoint only write the last geometry
+            if opt_cycles is not None and not os.path.exists(str(dat_dir) + "/xtbopt.xyz"):
+                os.rename(str(dat_dir) + "/xtblast.xyz", xyzoutxtb1)
+            else:
+                os.rename(str(dat_dir) + "/xtbopt.xyz", xyzoutxtb1)
         except FileNotFoundError:
             self.args.log.write(f"\nx  There was an error during the xTB pre-optimization. This error might be related to parallelization of xTB jobs and is normally observed when using metal complexes in some operative systems/OpenMP versions. AQME is switching to using one processor (nprocs=1).\n")
             self.args.nprocs = 1
@@ -560,8 +569,8 @@ def create_xcontrol(
 
         # metadyn part
         if name_constraint == ".xcontrol.sample":
-            outlines = read_file(os.getcwd(), os.getcwd(), xyzin)
-            n_atoms = int(outlines[0])
+            with open(xyzin, "r") as xyzfile:
+                n_atoms = int(xyzfile.readline())
             edited_xcontrol += "$metadyn\n"
             edited_xcontrol += "atoms: "
             if n_atoms == 1: # just to avoid bugs when parsing single atoms
@@ -12,6 +12,7 @@ from rdkit.Chem import rdMolTransforms, rdMolAlign
 
 from aqme.utils import set_metal_atomic_number, get_conf_RMS, load_sdf
 from aqme.csearch.utils import minimize_rdkit_energy
+from aqme.filter import get_shape_signature, shape_rmsd_bound
 
 
 def realign_mol(
@@ -120,13 +121,15 @@ def generating_conformations_fullmonte(
         sys.exit()
 
     # array for each each unique from rdkit
-    unique_mol, c_energy, unique_mol_sample = [], [], []
+    unique_mol, c_energy, c_signature, unique_mol_sample = [], [], [], []
+    rms_calcs, rms_skipped = 0, 0
 
     # STEP 1: Use start conformation for and append to unique list
     nsteps = 1
     for mol_fm in fmmols:
         unique_mol.append(mol_fm)
         c_energy.append(float(mol_fm.GetProp("Energy")))
+        c_signature.append(get_shape_signature(mol_fm, -1, args.heavyonly))
 
     # defining unique mol sample for choosing
     globmin = min(c_energy)
@@ -167,12 +170,18 @@ def generating_conformations_fullmonte(
         # STEP 6 : Check for DUPLICATES - energy and rms filter (reuse)
         #  if the conformer is unique then save it the list
         exclude_conf = False
+        rot_signature = get_shape_signature(rot_mol, -1, args.heavyonly)
         # compare against allprevious conformers located
         for j, seenmol in enumerate(unique_mol):
             if abs(energy - c_energy[j]) < args.initial_energy_threshold:
                 exclude_conf = True
                 break
             if abs(energy - c_energy[j]) < args.energy_threshold:
+                # skip the RMSD when the shape signatures prove that the conformers are different
+                rms_calcs += 1
+                if shape_rmsd_bound(rot_signature, c_signature[j]) > args.rms_threshold:
+                    rms_skipped += 1
+                    continue
                 rms = get_conf_RMS(
                     rot_mol, seenmol, -1, -1, args.heavyonly, args.max_matches_rmsd
                 )
@@ -182,6 +191,7 @@ def generating_conformations_fullmonte(
         if not exclude_conf:
             unique_mol.append(rot_mol)
             c_energy.append(energy)
+            c_signature.append(rot_signature)
             unique_mol[c_energy.index(energy)].SetProp("Energy", str(energy))
 
         unique_mol_sample = []
@@ -192,11 +202,15 @@ def generating_conformations_fullmonte(
             if abs(globmin - ene) > args.ewin_fullmonte:
                 unique_mol.pop(indx)
                 c_energy.pop(indx)
+                c_signature.pop(indx)
             if abs(globmin - ene) < args.ewin_sample_fullmonte:
                 unique_mol_sample.append(unique_mol[indx])
 
         nsteps += 1
 
+    if rms_calcs > 0:
+        args.log.write(f"\no  The geometric prefilter avoided {rms_skipped} of {rms_calcs} RMSD calculations in FULLMONTE")
+
     cids = list(range(len(unique_mol)))
     sorted_all_cids = sorted(cids, key=lambda cid: c_energy[cid])
 
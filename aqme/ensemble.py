@@ -0,0 +1,215 @@
+######################################################.
+#        This file stores functions related to       #
+#          the binary conformer ensemble store       #
+######################################################.
+
+# Layout of the ENS files:
+#  1. Magic string and size of the header (little-endian uint64)
+#  2. JSON header with the numbers of conformers and atoms, the offsets of the
+#     sections and the table of conformer properties (Energy, Real charge, etc.)
+#  3. Topology of the molecule (RDKit binary mol without conformers), stored once
+#  4. Coordinates of all the conformers as a float64 array with shape
+#     (conformers, atoms, 3), which is memory-mapped when the file is loaded
+
+import os
+import json
+import struct
+import numpy as np
+from rdkit import Chem
+from rdkit.Geometry import Point3D
+
+
+ens_extension = ".ens"
+ens_magic = b"AQMEENS1"
+# alignment (in bytes) of the coordinate array inside the file
+ens_alignment = 64
+
+
+class EnsembleStore:
+    """
+    Conformer ensemble loaded from an ENS file. The coordinates are memory-mapped
+    and the mol objects are only created when they are requested.
+
+    Parameters
+    ----------
+    ens_file : str
+        ENS file to load
+    """
+
+    def __init__(self, ens_file):
+        self.ens_file = ens_file
+        with open(ens_file, "rb") as F:
+            if F.read(len(ens_magic)) != ens_magic:
+                raise ValueError(f"{ens_file} is not a valid AQME ensemble file")
+            header_size = struct.unpack("<Q", F.read(8))[0]
+            header = json.loads(F.read(header_size).decode("utf-8"))
+            F.seek(header["topology_offset"])
+            topology = F.read(header["topology_size"])
+
+        self.topology = Chem.Mol(topology)
+        self.n_confs = header["n_confs"]
+        self.n_atoms = header["n_atoms"]
+        self.props = header["props"]
+        if self.n_confs > 0 and self.n_atoms > 0:
+            self.coords = np.memmap(
+                ens_file,
+                dtype="<f8",
+                mode="r",
+                offset=header["coords_offset"],
+                shape=(self.n_confs, self.n_atoms, 3),
+            )
+        else:
+            self.coords = np.zeros((self.n_confs, self.n_atoms, 3))
+
+    def __len__(self):
+        return self.n_confs
+
+    def get_prop(self, prop):
+        """
+        Returns the values of a conformer property (None for conformers without it)
+        """
+
+        return self.props.get(prop, [None] * self.n_confs)
+
+    @property
+    def energies(self):
+        return self.get_prop("Energy")
+
+    def get_mol(self, idx):
+        """
+        Creates the mol object of one conformer from the topology, coordinates and properties
+        """
+
+        mol = Chem.Mol(self.topology)
+        conf = Chem.Conformer(self.n_atoms)
+        for i, xyz in enumerate(self.coords[idx].tolist()):
+            conf.SetAtomPosition(i, Point3D(*xyz))
+        conf.Set3D(True)
+        mol.AddConformer(conf, assignId=True)
+        for prop, values in self.props.items():
+            if values[idx] is not None:
+                mol.SetProp(prop, values[idx])
+
+        return mol
+
+    def get_mols(self, idx_list=None):
+        if idx_list is None:
+            idx_list = range(self.n_confs)
+
+        return [self.get_mol(idx) for idx in idx_list]
+
+    def to_sdf(self, sdf_file):
+        """
+        Writes the ensemble as an SDF file (only generated on demand)
+        """
+
+        sdwriter = Chem.SDWriter(sdf_file)
+        for idx in range(self.n_confs):
+            sdwriter.write(self.get_mol(idx))
+        sdwriter.close()
+
+
+class EnsembleWriter:
+    """
+    Writer with the same write()/close() API as Chem.SDWriter. The mols are kept
+    until close() is called and then stored in a single ENS file.
+
+    Parameters
+    ----------
+    ens_file : str
+        ENS file to create
+    """
+
+    def __init__(self, ens_file):
+        self.ens_file = str(ens_file)
+        self.mols = []
+
+    def write(self, mol):
+        self.mols.append(mol)
+
+    def close(self):
+        if len(self.mols) > 0:
+            write_ensemble(self.mols, self.ens_file)
+        self.mols = []
+
+
+def write_ensemble(mols, ens_file):
+    """
+    Stores a list of conformers (mol objects of the same molecule) in an ENS file.
+    The properties of the mols are saved as strings, as in SDF files.
+    """
+
+    topology = Chem.Mol(mols[0])
+    topology.RemoveAllConformers()
+    for prop in topology.GetPropNames(includePrivate=True):
+        topology.ClearProp(prop)
+    n_atoms = topology.GetNumAtoms()
+
+    coords = np.zeros((len(mols), n_atoms, 3), dtype="<f8")
+    props = {}
+    for i, mol in enumerate(mols):
+        if mol.GetNumAtoms() != n_atoms:
+            raise ValueError(f"All the conformers stored in {ens_file} must contain the same atoms")
+        coords[i] = mol.GetConformer().GetPositions()
+        for prop in mol.GetPropNames(includePrivate=True):
+            if prop.startswith("_") and prop != "_Name":
+                continue
+            if prop not in props:
+                props[prop] = [None] * len(mols)
+            props[prop][i] = mol.GetProp(prop)
+
+    topology_bin = topology.ToBinary()
+    header = {
+        "n_confs": len(mols),
+        "n_atoms": n_atoms,
+        "topology_offset": 0,
+        "topology_size": len(topology_bin),
+        "coords_offset": 0,
+        "props": props,
+    }
+    # the offsets are written inside the header, so the header size is fixed first
+    header_bin = json.dumps(header).encode("utf-8")
+    header_size = len(header_bin) + 64
+    header["topology_offset"] = len(ens_magic) + 8 + header_size
+    coords_offset = header["topology_offset"] + len(topology_bin)
+    header["coords_offset"] = coords_offset + (-coords_offset % ens_alignment)
+    header_bin = json.dumps(header).encode("utf-8").ljust(header_size)
+
+    # the file is written with a temporary name to avoid leaving incomplete files
+    temp_file = f"{ens_file}.tmp"
+    with open(temp_file, "wb") as F:
+        F.write(ens_magic)
+        F.write(struct.pack("<Q", header_size))
+        F.write(header_bin)
+        F.write(topology_bin)
+        F.write(b"\0" * (header["coords_offset"] - coords_offset))
+        F.write(coords.tobytes())
+    os.replace(temp_file, ens_file)
+
+
+def ensemble_to_sdf(ens_file, sdf_file=None):
+    """
+    Generates the SDF file of an ENS file (by default, with the same name). Returns the name of the SDF file.
+    """
+
+    if sdf_file is None:
+        sdf_file = f"{os.path.splitext(ens_file)[0]}.sdf"
+    EnsembleStore(ens_file).to_sdf(sdf_file)
+
+    return sdf_file
+
+
+def sdf_to_ensemble(sdf_file, ens_file=None):
+    """
+    Stores the conformers of an SDF file in an ENS file (by default, with the same name).
+    Returns the name of the ENS file (None if the SDF has no valid mols).
+    """
+
+    if ens_file is None:
+        ens_file = f"{os.path.splitext(sdf_file)[0]}{ens_extension}"
+    mols = [mol for mol in Chem.SDMolSupplier(sdf_file, removeHs=False, sanitize=False) if mol is not None]
+    if len(mols) == 0:
+        return None
+    write_ensemble(mols, ens_file)
+
+    return ens_file
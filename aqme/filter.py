@@ -5,12 +5,17 @@
 
 import os
 import shutil
+import numpy as np
 from pathlib import Path
 from rdkit import Chem
 from rdkit.Chem import rdMolTransforms, Descriptors
 from rdkit.ML.Cluster import Butina
 
-from aqme.utils import periodic_table, get_conf_RMS
+from aqme.utils import periodic_table, get_conf_RMS, GAS_CONSTANT
+
+
+# SMARTS of the potential Ir neighbours used in the Ir_squareplanar rule (compiled only once)
+IR_SP_SMARTS = [Chem.MolFromSmarts(smarts) for smarts in ['[Ir][C-]','[Ir][N+]','[Ir][n+]','[Ir][N]','[Ir][n]','[Ir][P+]','[Ir][p+]','[Ir][As+]']]
 
 
 # Main API of the geometry filter
@@ -31,25 +36,151 @@ def geom_filter(self,mol,geom):
         If True, it means that it is in accordance with the rules
     """
 
-    # detects if the geometry rule is for atoms, bonds, angles or dihedrals
-
     passing = True
     if geom != []:
-        passing = False
+        geom_rule = get_geom_rule(self,geom)
+        if geom_rule.valid:
+            # the first conformer is the only 3D conformer generated in that mol object
+            conf_id = mol.GetConformers()[0].GetId()
+            passing = bool(geom_rule.evaluate(mol,[conf_id])[0])
+
+    return passing
+
+
+def get_geom_rule(self,geom):
+    """
+    Returns the compiled GeomRule of the geom option (it is only compiled once per run).
+    """
+
+    if not hasattr(self,'geom_rules'):
+        self.geom_rules = {}
+    if str(geom) not in self.geom_rules:
+        self.geom_rules[str(geom)] = GeomRule(geom,self.args)
+
+    return self.geom_rules[str(geom)]
+
+
+class GeomRule:
+    """
+    Geometry rule of the geom option compiled only once. The atoms involved are
+    resolved once per topology and the bonds, angles or dihedrals are measured for
+    all the conformers at once from their coordinate arrays.
+
+    Parameters
+    ----------
+    geom : list
+            Geometry rule, [SMARTS,VALUE] or a special rule (i.e. ['Ir_squareplanar']).
+    args : argparse.args
+            AQME arguments used (thresholds of bonds, angles and dihedrals, and log).
+    """
+
+    def __init__(self, geom, args):
+
+        self.args = args
+        self.valid = True
+        self.matches = {}
+        self.pattern = None
+        self.thres = {2: args.bond_thres, 3: args.angle_thres, 4: args.dihedral_thres}
+
         if geom == ['Ir_squareplanar']:
-            new_geom = Ir_SP_filter(mol)
-            if len(new_geom) == 0:
-                self.args.log.write(f"x  This molecule is not one of the supported Ir squareplanar complexes! It was discarded by the geom filter")
-                passing = False
-            passing = matching_fun(self,mol,'Ir_squareplanar',new_geom,passing)
+            self.type_match = 'Ir_squareplanar'
+            self.geom_val = 180
+            self.atom_rule = False
+
+        elif len(geom) != 2:
+            args.log.write(f"x  The geom option {geom} was not correctly defined, the geometric filter will be turned off! Correct format: [SMARTS,THRESHOLD], for example [CCCO,180] for a 180 degree dihedral")
+            self.valid = False
 
         else:
-            if len(geom) != 2:
-                self.args.log.write(f"x  The geom option {geom} was not correctly defined, the geometric filter will be turned off! Correct format: [SMARTS,THRESHOLD], for example [CCCO,180] for a 180 degree dihedral")
-                return passing
-            passing = matching_fun(self,mol,'regular_rule',geom,passing)
-    
-    return passing
+            self.type_match = 'regular_rule'
+            smarts = geom[0]
+            self.geom_val = float(geom[1])
+            smarts_content = ''.join(smarts.replace('[',']').split(']')) # this way both 'ATOM' and '[ATOM]' work
+            self.atom_rule = smarts_content in periodic_table()
+            self.pattern = Chem.MolFromSmarts(smarts)
+            if self.pattern is None:
+                self.pattern = Chem.MolFromSmarts(f'[{smarts}]')
+
+    def get_atoms(self, mol):
+        """
+        Resolves the atoms measured in the rule (cached per topology). Returns None
+        if the topology can't pass the rule, [] if the rule only requires the atoms
+        and a list with the indexes of a bond, angle or dihedral otherwise.
+        """
+
+        topology = (
+            tuple((atom.GetAtomicNum(), atom.GetFormalCharge(), atom.GetIsAromatic()) for atom in mol.GetAtoms()),
+            tuple((bond.GetBeginAtomIdx(), bond.GetEndAtomIdx(), str(bond.GetBondType())) for bond in mol.GetBonds())
+        )
+        if topology not in self.matches:
+            atoms = None
+            if self.type_match == 'regular_rule':
+                matches = []
+                if self.pattern is not None:
+                    matches = mol.GetSubstructMatches(self.pattern)
+                if self.atom_rule:
+                    if len(matches) >= 1:
+                        atoms = []
+                elif len(matches) > 0 and len(matches[0]) in [2,3,4]:
+                    atoms = list(matches[0])
+
+            elif self.type_match == 'Ir_squareplanar':
+                new_geom = Ir_SP_filter(mol)
+                if len(new_geom) == 0:
+                    self.args.log.write(f"x  This molecule is not one of the supported Ir squareplanar complexes! It was discarded by the geom filter")
+                else:
+                    atoms = new_geom[:3]
+            self.matches[topology] = atoms
+
+        return self.matches[topology]
+
+    def evaluate(self, mol, conf_ids=None):
+        """
+        Returns an array of booleans with the conformers (conf_ids, all by default)
+        that pass the rule.
+        """
+
+        if conf_ids is None:
+            conf_ids = [conf.GetId() for conf in mol.GetConformers()]
+        atoms = self.get_atoms(mol)
+        if atoms is None:
+            return np.zeros(len(conf_ids), dtype=bool)
+        if len(atoms) == 0:
+            return np.ones(len(conf_ids), dtype=bool)
+
+        # coordinates of the atoms involved for all the conformers, shape (n_confs, n_atoms, 3)
+        coords = np.array([mol.GetConformer(conf_id).GetPositions()[atoms] for conf_id in conf_ids])
+        mol_val = geom_values(coords)
+        thres = self.thres[len(atoms)]
+
+        return ((self.geom_val - thres) <= mol_val) & (mol_val <= (self.geom_val + thres))
+
+
+def geom_values(coords):
+    """
+    Measures bonds (2 atoms, in A), angles (3 atoms, in degrees) or dihedrals (4 atoms,
+    in degrees with the same sign convention as rdMolTransforms) for an array of
+    coordinates with shape (n_confs, n_atoms, 3).
+    """
+
+    if coords.shape[1] == 2:
+        return np.linalg.norm(coords[:,1] - coords[:,0], axis=1)
+
+    if coords.shape[1] == 3:
+        v_1 = coords[:,0] - coords[:,1]
+        v_2 = coords[:,2] - coords[:,1]
+        cos_angle = np.sum(v_1 * v_2, axis=1) / (np.linalg.norm(v_1, axis=1) * np.linalg.norm(v_2, axis=1))
+        return np.degrees(np.arccos(np.clip(cos_angle, -1.0, 1.0)))
+
+    r_ij = coords[:,1] - coords[:,0]
+    r_jk = coords[:,2] - coords[:,1]
+    r_lk = coords[:,3] - coords[:,2]
+    n_ijk = np.cross(r_ij, r_jk)
+    n_jkl = np.cross(r_jk, r_lk)
+    m = np.cross(n_ijk, r_jk)
+    x_val = np.sum(n_ijk * n_jkl, axis=1) / (np.linalg.norm(n_ijk, axis=1) * np.linalg.norm(n_jkl, axis=1))
+    y_val = np.sum(m * n_jkl, axis=1) / (np.linalg.norm(m, axis=1) * np.linalg.norm(n_jkl, axis=1))
+    return -np.degrees(np.arctan2(y_val, x_val))
 
 
 def Ir_SP_filter(mol):
@@ -59,11 +190,10 @@ def Ir_SP_filter(mol):
     '''
 
     # get Ir and its potential neighbours
-    smarts_list = ['[Ir][C-]','[Ir][N+]','[Ir][n+]','[Ir][N]','[Ir][n]','[Ir][P+]','[Ir][p+]','[Ir][As+]']
     Ir_neighs = []
     L_atom_1, L_atom_2, Ir_idx = None, None, None
-    for smarts in smarts_list:
-        pairs = list(mol.GetSubstructMatches(Chem.MolFromSmarts(smarts)))
+    for smarts_mol in IR_SP_SMARTS:
+        pairs = list(mol.GetSubstructMatches(smarts_mol))
         if len(pairs) > 0:
             for pair in pairs:
                 if pair not in Ir_neighs:
@@ -111,47 +241,6 @@ def Ir_SP_filter(mol):
 
     return new_geom
 
-def matching_fun(self,mol,type_match,geom,passing):
-    '''
-    Checks matches and analyzed if they pass the geometry rules
-    '''
-
-    # SMARTS match to detect the atoms and calculate the geometric value. Then, check if the value
-    # is within the threshold
-
-    if type_match == 'regular_rule':
-        matches = []
-        smarts = geom[0]
-        geom_val = geom[1]
-        smarts_content = ''.join(smarts.replace('[',']').split(']')) # this way both 'ATOM' and '[ATOM]' work
-        try:
-            matches = mol.GetSubstructMatches(Chem.MolFromSmarts(smarts))
-        except: # I tried to make this except more specific for Boost.Python.ArgumentError, but apparently it's not as simple as it looks
-            matches = mol.GetSubstructMatches(Chem.MolFromSmarts(f'[{smarts}]'))
-        if len(matches) > 0:
-            matches = list(matches[0])
-        
-    elif type_match == 'Ir_squareplanar':
-        matches = geom[:3]
-        geom_val = geom[3]
-        smarts_content = 'Ir_squareplanar'
-
-    mol_conf = mol.GetConformer(0) # Retrieve the only 3D conformer generated in that mol object for rdMolTransforms
-    if smarts_content in periodic_table():
-        if len(matches) >= 1:
-            passing = True
-    elif len(matches) == 2:
-        mol_val = rdMolTransforms.GetBondLength(mol_conf, matches[0], matches[1])
-        passing = (geom_val - self.args.bond_thres) <= mol_val <= (geom_val + self.args.bond_thres)
-    elif len(matches) == 3:
-        mol_val = rdMolTransforms.GetAngleDeg(mol_conf, matches[0], matches[1], matches[2])
-        passing = (geom_val - self.args.angle_thres) <= mol_val <= (geom_val + self.args.angle_thres)
-    elif len(matches) == 4:
-        mol_val = rdMolTransforms.GetDihedralDeg(mol_conf, matches[0], matches[1], matches[2], matches[3])
-        passing = (geom_val - self.args.dihedral_thres) <= mol_val <= (geom_val + self.args.dihedral_thres)
-
-    return passing
-
 
 def filters(mol, log, molwt_cutoff):
     """
@@ -291,13 +380,63 @@ def pre_E_filter(
     return selectedcids_initial
 
 
+def get_shape_signature(mol, conf_id, heavyonly):
+    """
+    Returns the square roots of the principal moments of the gyration tensor
+    (sorted, their norm is the radius of gyration) of a conformer. The atoms
+    used are the same as in get_conf_RMS().
+
+    Parameters
+    ----------
+    mol : rdkit.Chem.Mol
+            Mol object containing the conformer.
+    conf_id : int
+            Conformer ID (-1 for the default conformer).
+    heavyonly : bool
+            If True, hydrogens are removed as in the RMSD calculations.
+
+    Returns
+    -------
+    np.array or None
+            Signature of the conformer (None if it could not be calculated)
+    """
+
+    try:
+        if heavyonly:
+            mol = Chem.RemoveHs(mol)
+        coords = mol.GetConformer(conf_id).GetPositions()
+    except (RuntimeError, ValueError):
+        return None
+    coords = coords - coords.mean(axis=0)
+    # the singular values of the centered coordinates are invariant to rotations and atom permutations
+    singular_values = np.linalg.svd(coords, compute_uv=False)
+
+    return np.sort(singular_values)[::-1] / np.sqrt(len(coords))
+
+
+def shape_rmsd_bound(signature_1, signature_2):
+    """
+    Lower bound of the best RMSD between two conformers from their shape signatures
+    (Mirsky's inequality for the singular values of the centered coordinates). Since
+    alignments and symmetry permutations can't go below this value, a bound higher
+    than rms_threshold proves that the conformers are different. Returns 0 if the
+    conformers can't be compared.
+    """
+
+    if signature_1 is None or signature_2 is None or len(signature_1) != len(signature_2):
+        return 0
+    return float(np.sqrt(np.sum((signature_1 - signature_2) ** 2)))
+
+
 def RMSD_and_E_filter(
     outmols, selectedcids_initial, cenergy, args, calc_type
 ):
     """
     This filter selects the first compound that it finds with energy an energy
     difference lower than the threshold with a higher than the threshold rms
-    with respect to the nearest (in energy) accepted compound.
+    with respect to the nearest (in energy) accepted compound. The RMSD is only
+    calculated when the shape signatures of the two conformers can't prove that
+    their RMSD exceeds rms_threshold.
     """
 
     selectedcids = []
@@ -307,6 +446,15 @@ def RMSD_and_E_filter(
     rms_threshold = float(args.rms_threshold)
     max_matches_rmsd = int(args.max_matches_rmsd)
 
+    # shape signatures are calculated only once per conformer
+    signatures = {}
+    for conf in selectedcids_initial:
+        conf_id = -1
+        if calc_type == "rdkit":
+            conf_id = conf
+        signatures[conf] = get_shape_signature(outmols[conf], conf_id, args.heavyonly)
+    rms_calcs, rms_skipped = 0, 0
+
     for _,conf in enumerate(selectedcids_initial[1:]):
         # This keeps track of whether or not your conformer is unique
         excluded_conf = False
@@ -315,6 +463,10 @@ def RMSD_and_E_filter(
         for seenconf in selectedcids:
             E_diff = abs(cenergy[conf] - cenergy[seenconf])  # in kcal/mol
             if E_diff < energy_threshold:
+                rms_calcs += 1
+                if shape_rmsd_bound(signatures[seenconf], signatures[conf]) > rms_threshold:
+                    rms_skipped += 1
+                    continue
                 n_mol_1 = -1
                 n_mol_2 = -1
                 if calc_type == "rdkit":
@@ -341,9 +493,208 @@ def RMSD_and_E_filter(
             if conf not in selectedcids:
                 selectedcids.append(conf)
 
+    if rms_calcs > 0:
+        args.log.write(f"\no  The geometric prefilter avoided {rms_skipped} of {rms_calcs} RMSD calculations")
+
     return selectedcids
 
 
+def checkpoint_filter(self, mols, cenergy, alive, active):
+    """
+    Finds the conformers that can stop optimizing at a CMIN checkpoint since
+    they converged onto another conformer that is still in the pool. The
+    conformers are compared by energy and RMSD (from lowest to highest E) and
+    only the conformers that are still being optimized (active) are discarded.
+
+    Parameters
+    ----------
+    mols : list
+            Mol objects with the current geometries of the conformers.
+    cenergy : list
+            Current energies of the conformers (kcal/mol).
+    alive : list
+            Indexes of the conformers still in the pool (active and finished).
+    active : list
+            Indexes of the conformers that are still being optimized.
+
+    Returns
+    -------
+    list
+            list of active conformer Ids that are duplicates
+    """
+
+    duplicates, seen_cids = [], []
+    energy_threshold = float(self.args.energy_threshold)
+    rms_threshold = float(self.args.rms_threshold)
+    max_matches_rmsd = int(self.args.max_matches_rmsd)
+
+    signatures = {}
+    for conf in alive:
+        signatures[conf] = get_shape_signature(mols[conf], -1, self.args.heavyonly)
+
+    for conf in sorted(alive, key=lambda cid: cenergy[cid]):
+        excluded_conf = False
+        if conf in active:
+            for seenconf in seen_cids:
+                if abs(cenergy[conf] - cenergy[seenconf]) < energy_threshold:
+                    if shape_rmsd_bound(signatures[seenconf], signatures[conf]) > rms_threshold:
+                        continue
+                    try:
+                        rms = get_conf_RMS(
+                            mols[seenconf],
+                            mols[conf],
+                            -1,
+                            -1,
+                            self.args.heavyonly,
+                            max_matches_rmsd
+                        )
+                    except RuntimeError:
+                        rms = rms_threshold + 1
+                    if rms < rms_threshold:
+                        excluded_conf = True
+                        break
+        if excluded_conf:
+            duplicates.append(conf)
+        else:
+            seen_cids.append(conf)
+
+    return duplicates
+
+
+def qprep_dup_filter(mols, args, seen_mols=None):
+    """
+    Finds the unique conformers of an SDF file before writing their QM inputs. Two
+    conformers are duplicates when their energy difference is lower than energy_threshold
+    and their RMSD is lower than rms_threshold. The conformers from previous files of
+    the same molecule (seen_mols, i.e. from other CMIN or CREST runs) are only compared
+    by RMSD since their energies might come from different methods.
+
+    Parameters
+    ----------
+    mols : list
+            Mol objects of the conformers (in the order used to write the inputs).
+    args : argument class
+            Options with energy_threshold, rms_threshold, heavyonly and max_matches_rmsd.
+    seen_mols : list, default=None
+            Mol objects of the unique conformers from previous files of the same molecule.
+
+    Returns
+    -------
+    list
+            Indexes of the unique conformers
+    """
+
+    if seen_mols is None:
+        seen_mols = []
+    energy_threshold = float(args.energy_threshold)
+    rms_threshold = float(args.rms_threshold)
+    max_matches_rmsd = int(args.max_matches_rmsd)
+
+    cenergy = []
+    for mol in mols:
+        try:
+            cenergy.append(float(mol.GetProp("Energy")))
+        except (KeyError, ValueError):
+            cenergy.append(None)
+    signatures = [get_shape_signature(mol, -1, args.heavyonly) for mol in mols]
+    seen_signatures = [get_shape_signature(mol, -1, args.heavyonly) for mol in seen_mols]
+
+    def is_dup(conf, ref_mol, ref_signature, ref_energy):
+        if ref_energy is not None and cenergy[conf] is not None:
+            if abs(cenergy[conf] - ref_energy) >= energy_threshold:
+                return False
+        if shape_rmsd_bound(ref_signature, signatures[conf]) > rms_threshold:
+            return False
+        try:
+            # copy of the probe, since the alignment would rotate the coordinates of the input
+            rms = get_conf_RMS(
+                Chem.Mol(mols[conf]), ref_mol, -1, -1, args.heavyonly, max_matches_rmsd
+            )
+        except RuntimeError:
+            return False
+        return rms < rms_threshold
+
+    selected_idx = []
+    for conf in range(len(mols)):
+        excluded_conf = False
+        for seen_mol, seen_signature in zip(seen_mols, seen_signatures):
+            if is_dup(conf, seen_mol, seen_signature, None):
+                excluded_conf = True
+                break
+        if not excluded_conf:
+            for seenconf in selected_idx:
+                if is_dup(conf, mols[seenconf], signatures[seenconf], cenergy[seenconf]):
+                    excluded_conf = True
+                    break
+        if not excluded_conf:
+            selected_idx.append(conf)
+
+    return selected_idx
+
+
+def boltz_pop_filter(mols, args):
+    """
+    Selects the smallest set of conformers that covers a target cumulative Boltzmann
+    population (boltz_pop) at boltz_temp, from the energies of the conformers (kcal/mol).
+    If boltz_cluster_rms is set, the conformers are also grouped with a Butina clustering
+    (RMSD threshold of boltz_cluster_rms) and the most stable conformer of each cluster is
+    added to the selection.
+
+    Parameters
+    ----------
+    mols : list
+            Mol objects of the conformers (in the order used to write the inputs).
+    args : argument class
+            Options with boltz_pop, boltz_temp, boltz_cluster_rms, heavyonly and max_matches_rmsd.
+
+    Returns
+    -------
+    list
+            Indexes of the selected conformers (in their original order), None if any of
+            the conformers doesn't have an energy
+    list
+            Boltzmann populations of the conformers
+    """
+
+    cenergy = []
+    for mol in mols:
+        try:
+            cenergy.append(float(mol.GetProp("Energy")))
+        except (KeyError, ValueError):
+            return None, None
+
+    # Boltzmann populations relative to the most stable conformer (energies in kcal/mol)
+    rel_energy = np.array(cenergy) - min(cenergy)
+    boltz_factors = np.exp(-rel_energy * 4184.0 / (GAS_CONSTANT * float(args.boltz_temp)))
+    pops = boltz_factors / np.sum(boltz_factors)
+
+    # conformers are added from the most to the least populated until the target is reached
+    selected_idx = []
+    cumulative_pop = 0.0
+    for conf in np.argsort(rel_energy, kind="stable"):
+        selected_idx.append(int(conf))
+        cumulative_pop += pops[conf]
+        # small tolerance to avoid adding conformers due to rounding errors
+        if cumulative_pop >= float(args.boltz_pop) - 1e-9:
+            break
+
+    if args.boltz_cluster_rms is not None and len(mols) > 1:
+        dists = []
+        for i in range(len(mols)):
+            for j in range(i):
+                dists.append(
+                    get_conf_RMS(
+                        Chem.Mol(mols[i]), mols[j], -1, -1, args.heavyonly, int(args.max_matches_rmsd)
+                    )
+                )
+        clusts = Butina.ClusterData(dists, len(mols), float(args.boltz_cluster_rms), isDistData=True)
+        for clust in clusts:
+            cluster_rep = min(clust, key=lambda conf: rel_energy[conf])
+            if cluster_rep not in selected_idx:
+                selected_idx.append(int(cluster_rep))
+
+    return sorted(selected_idx), [float(pop) for pop in pops]
+
 
 def cluster_conformers(self, mols, program, csearch_file, name):
     '''
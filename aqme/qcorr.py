@@ -5,9 +5,12 @@ Parameters
    files : list of str, default=''
       Filenames of QM output files to analyze. If *.log (or other strings that 
       are not lists such as *.out) are specified, the program will look for all 
-      the log files in the working directory through glob.glob(*.log)
+      the log files in the working directory through glob.glob(*.log). Output 
+      files compressed with gzip, xz or bzip2 are read directly (i.e. *.log.gz)
    w_dir_main : str, default=os.getcwd()
       Working directory
+   nprocs : int, default=8
+      Number of processes used to parse the QM output files with cclib
    fullcheck : bool, default=True
       Perform an analysis to detect whether the calculations were done 
       homogeneously (i.e. same level of theory, solvent, grid size, etc)
@@ -52,6 +55,61 @@ Parameters
       atoms in the isomerization filter
    nodup_check : bool, default=False
       If True, the duplicate filter is disabled
+   compress_json : bool, default=False
+      If True, the JSON files of the successful calculations are stored 
+      compressed with gzip (json_files/FILE.json.gz)
+   restart_inputs : bool, default=False
+      If True, the inputs created to fix the calculations reuse the data of the 
+      previous calculations when the files are in the same folder as the output 
+      files (with the same name). Gaussian: the FILE.chk checkpoint is used as 
+      %oldchk to read the initial guess and the force constants of the OPT 
+      (guess=read, and opt=readfc if the calculation completed at least one OPT 
+      step). ORCA: the orbitals of FILE.gbw are used as initial guess (MORead). 
+      The files are copied to the fixed_QM_inputs folder as FILE_restart.chk/.gbw. 
+      The data is not reused for SCF errors (the orbitals didn't converge), 
+      isomerizations and basis set errors
+   bundle : str, default=''
+      Store the JSON files of the successful calculations in a single archive per 
+      folder instead of individual files (json_files/QCORR_json.zip or .tar). 
+      Options: 'zip' and 'tar'. AQME modules read the JSON files directly from 
+      the archive (i.e. files='success/json_files/QCORR_json.zip' in QPREP)
+   split_outputs : bool, default=False
+      If True, the output files with several jobs (i.e. from the pack_inputs option 
+      of QPREP, with --Link1-- in Gaussian or $new_job in ORCA) are split into one 
+      output file per job before the analysis. The new files are named as the title 
+      of each job (FILE_job_N if the title can't be used) and the initial output files 
+      are moved to the packed_outputs folder. If the packed input (FILE.com or FILE.inp) 
+      is in the same folder, the jobs that never started (i.e. after an error termination 
+      in Gaussian) are reported and their inputs are written to the fixed_QM_inputs folder
+   json_profile : str, default='full'
+      Data stored in the JSON files of the successful calculations. Options: 
+      1. 'full': all the data parsed by cclib 
+      2. 'minimal': metadata, final geometry, energies, thermochemistry, 
+      rotational constants and frequencies (no SCF cycles, orbitals, geometry 
+      history or vibrational displacements) 
+      3. 'nmr': minimal profile plus the NMR tensors (for QDESCP) 
+   incremental : bool, default=False
+      If True, QCORR keeps a manifest of the analyzed output files 
+      (QCORR_manifest.csv, with name, size, modification time and SHA-256 hash) 
+      and only analyzes new or modified files. The stats of each analysis are 
+      appended to the QCORR-run_X-stats.csv file
+   watch : bool, default=False
+      If True, QCORR keeps checking the working directory and analyzes new 
+      output files (with the same extensions as the initial files) as they 
+      appear, in incremental mode. Files are only analyzed once they stop 
+      changing between two checks. Press Ctrl+C to stop
+   watch_interval : float, default=60
+      Time (in seconds) between two checks of the working directory in watch mode
+   stats_checkpoint : int, default=1000
+      Number of output files analyzed between two partial writes of the 
+      QCORR-run_X-stats.csv file (the file is always written at the end of 
+      the analysis). Set to 0 to write it only at the end
+   results_db : bool, default=False
+      If True, the data of the successful calculations (metadata, energies, 
+      thermochemistry, frequencies, coordinates and NMR tensors) is also stored 
+      in an SQLite database (QCORR_results.db) next to the success folder. 
+      The database can be queried and exported as JSON files with 
+      aqme.qcorr_utils.ResultsStore
       
 .. note::
 
@@ -70,29 +128,49 @@ import os
 import sys
 import glob
 import time
+import gzip
+import shutil
 import pandas as pd
-import json
-import subprocess
-import numpy as np
+from collections import deque
+from concurrent import futures
 from pathlib import Path
 from aqme.utils import (
     move_file,
-    QM_coords,
+    QM_file_coords,
     get_info_input,
     load_variables,
-    read_file,
     cclib_atoms_coords,
     check_files,
-    check_dependencies
+    check_dependencies,
+    get_file_format,
+    open_file
 )
+from aqme.bundle import BundleWriter
 from aqme.qcorr_utils import (
     detect_linear,
     check_isomerization,
     full_check,
-    get_json_data,
-    get_cclib_params
+    get_cclib_params,
+    DuplicateIndex,
+    parse_cclib_file,
+    classify_termination,
+    get_json_files,
+    ResultsStore,
+    OutputManifest,
+    get_file_signature,
+    quiet_cclib_worker,
+    json_profiles,
+    get_restart_file,
+    add_restart_keywords,
+    get_cost_data,
+    get_cost_report,
+    split_packed_output,
+    split_packed_input,
+    get_packed_input,
+    get_job_name
 )
-from aqme.qprep import qprep
+from aqme.qprep import InputWriter
+from aqme.argument_parser import set_options
 
 
 class qcorr:
@@ -114,6 +192,14 @@ class qcorr:
         if self.args.nprocs is None:
             self.args.nprocs = 8
 
+        # CSV with the initial connectivity used in the isomerization filter (if any)
+        self.isom_csv = None
+
+        # writer of the input files used to fix the calculations
+        self.input_writer = None
+        # checkpoint files reused in the inputs created to fix each calculation
+        self.restart_files = {}
+
         # check whether dependencies are installed
         _ = check_dependencies(self)
 
@@ -121,16 +207,149 @@ class qcorr:
         _ = check_files(self,'qcorr')
 
         # QCORR analysis
-        if os.path.basename(self.args.files[0]).split('.')[-1].lower() not in ['log','out','json']:
-            self.args.log.write(f"\nx  The format used ({os.path.basename(self.args.files[0]).split('.')[-1]}) is not compatible with QCORR! Formats accepted: log, out, json")
+        if get_file_format(self.args.files[0]).lower() not in ['log','out','json']:
+            self.args.log.write(f"\nx  The format used ({get_file_format(self.args.files[0])}) is not compatible with QCORR! Formats accepted: log, out, json")
             self.args.log.finalize()
             sys.exit()
 
-        self.qcorr_processing()
+        if self.args.json_profile not in ["full"] + list(json_profiles):
+            self.args.log.write(f"\nx  The JSON profile used ({self.args.json_profile}) is not valid! Options: full, {', '.join(json_profiles)}")
+            self.args.log.finalize()
+            sys.exit()
+
+        if self.args.bundle not in ["", "zip", "tar"]:
+            self.args.log.write(f"\nx  The bundle format used ({self.args.bundle}) is not valid! Options: zip, tar")
+            self.args.log.finalize()
+            sys.exit()
+
+        if self.args.watch:
+            self.watch_outputs()
+        else:
+            self.qcorr_processing()
+        self.args.log.finalize()
 
         # this is added to avoid path problems in jupyter notebooks
         os.chdir(self.args.initial_dir)
 
+    def watch_outputs(self):
+        """
+        Checks the working directory periodically and analyzes the new output files (with
+        the same extensions as the files initially specified) as they appear. Files are
+        only analyzed when they didn't change between two consecutive checks, so outputs
+        that are still being written are not moved. Press Ctrl+C to stop.
+        """
+
+        # extensions of the files to watch (i.e. .log or .log.gz)
+        file_suffixes = []
+        for file in self.args.files:
+            file_suffix = os.path.basename(file)[len(os.path.basename(file).split(".")[0]):]
+            if file_suffix not in file_suffixes:
+                file_suffixes.append(file_suffix)
+
+        self.args.log.write(f"\no  Watching {self.args.w_dir_main} for new output files every {self.args.watch_interval} seconds (press Ctrl+C to stop)")
+        previous_signatures, processed_signatures = {}, {}
+        try:
+            while True:
+                signatures = {}
+                for file_suffix in file_suffixes:
+                    for file in glob.glob(f"{self.args.w_dir_main}/*{file_suffix}"):
+                        try:
+                            signatures[file] = get_file_signature(file)
+                        except FileNotFoundError:
+                            continue
+                # only files that are not changing and were not processed before are analyzed
+                stable_files = [
+                    file for file, signature in signatures.items()
+                    if previous_signatures.get(file) == signature and processed_signatures.get(file) != signature
+                ]
+                previous_signatures = signatures
+                if len(stable_files) > 0:
+                    self.args.files = stable_files
+                    self.qcorr_processing()
+                    os.chdir(self.args.initial_dir)
+                    for file in stable_files:
+                        processed_signatures[file] = signatures[file]
+                time.sleep(float(self.args.watch_interval))
+
+        except KeyboardInterrupt:
+            self.args.log.write("\no  QCORR watch mode stopped")
+
+    def unpack_outputs(self, files):
+        """
+        Splits the output files with several jobs into one output per job. Returns the list of
+        files to analyze, where each packed output is replaced by the outputs of its jobs.
+        """
+
+        unpacked_files = []
+        self.not_started_jobs = []
+        for file in files:
+            # the jobs of the packed inputs are compared with the jobs found in the outputs
+            input_file = get_packed_input(file)
+            if input_file is None:
+                split_files = split_packed_output(file)
+            else:
+                split_files = split_packed_output(file, min_jobs=1)
+
+            if len(split_files) == 0:
+                unpacked_files.append(file)
+            else:
+                move_file(
+                    Path(file).parent.joinpath("packed_outputs"),
+                    Path(file).parent,
+                    os.path.basename(file),
+                )
+                self.args.log.write(f"o  {os.path.basename(file)} contains {len(split_files)} jobs, split into {', '.join(os.path.basename(split_file) for split_file in split_files)}")
+                unpacked_files.extend(split_files)
+
+            if input_file is not None:
+                self.write_not_started(input_file, split_files)
+                move_file(
+                    Path(file).parent.joinpath("packed_outputs"),
+                    Path(file).parent,
+                    os.path.basename(input_file),
+                )
+
+        return unpacked_files
+
+    def write_not_started(self, input_file, split_files):
+        """
+        Writes the inputs of the jobs of a packed input that are missing in its output. The
+        jobs run in order, so the jobs after the ones found in the output never started.
+        """
+
+        input_jobs = split_packed_input(input_file)
+        if len(split_files) >= len(input_jobs):
+            return
+
+        file_name = os.path.basename(Path(input_file)).split(".")[0]
+        used_names = {os.path.basename(split_file).split(".")[0] for split_file in split_files}
+        destination_fix = self.get_fix_destination()
+        destination_fix.mkdir(exist_ok=True, parents=True)
+        job_names = []
+        for n_job, (title, job_text) in enumerate(input_jobs[len(split_files):], start=len(split_files) + 1):
+            job_name = get_job_name(title, file_name, n_job, used_names)
+            used_names.add(job_name)
+            with open(destination_fix.joinpath(f"{job_name}{Path(input_file).suffix}"), "w") as F:
+                F.write(job_text)
+            job_names.append(job_name)
+
+        self.not_started_jobs.extend(job_names)
+        self.args.log.write(f"x  {len(job_names)} job(s) of {os.path.basename(input_file)} never started ({', '.join(job_names)}), their inputs were written to {destination_fix}")
+
+    def get_fix_destination(self):
+        """
+        Folder of the inputs created to fix the calculations
+        """
+
+        if self.args.resume_qcorr:
+            return Path(
+                f"{self.args.w_dir_main}/../../run_{self.args.round_num}/fixed_QM_inputs"
+            )
+
+        return Path(
+            f"{self.args.w_dir_main}/failed/run_{self.args.round_num}/fixed_QM_inputs"
+        )
+
     def qcorr_processing(self):
         """
         General function of the QCORR module that:
@@ -158,31 +377,73 @@ class qcorr:
             "not_specified": 0,
             "geom_qcorr": 0,
             "isomerized": 0,
+            "not_started": 0,
         }
 
-        duplicate_data = {
-            "File": [],
-            "Energies": [],
-            "Enthalpies": [],
-            "Gibbs": [],
-            "RO_constant": [],
-        }
+        # folder that contains the success folder
+        if self.args.resume_qcorr:
+            results_dir = self.args.w_dir_main.joinpath("../../../")
+        else:
+            results_dir = self.args.w_dir_main
+
+        # outputs with several packed jobs are split into one output per job
+        if self.args.split_outputs:
+            self.args.files = self.unpack_outputs(self.args.files)
+            file_terms["not_started"] = len(self.not_started_jobs)
+
+        # in incremental mode, only the outputs that were not analyzed before (or that changed) are analyzed
+        self.manifest = None
+        if self.args.incremental or self.args.watch:
+            self.manifest = OutputManifest(results_dir)
+            n_files = len(self.args.files)
+            self.args.files = self.manifest.select_new_files(self.args.files)
+            if n_files > len(self.args.files):
+                self.args.log.write(f"o  {n_files - len(self.args.files)} output file(s) skipped since they were already analyzed (see {OutputManifest.manifest_name})")
+            if len(self.args.files) == 0:
+                self.args.log.write("\nx  No new output files to analyze")
+                return
+
+        # bundles with the JSON files of each folder (only used with the bundle option)
+        json_bundles = {}
+
+        # index with the previous successful results, in case new calculations are duplicates
+        duplicate_data = None
+        if self.args.nodup_check == False:
+            duplicate_data = DuplicateIndex(results_dir.joinpath("success/json_files/"))
+
+        # database with the results of the successful calculations
+        results_store = None
+        if self.args.results_db:
+            results_store = ResultsStore(results_dir.joinpath(ResultsStore.db_name))
+
+        # in incremental mode, the stats of this analysis are appended to the stats of the previous ones
+        self.previous_stats = None
+        csv_stats = f"{self.args.initial_dir.as_posix()}/QCORR-run_{self.args.round_num}-stats.csv"
+        if self.manifest is not None and os.path.exists(csv_stats):
+            self.previous_stats = pd.read_csv(csv_stats)
+
+        # computational cost of the calculations, gathered from the data parsed in the analysis
+        self.cost_records = []
 
         self.args.log.write(f"o  Analyzing output files in {self.args.w_dir_main}\n")
         os.chdir(self.args.w_dir_main)
-        # analyze files
-        for file in sorted(self.args.files):
+        # analyze files (the outputs are parsed with cclib in parallel, while the analysis
+        # and the file moves below are done one file at a time)
+        for n_file, (file, parsed_output) in enumerate(self.parse_outputs(sorted(self.args.files))):
+            # the stats are kept in memory and only written at checkpoints and at the end
+            if self.args.stats_checkpoint > 0 and n_file > 0 and n_file % self.args.stats_checkpoint == 0:
+                self.write_qcorr_csv(file_terms)
+
             # get initial cclib data and termination/error types and discard calcs with no data
             file_name = os.path.basename(Path(file)).split(".")[0]
-            termination, errortype, cclib_data, outlines, file = self.cclib_init(
-                file, file_name
+            termination, errortype, cclib_data, file = self.cclib_init(
+                file, file_name, parsed_output
             )
             if errortype in ["no_data", "atomicbasiserror"]:
                 file_terms, _ = self.organize_outputs(
                     file, termination, errortype, file_terms
                 )
                 if errortype == "atomicbasiserror":
-                    os.remove(file_name + ".json")
                     self.args.log.write(f"{os.path.basename(file)}: Termination = {termination}, Error type = {errortype}")
                 continue
 
@@ -203,9 +464,11 @@ class qcorr:
 
             elif termination != "normal":
                 atom_types, cartesians, cclib_data = self.analyze_abnormal(
-                    errortype, cclib_data, outlines
+                    errortype, cclib_data, file
                 )
 
+            self.cost_records.append(get_cost_data(os.path.basename(file), cclib_data))
+
             # check for isomerization
             if self.args.isom_type is not None:
                 errortype = self.analyze_isom(file, cartesians, atom_types, errortype)
@@ -234,7 +497,7 @@ class qcorr:
                 "none",
                 "sp_calc",
             ]:
-                self.qcorr_fixing(cclib_data, file, atom_types, cartesians)
+                self.qcorr_fixing(cclib_data, file, atom_types, cartesians, errortype)
 
             # This part places the calculations and json files in different folders depending on the type of termination
             if errortype == "duplicate_calc":
@@ -246,14 +509,42 @@ class qcorr:
                 file, termination, errortype, file_terms
             )
 
+            # the cclib JSON files are only written for the calculations that finished successfully
             if errortype in ["none", "sp_calc"]:
                 destination_json = destination.joinpath("json_files/")
-                move_file(destination_json, self.args.w_dir_main, file_name + ".json")
-            else:
-                os.remove(file_name + ".json")
+                destination_json.mkdir(exist_ok=True, parents=True)
+                json_name = f"{file_name}.json"
+                if self.args.compress_json:
+                    json_name += ".gz"
+                if self.args.bundle != "":
+                    if destination_json not in json_bundles:
+                        json_bundles[destination_json] = BundleWriter(destination_json.joinpath(f"QCORR_json.{self.args.bundle}"))
+                    json_data = parsed_output[0].encode("utf-8")
+                    if self.args.compress_json:
+                        json_data = gzip.compress(json_data)
+                    json_bundles[destination_json].write(json_name, json_data)
+                else:
+                    with open_file(destination_json.joinpath(json_name), "w") as json_file:
+                        json_file.write(parsed_output[0])
+                if results_store is not None:
+                    results_store.add(
+                        file_name,
+                        cclib_data,
+                        folder=os.path.relpath(destination, results_dir),
+                        cclib_json=parsed_output[0],
+                    )
 
-            # write information about the QCORR analysis in a csv
-            csv_qcorr = self.write_qcorr_csv(file_terms)
+        for json_bundle in json_bundles.values():
+            json_bundle.close()
+
+        # write information about the QCORR analysis in a csv
+        self.write_qcorr_csv(file_terms)
+        self.write_cost_csv()
+
+        if duplicate_data is not None:
+            duplicate_data.save()
+        if self.manifest is not None:
+            self.manifest.save()
 
         # performs a full analysis to ensure that the calcs were run with the same parameters
         # currently, this function is not working with ORCA calcs
@@ -262,27 +553,23 @@ class qcorr:
         elif self.args.fullcheck == "True":
             self.args.fullcheck = True
         if self.args.fullcheck:
-            no_normal_terms = False
-            try:
-                df_qcorr = pd.read_csv(csv_qcorr)
-                if df_qcorr["Normal termination"][0] > 0:
-                    json_files = glob.glob(f"{destination_json}/*.json")
-                    full_check(
-                        w_dir_main=destination_json,
-                        destination_fullcheck=destination_json,
-                        files=json_files,
-                        log=self.args.log,
-                    )
-                else:
-                    no_normal_terms = True
-            except UnboundLocalError:
-                no_normal_terms = True
-            if no_normal_terms:
+            if file_terms["finished"] > 0:
+                json_files = get_json_files(destination_json)
+                full_check(
+                    w_dir_main=destination_json,
+                    destination_fullcheck=destination_json,
+                    files=json_files,
+                    log=self.args.log,
+                    results_store=results_store,
+                )
+            else:
                 self.args.log.write("\nx  No normal terminations with no errors to run the full check analysis")
 
+        if results_store is not None:
+            results_store.close()
+
         elapsed_time = round(time.time() - start_time_overall, 2)
         self.args.log.write(f"\n Time QCORR: {elapsed_time} seconds\n")
-        self.args.log.finalize()
 
         # NOT needed as already created in initial_dir
         # move dat and csv file containing the QCORR information if this is a sequential QCORR analysis
@@ -319,18 +606,46 @@ class qcorr:
     # 					os.remove(file.split('.')[0]+'.mol')
     # 					self.args.log.write("The file could not be converted into a mol object, geom filter(s) will be disabled\n")
 
-    def cclib_init(self, file, file_name):
+    def parse_outputs(self, files):
         """
-        Determine termination and error types (initial determination), create json files
-        with cclib and load the data in the cclib json files
+        Generator that parses the QM output files with cclib in a pool of processes. The
+        results are yielded in the same order as the files, and only a limited number of
+        files are parsed ahead of the analysis to keep the memory usage low.
         """
 
-        # cclib generation of json files with ccwrite
-        termination, errortype, cclib_data, file = self.json_gen(file, file_name)
-        outlines = []
+        # errors and try/excepts are not shown in multiprocessing
+        if self.args.debug or self.args.nprocs == 1 or len(files) == 1:
+            for file in files:
+                yield file, parse_cclib_file(file, self.args.w_dir_main, self.args.initial_dir, self.args.json_profile)
+            return
+
+        with futures.ProcessPoolExecutor(
+            max_workers=self.args.nprocs, initializer=quiet_cclib_worker
+        ) as executor:
+            pending = deque()
+            files_iter = iter(files)
+            for file in files_iter:
+                pending.append((file, executor.submit(parse_cclib_file, file, self.args.w_dir_main, self.args.initial_dir, self.args.json_profile)))
+                if len(pending) >= 4 * self.args.nprocs:
+                    break
+            while len(pending) > 0:
+                file, parse_job = pending.popleft()
+                next_file = next(files_iter, None)
+                if next_file is not None:
+                    pending.append((next_file, executor.submit(parse_cclib_file, next_file, self.args.w_dir_main, self.args.initial_dir, self.args.json_profile)))
+                yield file, parse_job.result()
+
+    def cclib_init(self, file, file_name, parsed_output):
+        """
+        Determine termination and error types (initial determination) and load the data
+        parsed with cclib
+        """
 
-        if errortype == "no_data":
-            return termination, errortype, None, None, file 
+        termination, errortype, cclib_data, file = self.json_gen(file, file_name, parsed_output)
+        tail_termination = parsed_output[3]
+
+        if errortype in ["no_data", "atomicbasiserror"]:
+            return termination, errortype, None, file 
 
         # calculations with 1 atom
         if cclib_data["properties"]["number of atoms"] == 1:
@@ -353,28 +668,25 @@ class qcorr:
                 ):
                     errortype = "no_freq"
 
-            # use very short reversed loop to find basis set incompatibilities and SCF errors
-            outlines = read_file(os.getcwd(), self.args.w_dir_main, file)
-            for i in reversed(range(len(outlines) - 15, len(outlines))):
-                if (
-                    outlines[i].find("Normal termination") > -1
-                    and errortype != "no_freq"
-                ):
-                    termination = "normal"
-                    errortype = "sp_calc"
-                    cclib_data["metadata"][
-                        "ground or transition state"
-                    ] = "SP calculation"
-                    break
-                elif (
-                    outlines[i - 1].find("Atomic number out of range") > -1
-                    or outlines[i - 1].find("basis sets are only available") > -1
-                ):
-                    errortype = "atomicbasiserror"
-                    break
-                elif outlines[i].find("SCF Error") > -1:
-                    errortype = "SCFerror"
-                    break
+            # the last lines of the file are used to find basis set incompatibilities and SCF errors
+            if errortype == "no_freq" and tail_termination == "normal":
+                tail_termination = classify_termination(file, skip_normal=True)
+
+            # normally terminated jobs without frequencies are only single-point calculations if no
+            # optimization was requested (i.e. ORCA also terminates normally when reaching max. OPT cycles)
+            opt_found = False
+            for keyword in cclib_data["metadata"]["keywords line"].split():
+                if keyword.lower().startswith("opt"):
+                    opt_found = True
+
+            if tail_termination == "normal" and not opt_found:
+                termination = "normal"
+                errortype = "sp_calc"
+                cclib_data["metadata"][
+                    "ground or transition state"
+                ] = "SP calculation"
+            elif tail_termination in ["atomicbasiserror", "SCFerror"]:
+                errortype = tail_termination
 
         # normal terminations
         if "vibrations" in cclib_data or errortype == "sp_calc":
@@ -402,58 +714,29 @@ class qcorr:
                     ):
                         errortype = "spin_contaminated"
 
-        return termination, errortype, cclib_data, outlines, file 
+        return termination, errortype, cclib_data, file 
 
     def analyze_normal(self, duplicate_data, errortype, cclib_data, file_name):
         """
         Analyze errors from normally terminated calculations
         """
 
-        # retrieve previous successfull results in case new calculations are duplicates
-        if self.args.resume_qcorr:
-            destination_json = self.args.w_dir_main.joinpath("../../../success/json_files/")
-        else:
-            destination_json = self.args.w_dir_main.joinpath("success/json_files/")
-        if os.path.exists(destination_json):
-            previous_success = glob.glob(f"{destination_json}/*.json")
-            for previous_json in previous_success:
-                with open(previous_json) as json_file:
-                    cclib_data_json = json.load(json_file)
-                E_json, H_json, G_json, ro_json, _ = get_cclib_params(cclib_data_json, errortype)
-                duplicate_data["File"].append(cclib_data_json["name"])
-                duplicate_data["Energies"].append(E_json)
-                duplicate_data["Enthalpies"].append(H_json)
-                duplicate_data["Gibbs"].append(G_json)
-                duplicate_data["RO_constant"].append(ro_json)
-
         atom_types, cartesians = cclib_atoms_coords(cclib_data)
         dup_off = None
         if errortype == "none":
             E_dup, H_dup, G_dup, ro_dup, errortype = get_cclib_params(cclib_data, errortype)
 
-            if self.args.nodup_check==False:
+            if duplicate_data is not None:
                 # detects if this calculation is a duplicate
-                for i, _ in enumerate(duplicate_data["Energies"]):
-                    E_diff = abs(E_dup - duplicate_data["Energies"][i])
-                    H_diff = abs(H_dup - duplicate_data["Enthalpies"][i])
-                    G_diff = abs(G_dup - duplicate_data["Gibbs"][i])
-                    if (ro_dup is not None) and (
-                        duplicate_data["RO_constant"][i] is not None
-                    ):
-                        ro_diff = np.linalg.norm(
-                            np.array(ro_dup) - np.array(duplicate_data["RO_constant"][i])
-                        )
-                    if max([E_diff, H_diff, G_diff]) < abs(float(self.args.dup_threshold)):
-                        if (ro_dup is not None) and (ro_diff < self.args.ro_threshold):
-                            errortype = "duplicate_calc"
-                            dup_off = duplicate_data["File"][i]
+                dup_off = duplicate_data.find_duplicate(
+                    E_dup, H_dup, G_dup, ro_dup, self.args.dup_threshold, self.args.ro_threshold
+                )
+                if dup_off is not None:
+                    errortype = "duplicate_calc"
 
         if errortype == "none":
-            duplicate_data["File"].append(file_name)
-            duplicate_data["Energies"].append(E_dup)
-            duplicate_data["Enthalpies"].append(H_dup)
-            duplicate_data["Gibbs"].append(G_dup)
-            duplicate_data["RO_constant"].append(ro_dup)
+            if duplicate_data is not None:
+                duplicate_data.add(file_name, E_dup, H_dup, G_dup, ro_dup)
 
             initial_ifreqs = 0
             for freq in cclib_data["vibrations"]["frequencies"]:
@@ -532,7 +815,7 @@ class qcorr:
 
         return atom_types, cartesians, duplicate_data, errortype, cclib_data, dup_off
 
-    def analyze_abnormal(self, errortype, cclib_data, outlines):
+    def analyze_abnormal(self, errortype, cclib_data, file):
         """
         Analyze errors from calculations that did not finish normally
         """
@@ -590,11 +873,10 @@ class qcorr:
                     # for optimizations that fail before the first step
                     min_RMS = 0
 
-                atom_types, cartesians = QM_coords(
-                    outlines,
+                # only the geometry of the step with the lowest RMS force is parsed
+                atom_types, cartesians, _, _ = QM_file_coords(
+                    os.path.join(self.args.w_dir_main, file),
                     min_RMS,
-                    cclib_data["properties"]["number of atoms"],
-                    "gaussian",
                     cclib_data["metadata"]["keywords line"],
                 )
 
@@ -626,8 +908,11 @@ class qcorr:
                     f'{os.path.basename(Path(file)).split(".")[0]}.{self.args.isom_type}'
                 )
 
-            elif self.args.isom_type.split(".")[1] != "csv":
-                init_csv = pd.read_csv(self.args.isom_type)
+            elif self.args.isom_type.split(".")[1] == "csv":
+                # the CSV is only read once and indexed by code_name
+                if self.isom_csv is None:
+                    self.isom_csv = pd.read_csv(self.args.isom_type).set_index("code_name", drop=False)
+                init_csv = self.isom_csv
 
             for line in atoms_and_coords:
                 atoms_com.append(line.split()[0])
@@ -661,7 +946,7 @@ class qcorr:
 
         return errortype
 
-    def qcorr_fixing(self, cclib_data, file, atom_types, cartesians):
+    def qcorr_fixing(self, cclib_data, file, atom_types, cartesians, errortype):
         """
         Create com files for resubmission with the suggested protocols to correct the errors
         """
@@ -680,14 +965,7 @@ class qcorr:
         elif "processors" not in cclib_data["metadata"]:
             cclib_data["metadata"]["processors"] = 8
 
-        if self.args.resume_qcorr:
-            destination_fix = Path(
-                f"{self.args.w_dir_main}/../../run_{self.args.round_num}/fixed_QM_inputs"
-            )
-        else:
-            destination_fix = Path(
-                f"{self.args.w_dir_main}/failed/run_{self.args.round_num}/fixed_QM_inputs"
-            )
+        destination_fix = self.get_fix_destination()
 
         if cclib_data["metadata"]["QM program"].lower().find("gaussian") > -1:
             program = "gaussian"
@@ -707,57 +985,72 @@ class qcorr:
                                 self.args.log.write("x  WARNING! You are using gen(ECP) but you are not specifying the atoms included for gen(ECP). Please, add them with the gen_atoms option.")
                                 self.args.log.finalize()
                                 sys.exit()
-            qprep(
+            # the writer is only created once per QCORR run
+            if self.input_writer is None:
+                self.input_writer = InputWriter(
+                    set_options(
+                        {
+                            "chk": self.args.chk,
+                            "qm_end": self.args.qm_end,
+                            "bs_gen": self.args.bs_gen,
+                            "bs_nogen": self.args.bs_nogen,
+                            "gen_atoms": self.args.gen_atoms,
+                        }
+                    )
+                )
+            qprep_data = {
+                "atom_types": atom_types,
+                "cartesians": cartesians,
+                "charge": cclib_data["properties"]["charge"],
+                "mult": cclib_data["properties"]["multiplicity"],
+                "name": os.path.basename(Path(file)).split(".")[0],
+            }
+
+            # restart inputs that reuse the checkpoint or wavefunction of the previous calculation
+            qm_input = cclib_data["metadata"]["keywords line"]
+            chk_options = {"chk": self.args.chk, "oldchk_path": ""}
+            restart_file = None
+            # the orbitals of SCF errors and the data of wrong geometries or basis sets are not reused
+            if self.args.restart_inputs and errortype not in ["SCFerror", "isomerization", "atomicbasiserror"]:
+                restart_file = get_restart_file(file, program)
+            if restart_file is not None:
+                restart_name = f'{qprep_data["name"]}_restart{restart_file.suffix}'
+                destination_fix.mkdir(exist_ok=True, parents=True)
+                shutil.copy2(restart_file, destination_fix.joinpath(restart_name))
+                # the force constants are only stored after the first OPT step
+                opt_steps = len(cclib_data.get("optimization", {}).get("geometric values", []))
+                qm_input = add_restart_keywords(qm_input, program, restart_name, read_fc=opt_steps > 0)
+                if program == "gaussian":
+                    chk_options = {"chk": True, "oldchk_path": restart_name}
+                self.restart_files[qprep_data["name"]] = restart_file.name
+                self.args.log.write(f"o  The input to fix {os.path.basename(file)} reuses the data from {restart_file.name}")
+
+            self.input_writer.write(
+                qprep_data,
                 destination=destination_fix,
-                w_dir_main=self.args.w_dir_main,
-                files=os.path.basename(file),
-                charge=cclib_data["properties"]["charge"],
-                mult=cclib_data["properties"]["multiplicity"],
                 program=program,
-                atom_types=atom_types,
-                cartesians=cartesians,
-                qm_input=cclib_data["metadata"]["keywords line"],
+                qm_input=qm_input,
                 mem=cclib_data["metadata"]["memory"],
                 nprocs=cclib_data["metadata"]["processors"],
-                chk=self.args.chk,
-                qm_end=self.args.qm_end,
-                bs_gen=self.args.bs_gen,
-                bs_nogen=self.args.bs_nogen,
-                gen_atoms=self.args.gen_atoms,
-                create_dat=False,
+                **chk_options,
             )
         else:
             self.args.log.write(f"x  Couldn't create an input file to fix {os.path.basename(file)} (compatible programs: Gaussian and ORCA)\n")
 
-    def json_gen(self, file, file_name):
+    def json_gen(self, file, file_name, parsed_output):
         """
-        Create a json file with cclib and load a dictionary
+        Load the dictionary of the cclib data parsed in parse_outputs()
         """
 
         termination, errortype = "normal", "none"
 
-        command_run_1 = ["ccwrite", "json", file]
-        subprocess.run(command_run_1, capture_output=True)
-
-        cclib_data = {}
-        try:
-            with open(file_name + ".json") as json_file:
-                cclib_data = json.load(json_file)
-        except FileNotFoundError:
-            try:
-                # this part avoids problems when using cclib from command lines (not complete file PATH)
-                file = f'{self.args.initial_dir}/{file}'
-                command_run_2 = ["ccwrite", "json", file]
-                subprocess.run(command_run_2, capture_output=True)
-                with open(file_name + ".json") as json_file:
-                    cclib_data = json.load(json_file)
-            except FileNotFoundError:
-                termination = "other"
-                errortype = "no_data"
-
-        # add parameters that might be missing from cclib (depends on the version)
-        if not hasattr(cclib_data, "metadata") and errortype != "no_data":
-            cclib_data = get_json_data(self, file, cclib_data)
+        cclib_json, cclib_data, file, tail_termination = parsed_output
+        if tail_termination == "atomicbasiserror":
+            termination = "other"
+            errortype = "atomicbasiserror"
+        elif cclib_json is None:
+            termination = "other"
+            errortype = "no_data"
 
         # this is just a "dirty hack" until cclib is updated to be compatible for print mini in ORCA
         if hasattr(cclib_data, "metadata"):
@@ -904,6 +1197,9 @@ class qcorr:
             destination = destination_error.joinpath("error/not_specified_error/")
             file_terms["not_specified"] += 1
 
+        if self.manifest is not None:
+            file_name = os.path.basename(Path(file)).split(".")[0]
+            self.manifest.add(file, termination, errortype, self.args.round_num, self.restart_files.get(file_name, ""))
         move_file(destination, self.args.w_dir_main, os.path.basename(file))
 
         return file_terms, destination
@@ -934,9 +1230,26 @@ class qcorr:
             ana_data.at[0, "geom filter"] = file_terms["geom_qcorr"]
         if self.args.isom_type is not None:
             ana_data.at[0, "Isomerization"] = file_terms["isomerized"]
+        if self.args.split_outputs:
+            ana_data.at[0, "Jobs not started"] = file_terms["not_started"]
         path_as_str = self.args.initial_dir.as_posix()
         csv_qcorr = path_as_str + f"/QCORR-run_{self.args.round_num}-stats.csv"
+        if self.previous_stats is not None:
+            ana_data = pd.concat([self.previous_stats, ana_data], ignore_index=True)
         if self.args.verbose:
             ana_data.to_csv(csv_qcorr, index=False)
 
         return csv_qcorr
+
+    def write_cost_csv(self):
+        """
+        Write the computational cost of the calculations analyzed (times, SCF cycles, optimization
+        steps and resources used) per program, level of theory and molecule size in a csv. This
+        cost report can be used in QPREP to suggest nprocs and mem for new calculations.
+        """
+
+        csv_cost = f"{self.args.initial_dir.as_posix()}/QCORR-run_{self.args.round_num}-cost.csv"
+        if self.args.verbose and len(self.cost_records) > 0:
+            get_cost_report(self.cost_records).to_csv(csv_cost, index=False)
+
+        return csv_cost
@@ -4,14 +4,35 @@
 ######################################################.
 
 import os
+import re
 import glob
+import bisect
 import pandas as pd
+import sys
 import json
+import hashlib
+import sqlite3
+import logging
+from collections import deque
+from itertools import islice, chain
 import cclib
+from cclib.io import ccread, ccwrite
 from pathlib import Path
-from aqme.utils import move_file, read_file, Logger
+from aqme.utils import move_file, Logger, is_compressed, open_file
+from aqme.bundle import bundle_formats, list_bundle, get_file_mtime
 import numpy as np
 
+# patterns used to classify the termination of Gaussian and ORCA calculations from the last
+# lines of the output files (the order sets the priority when several patterns are found)
+termination_patterns = [
+    ("normal", re.compile(rb"Normal termination|\*\*\*\*ORCA TERMINATED NORMALLY\*\*\*\*")),
+    ("atomicbasiserror", re.compile(rb"Atomic number out of range|basis sets are only available")),
+    ("SCFerror", re.compile(rb"SCF Error|ORCA finished by error termination in SCF")),
+]
+
+# lines that show that a job of an ORCA output with several jobs didn't finish normally
+orca_error_pattern = re.compile(r"ORCA finished by error termination|aborting the run|ERROR !!!")
+
 # Bondi VDW radii in Angstrom
 bondi = {
     "H": 1.09,
@@ -167,7 +188,7 @@ def detect_linear(errortype, atom_types, cclib_data):
     return errortype
 
 
-def full_check(w_dir_main=os.getcwd(), destination_fullcheck="", files="*.json", log=None):
+def full_check(w_dir_main=os.getcwd(), destination_fullcheck="", files="*.json", log=None, results_store=None):
     """
     Checks that multiple calculations were done following the same protocols, including
     program and version, grid size, level of theory, dispersion and solvation model.
@@ -185,6 +206,9 @@ def full_check(w_dir_main=os.getcwd(), destination_fullcheck="", files="*.json",
         Logging instance where the status of the calculation will be written.
         If none provided it will default to aqme.utils.Logger('QCORR','fullcheck')
         and it will create the file QCORR_fullcheck.dat in the working directory.
+    results_store : ResultsStore, default=None
+        Database with the results from QCORR. The parameters of the calculations
+        stored in the database are retrieved from it instead of from the JSON files.
     """
 
     if log is None: 
@@ -197,63 +221,59 @@ def full_check(w_dir_main=os.getcwd(), destination_fullcheck="", files="*.json",
     if not isinstance(files, list):
         files = glob.glob(files)
 
-    df_fullcheck = pd.DataFrame(
-        columns=[
-            "file",
-            "program",
-            "grid_type",
-            "level_of_theory",
-            "dispersion",
-            "solvation",
-        ]
-    )
+    fullcheck_columns = [
+        "file",
+        "program",
+        "grid_type",
+        "level_of_theory",
+        "dispersion",
+        "solvation",
+    ]
+
+    # the parameters of the calculations saved in the results database are not read from the JSON files
+    stored_props = {}
+    if results_store is not None:
+        stored_props = results_store.get_fullcheck_props(
+            [os.path.basename(Path(file)).split(".")[0] for file in files]
+        )
 
+    fullcheck_records = []
     for file in files:
         file_name = os.path.basename(Path(file)).split(".")[0]
-        with open(file) as json_file:
-            cclib_data = json.load(json_file)
-
-        program = cclib_data["metadata"]["QM program"]
-        solvation = cclib_data["metadata"]["solvation"]
-        dispersion = cclib_data["metadata"]["dispersion model"]
-        grid_type = cclib_data["metadata"]["grid type"]
-        functional = cclib_data["metadata"]["functional"]
-        bs = cclib_data["metadata"]["basis set"]
-        if functional != "" or bs != "":
-            level_of_theory = "/".join([functional, bs])
+        if file_name in stored_props:
+            fullcheck_props = stored_props[file_name]
         else:
-            level_of_theory = ""
-        # designed to detect G4 calcs
-        if level_of_theory == "HF/GFHFB2":
-            level_of_theory = "G4"
-        df_fullcheck.loc[len(df_fullcheck.index)] = [
-            file_name,
-            program,
-            grid_type,
-            level_of_theory,
-            dispersion,
-            solvation,
-        ]
+            with open_file(file) as json_file:
+                cclib_data = json.load(json_file)
+            fullcheck_props = get_fullcheck_props(cclib_data)
+        fullcheck_records.append([file_name] + list(fullcheck_props))
+    df_fullcheck = pd.DataFrame(fullcheck_records, columns=fullcheck_columns)
+
+    # the files that share each value of each property are found with a single group-by
+    # (the values keep the order in which they appear)
+    df_props = df_fullcheck.melt(id_vars="file", var_name="prop", value_name="value")
+    prop_groups = {}
+    for (prop, value), file_names in df_props.groupby(["prop", "value"], sort=False, dropna=False)["file"]:
+        prop_groups.setdefault(prop, {})[value] = list(file_names)
 
     fullcheck_file = "--QCORR_Fullcheck_Analysis--.dat"
-    fullcheck_txt = "\n-- Full check analysis --"
-    for prop in df_fullcheck.columns:
-        if prop != "file":
-            unique_props = df_fullcheck[prop].unique()
-            if len(unique_props) > 1:
-                fullcheck_txt += f"\nx  Different {prop} used in the calculations:"
-                for unique_prop in unique_props:
-                    file_names = df_fullcheck["file"].loc[
-                        df_fullcheck[prop] == unique_prop
-                    ]
-                    fullcheck_txt += f"\n     * {unique_prop} in:"
-                    for file_name in file_names:
-                        adapted_name = file_name.replace("/", "\\").split("\\")[-1]
-                        fullcheck_txt += f"\n       - {adapted_name}"
-            else:
-                fullcheck_txt += (
-                    f"\no  Same {prop} ({unique_props[0]}) used in all the calculations"
-                )
+    fullcheck_txt = ["\n-- Full check analysis --"]
+    for prop in fullcheck_columns[1:]:
+        if prop not in prop_groups:
+            continue
+        unique_props = prop_groups[prop]
+        if len(unique_props) > 1:
+            fullcheck_txt.append(f"\nx  Different {prop} used in the calculations:")
+            for unique_prop, file_names in unique_props.items():
+                fullcheck_txt.append(f"\n     * {unique_prop} in:")
+                for file_name in file_names:
+                    adapted_name = file_name.replace("/", "\\").split("\\")[-1]
+                    fullcheck_txt.append(f"\n       - {adapted_name}")
+        else:
+            fullcheck_txt.append(
+                f"\no  Same {prop} ({list(unique_props)[0]}) used in all the calculations"
+            )
+    fullcheck_txt = "".join(fullcheck_txt)
 
     fullcheck_analysis = open(fullcheck_file, "w")
     fullcheck_analysis.write(fullcheck_txt)
@@ -269,6 +289,29 @@ def full_check(w_dir_main=os.getcwd(), destination_fullcheck="", files="*.json",
     os.chdir(initial_dir)
 
 
+def get_fullcheck_props(cclib_data):
+    """
+    Retrieves the program, grid type, level of theory, dispersion and solvation model
+    compared in the full check analysis
+    """
+
+    program = cclib_data["metadata"]["QM program"]
+    solvation = cclib_data["metadata"]["solvation"]
+    dispersion = cclib_data["metadata"]["dispersion model"]
+    grid_type = cclib_data["metadata"]["grid type"]
+    functional = cclib_data["metadata"]["functional"]
+    bs = cclib_data["metadata"]["basis set"]
+    if functional != "" or bs != "":
+        level_of_theory = "/".join([functional, bs])
+    else:
+        level_of_theory = ""
+    # designed to detect G4 calcs
+    if level_of_theory == "HF/GFHFB2":
+        level_of_theory = "G4"
+
+    return program, grid_type, level_of_theory, dispersion, solvation
+
+
 def check_isomerization(isom_data, file):
     """
     Inputs two molecules with the atoms in the same order and checks if any bond
@@ -293,356 +336,1096 @@ def check_isomerization(isom_data, file):
             True if there is a clearly distorted bond within the geometries
     """
 
-    # load connectivity matrix from the starting points and convert string into matrix
+    # load connectivity matrix from the starting points (the CSV is indexed by code_name)
+    ts_pairs = []
     if not isom_data["Initial csv"].empty:
         filename = file.replace("_" + file.split("_")[-1], "")
-        init_connectivity_string = isom_data["Initial csv"][
-            isom_data["Initial csv"]["code_name"] == filename
-        ]["initial_connectiv"][0]
-        init_connectivity = json.loads(
-            init_connectivity_string.replace(".", ",")
-            .replace(",]", "],")
-            .replace("],]", "]]")
-        )
-        isom_data["Atoms input"] = init_connectivity[0]
+        csv_row = isom_data["Initial csv"].loc[filename]
+        init_connectivity = connectivity_from_string(csv_row["initial_connectiv"])
+        n_atoms_input = len(init_connectivity)
+        # bonds involved in TSs are not considered
+        if "TS_atom_idx" in isom_data["Initial csv"].columns:
+            ts_atoms = [int(ts_idx) for ts_idx in str(csv_row["TS_atom_idx"]).split(",")]
+            ts_pairs = [(min(i, j), max(i, j)) for i in ts_atoms for j in ts_atoms if i != j]
 
     else:
         init_connectivity = gen_connectivity(
             isom_data, isom_data["Atoms input"], isom_data["Coords input"]
         )
+        n_atoms_input = len(isom_data["Atoms input"])
 
     # in case the systems are not the same
-    if len(isom_data["Atoms output"]) != len(isom_data["Atoms input"]):
+    if len(isom_data["Atoms output"]) != n_atoms_input:
         isomerized = True
     else:
         final_connectivity = gen_connectivity(
             isom_data, isom_data["Atoms output"], isom_data["Coords output"]
         )
 
-        # check connectivity differences from initial structure
-        diff = final_connectivity - init_connectivity
+        # check connectivity differences from initial structure (only the pairs of atoms
+        # that changed are compared with the bonds of the TS)
+        diff_i, diff_j = np.nonzero(final_connectivity != init_connectivity)
+        changed_bonds = set(zip(diff_i.tolist(), diff_j.tolist())) - set(ts_pairs)
 
-        # remove bonds involved in TSs from connectivity matrixes
-        if not isom_data["Initial csv"].empty:
-            if "TS_atom_idx" in isom_data["Initial csv"].columns:
-                ts_atoms = isom_data["Initial csv"][
-                    isom_data["Initial csv"]["code_name"] == filename
-                ]["TS_atom_idx"][0].split(",")
-                for i, ts_idx in enumerate(ts_atoms):
-                    for j, ts_idx_2 in enumerate(ts_atoms):
-                        if j > i:
-                            diff[int(ts_idx)][int(ts_idx_2)] = 0
-                            diff[int(ts_idx_2)][int(ts_idx)] = 0
-
-        isomerized = np.any(diff)
+        isomerized = len(changed_bonds) > 0
 
     return isomerized
 
 
-def gen_connectivity(isom_data, atom_types_conn, COORDINATES_conn):
+def connectivity_from_string(connectivity_string):
+    """
+    Converts a connectivity matrix stored as text in a CSV file into a boolean matrix
+    """
+
+    values = np.array(re.findall(r"\d+\.?\d*", str(connectivity_string)), dtype=float)
+    n_atoms = int(round(np.sqrt(len(values))))
+
+    return np.triu(values.reshape(n_atoms, n_atoms) > 0, k=1)
+
+
+def gen_connectivity(isom_data, atom_types_conn, COORDINATES_conn, block_size=1024):
     """
-    Use VDW radii to infer a connectivity matrix
+    Use VDW radii to infer a connectivity matrix. The matrix is upper triangular, and the
+    distances are calculated by blocks of atoms to keep the memory low in large systems.
     """
 
     # if the atom doesn't have any measured VdW or covalent radius, the code assigns an arbitrary value of 1
-    for atom in atom_types_conn:
-        if atom not in bondi:
-            bondi[atom] = 1
-        if atom not in rcov:
-            rcov[atom] = 1
-          
-    conn_mat = np.zeros((len(atom_types_conn), len(atom_types_conn)))
-    for i, elem_i in enumerate(atom_types_conn):
-        for j, elem_j in enumerate(atom_types_conn):
-            if j > i:
-                vdw_ij = bondi[elem_i] + bondi[elem_j]
-                rcov_ij = rcov[elem_i] + rcov[elem_j]
-                dist_ij = np.linalg.norm(
-                    np.array(COORDINATES_conn[i]) - np.array(COORDINATES_conn[j])
-                )
-                if dist_ij / vdw_ij < float(
-                    isom_data["VdW radii fraction"]
-                ) or dist_ij / rcov_ij < float(isom_data["Covalent radii fraction"]):
-                    conn_mat[i][j] = 1
-                else:
-                    pass
+    vdw_radii = np.array([bondi.get(atom, 1) for atom in atom_types_conn], dtype=float)
+    cov_radii = np.array([rcov.get(atom, 1) for atom in atom_types_conn], dtype=float)
+    coords = np.asarray(COORDINATES_conn, dtype=float).reshape(-1, 3)
+    vdw_frac = float(isom_data["VdW radii fraction"])
+    cov_frac = float(isom_data["Covalent radii fraction"])
 
-    return conn_mat
+    n_atoms = len(atom_types_conn)
+    conn_mat = np.zeros((n_atoms, n_atoms), dtype=bool)
+    for start in range(0, n_atoms, block_size):
+        end = min(start + block_size, n_atoms)
+        dist_block = np.linalg.norm(coords[start:end, None, :] - coords[None, :, :], axis=-1)
+        conn_mat[start:end] = (
+            dist_block < vdw_frac * (vdw_radii[start:end, None] + vdw_radii[None, :])
+        ) | (dist_block < cov_frac * (cov_radii[start:end, None] + cov_radii[None, :]))
 
+    return np.triu(conn_mat, k=1)
 
-def get_json_data(self, file, cclib_data):
+
+def quiet_cclib_worker():
     """
-    Get metadata and GoodVibes data for the json file (for older versions of cclib)
+    Silences the messages that cclib and Open Babel print in the processes used to parse QM outputs
     """
 
-    outlines = read_file(os.getcwd(), self.args.w_dir_main, file)
-    # initial loop just to detect the QM program
-    for i, line in enumerate(outlines):
-        # get program
-        if line.strip() == "Cite this work as:":
-            cclib_data["metadata"] = {}
-            qm_program = outlines[i + 1]
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    os.dup2(devnull, sys.stderr.fileno())
+    os.close(devnull)
+    logging.disable(logging.CRITICAL)
 
-            cclib_data["metadata"]["QM program"] = qm_program[1:-2]
-            for j in range(i, i + 60):
-                if "**********" in outlines[j]:
-                    run_date = outlines[j + 2].strip()
-                    cclib_data["metadata"]["run date"] = run_date
-                    break
-            break
 
-        elif "* O   R   C   A *" in line:
-            for j in range(i, i + 100):
-                if "Program Version" in outlines[j].strip():
-                    cclib_data["metadata"] = {}
-                    version_program = "ORCA version " + outlines[j].split()[2]
-                    cclib_data["metadata"]["QM program"] = version_program
-                    break
+def cclib_to_json(file, job_times=None):
+    """
+    Parses a QM output file with cclib in the current process. Returns the text of the
+    cclib JSON file (the same text written by "ccwrite json FILE") or None if cclib fails.
+    If a job_times dictionary is used, the CPU and wall times (in s, summing all the job
+    steps) parsed by cclib are stored in it, since they are not included in the JSON file.
+    """
 
-    if cclib_data["metadata"]["QM program"].lower().find("gaussian") > -1:
+    try:
+        if is_compressed(file):
+            with open_file(file) as F:
+                data = ccread(F, loglevel=logging.ERROR)
+        else:
+            data = ccread(file, loglevel=logging.ERROR)
+        if data is None:
+            return None
+        if job_times is not None:
+            for time_type in ["cpu", "wall"]:
+                step_times = data.metadata.get(f"{time_type}_time", [])
+                if len(step_times) > 0:
+                    job_times[f"{time_type} time"] = sum(step.total_seconds() for step in step_times)
+        cclib_json = ccwrite(data, "json", None, indices=-1, terse=False, jobfilename=file)
+    except Exception:
+        return None
+
+    return cclib_json
+
+
+def get_json_files(json_folder):
+    """
+    Returns the JSON files of a folder, including JSON files compressed with gzip and the
+    JSON files stored in bundles (as virtual paths, PATH/BUNDLE.zip/FILE.json)
+    """
 
-        cclib_data["properties"]["rotational"] = {}
-        for i, line in enumerate(outlines):
-            # Extract memory
-            if "%mem" in line:
-                mem = line.strip().split("=")[-1]
-                cclib_data["metadata"]["memory"] = mem
-
-            # Extract number of processors
-            elif "%nprocs" in line:
-                nprocs = int(line.strip().split("=")[-1])
-                cclib_data["metadata"]["processors"] = nprocs
-
-            # Extract keywords line, solvation, dispersion and calculation type
-            elif "#" in line and not hasattr(cclib_data, "keywords_line"):
-                keywords_line = ""
-                for j in range(i, i + 10):
-                    if "----------" in outlines[j]:
-                        break
-                    else:
-                        keywords_line += outlines[j].rstrip("\n")[1:]
-                cclib_data["metadata"]["keywords line"] = keywords_line[2:]
-                qm_solv, qm_disp = "gas_phase", "none"
-                calc_type = "ground_state"
-                calcfc_found, ts_found = False, False
-                for keyword in keywords_line.split():
-                    if keyword.lower().find("opt") > -1:
-                        if keyword.lower().find("calcfc") > -1:
-                            calcfc_found = True
-                        if keyword.lower().find("ts") > -1:
-                            ts_found = True
-                    elif keyword.lower().startswith("scrf"):
-                        qm_solv = keyword
-                    elif keyword.lower().startswith("emp"):
-                        qm_disp = keyword
-                    elif keyword == 'gen' or 'gen' in keyword.split('/'):
-                        cclib_data["metadata"]["basis set"] = 'gen'
-                    elif keyword == 'genecp' or 'genecp' in keyword.split('/'):
-                        cclib_data["metadata"]["basis set"] = 'genecp'
-                if calcfc_found and ts_found:
-                    calc_type = "transition_state"
-                cclib_data["metadata"]["solvation"] = qm_solv
-                cclib_data["metadata"]["dispersion model"] = qm_disp
-                cclib_data["metadata"]["ground or transition state"] = calc_type
-
-            # Basis set name
-            elif line[1:15] == "Standard basis":
-                cclib_data["metadata"]["basis set"] = line.split()[2]
-
-            # functional
-            if not hasattr(cclib_data, "BOMD") and line[1:9] == "SCF Done":
-                t1 = line.split()[2]
-                if t1 == "E(RHF)":
-                    cclib_data["metadata"]["functional"] = "HF"
-                else:
-                    cclib_data["metadata"]["functional"] = t1[
-                        t1.index("(") + 2 : t1.rindex(")")
-                    ]
-                break
+    json_files = glob.glob(f"{json_folder}/*.json") + glob.glob(f"{json_folder}/*.json.gz")
+    for bundle_format in bundle_formats:
+        for bundle_file in sorted(glob.glob(f"{json_folder}/*{bundle_format}")):
+            json_files.extend(list_bundle(bundle_file, [".json", ".json.gz"]))
 
-            # Extract grid type
-            elif line[1:8] == "ExpMin=":
-                grid_lookup = {
-                    1: "sg1",
-                    2: "coarse",
-                    4: "fine",
-                    5: "ultrafine",
-                    7: "superfine",
-                }
-                IRadAn = int(line.strip().split()[-3])
-                grid = grid_lookup[IRadAn]
-                cclib_data["metadata"]["grid type"] = grid
-
-        # Keeps track of convergence during Freq calcs
-        if "optimization" in cclib_data:
-            cclib_data["optimization"]["times converged"] = 1
-
-        # Extract <S**2> before and after spin annihilation, energy, and convergence in freq calc
-        for i in reversed(range(0, len(outlines) - 30)):
-            # For time dependent (TD) calculations
-            if "E(TD-HF/TD-DFT)" in outlines[i]:
-                td_e = float(outlines[i].strip().split()[-1])
-                cclib_data["properties"]["energy"][
-                    "TD energy"
-                ] = cclib.parser.utils.convertor(td_e, "hartree", "eV")
-
-            # For G4 calculations look for G4 energies (Gaussian16a bug prints G4(0 K) as DE(HF)) --Brian modified to work for G16c-where bug is fixed.
-            elif outlines[i].strip().startswith("E(ZPE)="):  # Overwrite DFT ZPE with G4 ZPE
-                zero_point_corr = float(outlines[i].strip().split()[1])
-            elif outlines[i].strip().startswith("G4(0 K)"):
-                G4_energy = float(outlines[i].strip().split()[2])
-                G4_energy -= zero_point_corr  # Remove G4 ZPE
-                cclib_data["properties"]["energy"][
-                    "G4 energy"
-                ] = cclib.parser.utils.convertor(G4_energy, "hartree", "eV")
+    return json_files
 
-            # For ONIOM calculations use the extrapolated value rather than SCF value
-            elif "ONIOM: extrapolated energy" in outlines[i].strip():
-                oniom_e = float(outlines[i].strip().split()[4])
-                cclib_data["properties"]["energy"][
-                    "ONIOM energy"
-                ] = cclib.parser.utils.convertor(oniom_e, "hartree", "eV")
-
-            elif "S**2 before annihilation" in outlines[i]:
-                cclib_data["properties"]["S2 after annihilation"] = float(
-                    outlines[i].strip().split()[-1]
-                )
-                cclib_data["properties"]["S2 before annihilation"] = float(
-                    outlines[i].strip().split()[-3][:-1]
-                )
-
-            # Extract symmetry point group
-            elif "Full point group" in outlines[i]:
-                point_group = outlines[i].strip().split()[3]
-                cclib_data["properties"]["rotational"][
-                    "symmetry point group"
-                ] = point_group
-                break
 
-            elif "Stationary point found" in outlines[i]:
-                cclib_data["optimization"]["times converged"] = 2
+def get_tail_lines(file, n_lines=16, block_size=8192):
+    """
+    Returns the last lines of a file (as bytes) without reading the whole file
+    """
 
-            # Extract symmetry number, rotational constants and rotational temperatures
-            elif "Rotational symmetry number" in outlines[i]:
-                symmno = int(outlines[i].strip().split()[3].split(".")[0])
-                cclib_data["properties"]["rotational"]["symmetry number"] = symmno
+    # compressed files can't be read backwards, so they are streamed keeping only the last lines
+    if is_compressed(file):
+        with open_file(file, "rb") as F:
+            return [line.rstrip(b"\r\n") for line in deque(F, maxlen=n_lines)]
 
-            elif outlines[i].find("Rotational constants (GHZ):") > -1:
-                try:
-                    roconst = [
-                        float(outlines[i].strip().replace(":", " ").split()[3]),
-                        float(outlines[i].strip().replace(":", " ").split()[4]),
-                        float(outlines[i].strip().replace(":", " ").split()[5]),
-                    ]
-                except ValueError:
-                    if outlines[i].find("********") > -1:
-                        roconst = [
-                            float(outlines[i].strip().replace(":", " ").split()[4]),
-                            float(outlines[i].strip().replace(":", " ").split()[5]),
-                        ]
-                cclib_data["properties"]["rotational"]["rotational constants"] = roconst
+    with open(file, "rb") as F:
+        F.seek(0, os.SEEK_END)
+        position = F.tell()
+        tail = b""
+        # the file is read backwards in blocks until the lines requested are found
+        while position > 0 and tail.count(b"\n") <= n_lines:
+            read_size = min(block_size, position)
+            position -= read_size
+            F.seek(position)
+            tail = F.read(read_size) + tail
 
-            elif outlines[i].find("Rotational temperature ") > -1:
-                rotemp = [float(outlines[i].strip().split()[3])]
-                cclib_data["properties"]["rotational"][
-                    "rotational temperatures"
-                ] = rotemp
+    return tail.splitlines()[-n_lines:]
+
+
+def classify_termination(file, skip_normal=False):
+    """
+    Fast classification of the termination of a QM output file, using only the last
+    lines of the file. Returns "normal", "atomicbasiserror", "SCFerror" or None (other
+    error terminations and unfinished jobs).
+
+    Parameters
+    ----------
+    file : str
+        QM output file
+    skip_normal : bool, default=False
+        Ignore normal terminations (i.e. for calcs with finished OPT but no freqs)
+    """
+
+    try:
+        tail_lines = get_tail_lines(file)
+    except OSError:
+        return None
+
+    for line in reversed(tail_lines):
+        for termination, pattern in termination_patterns:
+            if termination == "normal" and skip_normal:
+                continue
+            if pattern.search(line):
+                return termination
+
+    return None
+
+
+# parts of the cclib data stored in the JSON files of each profile (True keeps the whole section).
+# The minimal profile contains the data used by QCORR, QPREP and the full check (metadata, final
+# geometry, energies, thermochemistry, rotational constants and frequencies)
+json_profiles = {
+    "minimal": {
+        "chemical json": True,
+        "name": True,
+        "smiles": True,
+        "inchi": True,
+        "inchikey": True,
+        "formula": True,
+        "metadata": True,
+        "atoms": {"elements": True, "coords": True},
+        "properties": {
+            "charge": True,
+            "multiplicity": True,
+            "number of atoms": True,
+            "molecular mass": True,
+            "energy": True,
+            "energies": True,
+            "enthalpy": True,
+            "entropy": True,
+            "temperature": True,
+            "pressure": True,
+            "total dipole moment": True,
+            "rotational": True,
+            "S2 after annihilation": True,
+            "S2 before annihilation": True,
+        },
+        "optimization": {"done": True, "status": True, "times converged": True, "scf": {"scf energies": True}},
+        "vibrations": {"frequencies": True},
+    },
+}
+# the NMR profile also includes the NMR tensors used in QDESCP
+json_profiles["nmr"] = json.loads(json.dumps(json_profiles["minimal"]))
+json_profiles["nmr"]["properties"]["NMR"] = True
+
+
+def select_json_profile(cclib_data, json_profile="full"):
+    """
+    Returns the part of the cclib data included in a JSON profile ("full" keeps all the data)
+    """
+
+    if json_profile == "full":
+        return cclib_data
+
+    return filter_json_keys(cclib_data, json_profiles[json_profile])
+
+
+def filter_json_keys(json_data, json_keys):
+    selected_data = {}
+    for key, value in json_data.items():
+        if key in json_keys:
+            if json_keys[key] is True or not isinstance(value, dict):
+                selected_data[key] = value
+            else:
+                selected_data[key] = filter_json_keys(value, json_keys[key])
+
+    return selected_data
+
+
+def is_numeric_array(value):
+    """
+    Checks whether a value is a list of numbers (or of lists of numbers)
+    """
+
+    if not isinstance(value, list):
+        return False
+    for item in value:
+        if not isinstance(item, (int, float)) and not is_numeric_array(item):
+            return False
+
+    return True
+
+
+def dump_json(json_data, indent=1):
+    """
+    Creates the text of a JSON file with indented objects where each numeric array is
+    written in a single line (indenting every number of the arrays, as in json.dumps(),
+    makes the JSON files several times larger)
+    """
+
+    numeric_arrays = []
+
+    def pack_arrays(value):
+        if isinstance(value, dict):
+            return {key: pack_arrays(item) for key, item in value.items()}
+        if is_numeric_array(value):
+            numeric_arrays.append(json.dumps(value, separators=(",", ":")))
+            return f"\0array{len(numeric_arrays) - 1}\0"
+        if isinstance(value, list):
+            return [pack_arrays(item) for item in value]
+        return value
+
+    json_text = json.dumps(pack_arrays(json_data), indent=indent)
+
+    return re.sub(
+        r'"\\u0000array(\d+)\\u0000"',
+        lambda array_match: numeric_arrays[int(array_match.group(1))],
+        json_text,
+    )
 
-            elif outlines[i].find("Rotational temperatures") > -1:
-                try:
-                    rotemp = [
-                        float(outlines[i].strip().split()[3]),
-                        float(outlines[i].strip().split()[4]),
-                        float(outlines[i].strip().split()[5]),
-                    ]
-                except ValueError:
-                    if outlines[i].find("********") > -1:
-                        rotemp = [
-                            float(outlines[i].strip().split()[4]),
-                            float(outlines[i].strip().split()[5]),
-                        ]
-                cclib_data["properties"]["rotational"][
-                    "rotational temperatures"
-                ] = rotemp
-
-            elif outlines[i].find("SCF GIAO Magnetic shielding tensor (ppm)") > -1:
-                nmr_iso = []
-                nmr_anis = []
-                nmr_eigen = []
-                cclib_data["properties"]["NMR"] = {}
-                for j in range(i, len(outlines)):
-                    if outlines[j].find("Isotropic") > -1:
-                        nmr_iso.append(float(outlines[j].split()[4]))
-                        nmr_anis.append(float(outlines[j].split()[7]))
-                    elif outlines[j].find("Eigenvalues") > -1:
-                        nmr_eigen.append(
-                            [
-                                float(outlines[j].split()[1]),
-                                float(outlines[j].split()[2]),
-                                float(outlines[j].split()[3]),
-                            ]
-                        )
-                    elif outlines[j].find("*************************") > -1:
-                        break
-                cclib_data["properties"]["NMR"]["NMR anisotopic tensors"] = nmr_anis
-                cclib_data["properties"]["NMR"]["NMR eigenvalues"] = nmr_eigen
-                cclib_data["properties"]["NMR"]["NMR isotopic tensors"] = nmr_iso
+
+def parse_cclib_file(file, w_dir_main, initial_dir, json_profile="full"):
+    """
+    Parses a QM output file with cclib and loads the data of the cclib JSON file. This
+    function is run in parallel for all the output files analyzed in QCORR.
+
+    Returns
+    -------
+    cclib_json : str
+        Text of the JSON file with the data of the JSON profile selected, including the
+        parameters added with get_json_data() (None if no data was found). It is only
+        written for the calculations that finish successfully
+    cclib_data : dict
+        Data of the JSON file
+    file : str
+        Output file (the PATH is updated when the file is found from initial_dir)
+    tail_termination : str
+        Termination detected from the last lines of the file with classify_termination()
+    """
+
+    tail_file = file
+    if not os.path.exists(tail_file) and os.path.exists(f'{initial_dir}/{file}'):
+        tail_file = f'{initial_dir}/{file}'
+    tail_termination = classify_termination(tail_file)
+    # calculations that can't be fixed automatically are not parsed with cclib
+    if tail_termination == "atomicbasiserror":
+        return None, {}, tail_file, tail_termination
+
+    job_times = {}
+    cclib_json = cclib_to_json(file, job_times)
+    if cclib_json is None:
+        # this part avoids problems when using cclib from command lines (not complete file PATH)
+        file = f'{initial_dir}/{file}'
+        if os.path.exists(file):
+            cclib_json = cclib_to_json(file, job_times)
+
+    cclib_data = {}
+    if cclib_json is not None:
+        cclib_data = json.loads(cclib_json)
+        # add parameters that might be missing from cclib (depends on the version)
+        if not hasattr(cclib_data, "metadata"):
+            cclib_data = get_json_data(w_dir_main, file, cclib_data)
+        # job times used in the cost report (ORCA times are read in get_json_data())
+        if "metadata" in cclib_data:
+            cclib_data["metadata"].update(job_times)
+        cclib_json = dump_json(select_json_profile(cclib_data, json_profile))
+
+    return cclib_json, cclib_data, file, tail_termination
+
+
+# patterns of the lines used in get_json_data(), as (name, text, pattern). The tables keep the
+# order of priority of the checks, and the texts of each table are combined into a single pattern
+# that skips quickly the lines that don't contain any of them
+program_patterns = [
+    ("gaussian", "Cite this work as:", re.compile(r"^\s*Cite this work as:\s*$")),
+    ("orca", "* O   R   C   A *", re.compile(r"\* O   R   C   A \*")),
+]
+# input section of Gaussian outputs (read until the first SCF Done)
+gaussian_input_patterns = [
+    ("memory", "%mem", re.compile(r"%mem")),
+    ("processors", "%nprocs", re.compile(r"%nprocs")),
+    ("keywords", "#", re.compile(r"#")),
+    ("basis set", "Standard basis", re.compile(r"^.Standard basis")),
+    ("functional", "SCF Done", re.compile(r"^.SCF Done")),
+    ("grid", "ExpMin=", re.compile(r"^.ExpMin=")),
+]
+# results of Gaussian outputs (read backwards until the last Full point group)
+gaussian_results_patterns = [
+    ("TD energy", "E(TD-HF/TD-DFT)", re.compile(r"E\(TD-HF/TD-DFT\)")),
+    ("ZPE", "E(ZPE)=", re.compile(r"^\s*E\(ZPE\)=")),
+    ("G4 energy", "G4(0 K)", re.compile(r"^\s*G4\(0 K\)")),
+    ("ONIOM energy", "ONIOM: extrapolated energy", re.compile(r"ONIOM: extrapolated energy")),
+    ("S2", "S**2 before annihilation", re.compile(r"S\*\*2 before annihilation")),
+    ("point group", "Full point group", re.compile(r"Full point group")),
+    ("stationary point", "Stationary point found", re.compile(r"Stationary point found")),
+    ("symmetry number", "Rotational symmetry number", re.compile(r"Rotational symmetry number")),
+    ("rotational constants", "Rotational constants (GHZ):", re.compile(r"Rotational constants \(GHZ\):")),
+    ("rotational temperature", "Rotational temperature ", re.compile(r"Rotational temperature ")),
+    ("rotational temperatures", "Rotational temperatures", re.compile(r"Rotational temperatures")),
+    ("NMR", "SCF GIAO Magnetic shielding tensor (ppm)", re.compile(r"SCF GIAO Magnetic shielding tensor \(ppm\)")),
+]
+# input section of ORCA outputs (read until END OF INPUT)
+orca_input_patterns = [
+    ("processors", "%pal", re.compile(r"%pal")),
+    ("memory", "%maxcore", re.compile(r"%maxcore")),
+    ("keywords", "!", re.compile(r"!")),
+    ("end of input", "END OF INPUT", re.compile(r"END OF INPUT")),
+]
+# results of ORCA outputs (read backwards until the last energy)
+orca_results_patterns = [
+    ("energy", "FINAL SINGLE POINT ENERGY", re.compile(r"^FINAL SINGLE POINT ENERGY")),
+    ("wall time", "TOTAL RUN TIME", re.compile(r"^TOTAL RUN TIME")),
+]
+gaussian_grid_lookup = {
+    1: "sg1",
+    2: "coarse",
+    4: "fine",
+    5: "ultrafine",
+    7: "superfine",
+}
+
+
+def combine_patterns(patterns):
+    """
+    Creates a single pattern that finds the lines containing any of the texts of a table
+    """
+
+    return re.compile("|".join(re.escape(text) for _, text, _ in patterns))
+
+
+program_match = combine_patterns(program_patterns)
+gaussian_input_match = combine_patterns(gaussian_input_patterns)
+gaussian_results_match = combine_patterns(gaussian_results_patterns)
+orca_input_match = combine_patterns(orca_input_patterns)
+orca_results_match = combine_patterns(orca_results_patterns)
+
+
+def match_pattern(line, patterns, match_all):
+    """
+    Returns the name of the first pattern of the table that matches the line (None if none of them matches)
+    """
+
+    if match_all.search(line) is None:
+        return None
+    for name, _, pattern in patterns:
+        if pattern.search(line) is not None:
+            return name
+
+    return None
+
+
+def iter_line_windows(lines, n_lookahead=100):
+    """
+    Yields every line together with the n_lookahead lines that follow it, as a window
+    that starts with that line
+    """
+
+    window = deque()
+    for line in lines:
+        window.append(line)
+        if len(window) > n_lookahead:
+            yield window
+            window.popleft()
+    while len(window) > 0:
+        yield window
+        window.popleft()
+
+
+def iter_reversed_lines(file, block_size=65536):
+    """
+    Yields the lines of a file from the end to the beginning, reading the file backwards
+    in blocks (compressed files can't be read backwards, so they are read entirely)
+    """
+
+    if is_compressed(file):
+        with open_file(file) as F:
+            yield from reversed(F.readlines())
+        return
+
+    with open(file, "rb") as F:
+        F.seek(0, os.SEEK_END)
+        position = F.tell()
+        remainder = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            F.seek(position)
+            block_lines = (F.read(read_size) + remainder).splitlines(keepends=True)
+            # the first line of the block might be incomplete, so it's joined to the next block
+            remainder = b""
+            if position > 0:
+                remainder = block_lines.pop(0)
+            for line in reversed(block_lines):
+                yield line.decode(errors="replace")
+
+
+def get_json_data(w_dir_main, file, cclib_data):
+    """
+    Get metadata and GoodVibes data for the json file (for older versions of cclib).
+    The input section is read from the beginning of the file and the results from the end,
+    stopping when all the data of each section is found (the rest of the file is not read).
+    """
+
+    file = Path(w_dir_main).joinpath(file)
+    get_input_data(file, cclib_data)
+
+    if cclib_data["metadata"]["QM program"].lower().find("gaussian") > -1:
+        get_gaussian_results(file, cclib_data)
 
     elif cclib_data["metadata"]["QM program"].lower().find("orca") > -1:
-        for i in reversed(range(0, len(outlines))):
-            if outlines[i][:25] == "FINAL SINGLE POINT ENERGY":
+        for line in iter_reversed_lines(file):
+            key = match_pattern(line, orca_results_patterns, orca_results_match)
+            if key == "wall time":
+                cclib_data["metadata"]["wall time"] = get_time_seconds(line)
+            elif key == "energy":
                 # in eV to match the format from cclib
-                orca_e = float(outlines[i].split()[-1])
+                orca_e = float(line.split()[-1])
                 cclib_data["properties"]["energy"][
                     "final single point energy"
                 ] = cclib.parser.utils.convertor(orca_e, "hartree", "eV")
                 break
 
-        for i, line in enumerate(outlines):
-            # Extract number of processors
-            if "%pal" in line:
-                pal_line = ''
-                for j in range(i,i+3):
-                    if outlines[j][0] not in ['%','!'] or "%pal" in outlines[j]:
-                        pal_line += outlines[j].rstrip("\n")[5:]
-                if 'nprocs' in pal_line:
-                    nprocs = pal_line.strip().split()[2]
-                    cclib_data["metadata"]["processors"] = nprocs
-
-            # Extract memory
-            elif '%maxcore' in line:
-                mem = int(line.strip().split()[3])
-                cclib_data["metadata"]["memory"] = f'{mem}MB'
-            
-            # Extract input line
-            elif "!" in line:
-                keywords_line = ""
-                for j in range(i, i + 100):
-                    if "*" in outlines[j]:
-                        break
-                    else:
-                        keywords_line += outlines[j][6:]
-                cclib_data["metadata"]["keywords line"] = keywords_line[1:].rstrip("\n")
-                calc_type = "ground_state"
-                for keyword in keywords_line.split():
-                    if keyword.lower() in ["optts",'neb-ts']:
-                        calc_type = "transition_state"
-                        break
-                    if keyword.lower()[0:3] == 'pal':
-                        cclib_data["metadata"]["processors"] = keyword[3]
-                cclib_data["metadata"]["ground or transition state"] = calc_type
-            
-            elif 'END OF INPUT' in line:
+    return cclib_data
+
+
+# units of the times printed in QM outputs (in s)
+time_units = {"days": 86400, "hours": 3600, "minutes": 60, "seconds": 1, "msec": 0.001}
+
+
+def get_time_seconds(line):
+    """
+    Converts the times printed in QM outputs to seconds
+    (i.e. TOTAL RUN TIME: 0 days 4 hours 29 minutes 31 seconds 79 msec)
+    """
+
+    seconds = 0.0
+    for value, unit in re.findall(r"([\d.]+)\s*(days|hours|minutes|seconds|msec)", line):
+        seconds += float(value) * time_units[unit]
+
+    return seconds
+
+
+def get_input_data(file, cclib_data):
+    """
+    Detects the QM program and reads the data from the input section of the output file
+    """
+
+    program = None
+    with open_file(file) as F:
+        for window in iter_line_windows(F):
+            line = window[0]
+            # get program
+            if program is None:
+                key = match_pattern(line, program_patterns, program_match)
+                if key == "gaussian":
+                    cclib_data["metadata"] = {}
+                    cclib_data["metadata"]["QM program"] = window[1][1:-2]
+                    for j in range(0, 60):
+                        if "**********" in window[j]:
+                            run_date = window[j + 2].strip()
+                            cclib_data["metadata"]["run date"] = run_date
+                            break
+                    program = cclib_data["metadata"]["QM program"].lower()
+
+                elif key == "orca":
+                    for j in range(0, 100):
+                        if "Program Version" in window[j].strip():
+                            cclib_data["metadata"] = {}
+                            version_program = "ORCA version " + window[j].split()[2]
+                            cclib_data["metadata"]["QM program"] = version_program
+                            program = version_program.lower()
+                            break
+
+            elif program.find("gaussian") > -1:
+                if get_gaussian_input(line, window, cclib_data):
+                    break
+
+            elif program.find("orca") > -1:
+                if get_orca_input(line, window, cclib_data):
+                    break
+
+            else:
                 break
 
-    if cclib_data != {}:
-        # this prevents errors when the names contain "."
-        name_path = os.path.basename(Path(file))
-        dir_path = os.path.dirname(Path(file))
-        with open(f'{dir_path}/{name_path.split(".")[0]}.json', "w") as outfile:
-            json.dump(cclib_data, outfile, indent=1)
 
-    return cclib_data
+def get_gaussian_input(line, window, cclib_data):
+    """
+    Reads the data from the input section of Gaussian outputs (memory, processors,
+    keywords line, basis set, functional and grid). Returns True when the first
+    SCF Done is found.
+    """
+
+    key = match_pattern(line, gaussian_input_patterns, gaussian_input_match)
+    # Extract memory
+    if key == "memory":
+        mem = line.strip().split("=")[-1]
+        cclib_data["metadata"]["memory"] = mem
+
+    # Extract number of processors
+    elif key == "processors":
+        nprocs = int(line.strip().split("=")[-1])
+        cclib_data["metadata"]["processors"] = nprocs
+
+    # Extract keywords line, solvation, dispersion and calculation type
+    elif key == "keywords":
+        keywords_line = ""
+        for j in range(0, 10):
+            if "----------" in window[j]:
+                break
+            else:
+                keywords_line += window[j].rstrip("\n")[1:]
+        cclib_data["metadata"]["keywords line"] = keywords_line[2:]
+        qm_solv, qm_disp = "gas_phase", "none"
+        calc_type = "ground_state"
+        calcfc_found, ts_found = False, False
+        for keyword in keywords_line.split():
+            if keyword.lower().find("opt") > -1:
+                if keyword.lower().find("calcfc") > -1:
+                    calcfc_found = True
+                if keyword.lower().find("ts") > -1:
+                    ts_found = True
+            elif keyword.lower().startswith("scrf"):
+                qm_solv = keyword
+            elif keyword.lower().startswith("emp"):
+                qm_disp = keyword
+            elif keyword == 'gen' or 'gen' in keyword.split('/'):
+                cclib_data["metadata"]["basis set"] = 'gen'
+            elif keyword == 'genecp' or 'genecp' in keyword.split('/'):
+                cclib_data["metadata"]["basis set"] = 'genecp'
+        if calcfc_found and ts_found:
+            calc_type = "transition_state"
+        cclib_data["metadata"]["solvation"] = qm_solv
+        cclib_data["metadata"]["dispersion model"] = qm_disp
+        cclib_data["metadata"]["ground or transition state"] = calc_type
+
+    # Basis set name
+    elif key == "basis set":
+        cclib_data["metadata"]["basis set"] = line.split()[2]
+
+    # functional
+    elif key == "functional":
+        t1 = line.split()[2]
+        if t1 == "E(RHF)":
+            cclib_data["metadata"]["functional"] = "HF"
+        else:
+            cclib_data["metadata"]["functional"] = t1[
+                t1.index("(") + 2 : t1.rindex(")")
+            ]
+        return True
+
+    # Extract grid type
+    elif key == "grid":
+        IRadAn = int(line.strip().split()[-3])
+        cclib_data["metadata"]["grid type"] = gaussian_grid_lookup[IRadAn]
+
+    return False
+
+
+def get_orca_input(line, window, cclib_data):
+    """
+    Reads the data from the input section of ORCA outputs (processors, memory and
+    keywords line). Returns True when the end of the input section is found.
+    """
+
+    key = match_pattern(line, orca_input_patterns, orca_input_match)
+    # Extract number of processors
+    if key == "processors":
+        pal_line = ''
+        for j in range(0, 3):
+            if window[j][0] not in ['%','!'] or "%pal" in window[j]:
+                pal_line += window[j].rstrip("\n")[5:]
+        if 'nprocs' in pal_line:
+            nprocs = pal_line.strip().split()[2]
+            cclib_data["metadata"]["processors"] = nprocs
+
+    # Extract memory
+    elif key == "memory":
+        mem = int(line.strip().split()[3])
+        cclib_data["metadata"]["memory"] = f'{mem}MB'
+
+    # Extract input line
+    elif key == "keywords":
+        keywords_line = ""
+        for j in range(0, 100):
+            if "*" in window[j]:
+                break
+            else:
+                keywords_line += window[j][6:]
+        cclib_data["metadata"]["keywords line"] = keywords_line[1:].rstrip("\n")
+        calc_type = "ground_state"
+        for keyword in keywords_line.split():
+            if keyword.lower() in ["optts",'neb-ts']:
+                calc_type = "transition_state"
+                break
+            if keyword.lower()[0:3] == 'pal':
+                cclib_data["metadata"]["processors"] = keyword[3]
+        cclib_data["metadata"]["ground or transition state"] = calc_type
+
+    elif key == "end of input":
+        return True
+
+    return False
+
+
+def get_gaussian_results(file, cclib_data):
+    """
+    Reads the results of Gaussian outputs from the end of the file until the last
+    Full point group is found (the last 30 lines of the file are not used)
+    """
+
+    cclib_data["properties"]["rotational"] = {}
+    # Keeps track of convergence during Freq calcs
+    if "optimization" in cclib_data:
+        cclib_data["optimization"]["times converged"] = 1
+
+    # Extract <S**2> before and after spin annihilation, energy, and convergence in freq calc
+    tail_lines = []
+    zero_point_corr, G4_energy = None, None
+    for line in iter_reversed_lines(file):
+        tail_lines.append(line)
+        if len(tail_lines) <= 30:
+            continue
+        key = match_pattern(line, gaussian_results_patterns, gaussian_results_match)
+
+        # For time dependent (TD) calculations
+        if key == "TD energy":
+            td_e = float(line.strip().split()[-1])
+            cclib_data["properties"]["energy"][
+                "TD energy"
+            ] = cclib.parser.utils.convertor(td_e, "hartree", "eV")
+
+        # For G4 calculations look for G4 energies (Gaussian16a bug prints G4(0 K) as DE(HF)) --Brian modified to work for G16c-where bug is fixed.
+        elif key == "ZPE":  # Overwrite DFT ZPE with G4 ZPE
+            zero_point_corr = float(line.strip().split()[1])
+        elif key == "G4 energy":
+            G4_energy = float(line.strip().split()[2])
+
+        # For ONIOM calculations use the extrapolated value rather than SCF value
+        elif key == "ONIOM energy":
+            oniom_e = float(line.strip().split()[4])
+            cclib_data["properties"]["energy"][
+                "ONIOM energy"
+            ] = cclib.parser.utils.convertor(oniom_e, "hartree", "eV")
+
+        elif key == "S2":
+            cclib_data["properties"]["S2 after annihilation"] = float(
+                line.strip().split()[-1]
+            )
+            cclib_data["properties"]["S2 before annihilation"] = float(
+                line.strip().split()[-3][:-1]
+            )
+
+        # Extract symmetry point group
+        elif key == "point group":
+            point_group = line.strip().split()[3]
+            cclib_data["properties"]["rotational"][
+                "symmetry point group"
+            ] = point_group
+            break
+
+        elif key == "stationary point":
+            cclib_data["optimization"]["times converged"] = 2
+
+        # Extract symmetry number, rotational constants and rotational temperatures
+        elif key == "symmetry number":
+            symmno = int(line.strip().split()[3].split(".")[0])
+            cclib_data["properties"]["rotational"]["symmetry number"] = symmno
+
+        elif key == "rotational constants":
+            try:
+                roconst = [
+                    float(line.strip().replace(":", " ").split()[3]),
+                    float(line.strip().replace(":", " ").split()[4]),
+                    float(line.strip().replace(":", " ").split()[5]),
+                ]
+            except ValueError:
+                if line.find("********") > -1:
+                    roconst = [
+                        float(line.strip().replace(":", " ").split()[4]),
+                        float(line.strip().replace(":", " ").split()[5]),
+                    ]
+            cclib_data["properties"]["rotational"]["rotational constants"] = roconst
+
+        elif key == "rotational temperature":
+            rotemp = [float(line.strip().split()[3])]
+            cclib_data["properties"]["rotational"][
+                "rotational temperatures"
+            ] = rotemp
+
+        elif key == "rotational temperatures":
+            try:
+                rotemp = [
+                    float(line.strip().split()[3]),
+                    float(line.strip().split()[4]),
+                    float(line.strip().split()[5]),
+                ]
+            except ValueError:
+                if line.find("********") > -1:
+                    rotemp = [
+                        float(line.strip().split()[4]),
+                        float(line.strip().split()[5]),
+                    ]
+            cclib_data["properties"]["rotational"][
+                "rotational temperatures"
+            ] = rotemp
+
+        # the lines of the NMR section were already read (they are after the current line)
+        elif key == "NMR":
+            nmr_iso = []
+            nmr_anis = []
+            nmr_eigen = []
+            cclib_data["properties"]["NMR"] = {}
+            for nmr_line in reversed(tail_lines):
+                if nmr_line.find("Isotropic") > -1:
+                    nmr_iso.append(float(nmr_line.split()[4]))
+                    nmr_anis.append(float(nmr_line.split()[7]))
+                elif nmr_line.find("Eigenvalues") > -1:
+                    nmr_eigen.append(
+                        [
+                            float(nmr_line.split()[1]),
+                            float(nmr_line.split()[2]),
+                            float(nmr_line.split()[3]),
+                        ]
+                    )
+                elif nmr_line.find("*************************") > -1:
+                    break
+            cclib_data["properties"]["NMR"]["NMR anisotopic tensors"] = nmr_anis
+            cclib_data["properties"]["NMR"]["NMR eigenvalues"] = nmr_eigen
+            cclib_data["properties"]["NMR"]["NMR isotopic tensors"] = nmr_iso
+
+    if G4_energy is not None and zero_point_corr is not None:
+        G4_energy -= zero_point_corr  # Remove G4 ZPE
+        cclib_data["properties"]["energy"][
+            "G4 energy"
+        ] = cclib.parser.utils.convertor(G4_energy, "hartree", "eV")
+
+
+def is_dashes_line(line):
+    """
+    Detects the lines made only of dashes that Gaussian uses around the route and title sections
+    """
+
+    line = line.strip()
+    return len(line) > 0 and line.strip("-") == ""
+
+
+def iter_gaussian_jobs(lines):
+    """
+    Yields the header, title and lines of each job of a Gaussian output with several jobs
+    chained with --Link1--. The steps that Gaussian adds to a job (i.e. the Freq step of
+    opt freq, which reads the geometry with Geom=AllCheck) are kept in the same job.
+    """
+
+    header, job_lines, step_lines, title = [], None, None, None
+    for line in lines:
+        # the lines above the first route section are used as header of all the jobs
+        if job_lines is None:
+            if line.startswith(" #"):
+                job_lines = [header.pop(), line]
+            else:
+                header.append(line)
+            continue
+
+        # the route of each new step shows whether a new job starts
+        if step_lines is not None:
+            step_lines.append(line)
+            if line.startswith(" #"):
+                if line.lower().find("geom=allcheck") > -1:
+                    job_lines.extend(step_lines)
+                else:
+                    yield header, title, job_lines
+                    job_lines, title = step_lines, None
+                step_lines = None
+            continue
+
+        if line.startswith(" Link1:  Proceeding to internal job step number"):
+            step_lines = [line]
+            continue
+
+        job_lines.append(line)
+        # the title is the first section between dashes after the route
+        if (
+            title is None
+            and len(job_lines) >= 3
+            and is_dashes_line(job_lines[-1])
+            and is_dashes_line(job_lines[-3])
+            and not is_dashes_line(job_lines[-2])
+            and not job_lines[-2].startswith(" #")
+        ):
+            title = job_lines[-2].strip()
+
+    if job_lines is not None:
+        if step_lines is not None:
+            job_lines.extend(step_lines)
+        yield header, title, job_lines
+
+
+def get_orca_job_header(header, input_lines, end_line):
+    """
+    Header of a job of an ORCA output with several jobs, with its part of the input file
+    numbered from 1 (as in the outputs with one job)
+    """
+
+    job_header = list(header)
+    for n_line, line in enumerate(input_lines + [end_line], start=1):
+        job_header.append(f"|{n_line:3}>{line.split('>', 1)[1]}")
+
+    return job_header
+
+
+def iter_orca_jobs(lines):
+    """
+    Yields the header, title and lines of each job of an ORCA output with several jobs
+    separated by $new_job. The header of each job only contains its part of the input
+    file, and the title is the first comment of that part (i.e. # NAME from QPREP).
+    """
+
+    header, input_jobs, end_line = [], [[]], None
+    job_lines, titles, n_job, job_error = None, {}, 0, False
+    for line in lines:
+        # the input file is printed at the beginning of the output, with all the jobs
+        if job_lines is None:
+            if line.startswith("|") and line.find(">") > -1:
+                input_line = line.split(">", 1)[1].strip()
+                if input_line.find("****END OF INPUT****") > -1:
+                    end_line = line
+                    job_lines = []
+                elif input_line.lower().startswith("$new_job"):
+                    input_jobs.append([])
+                else:
+                    input_jobs[-1].append(line)
+                    if input_line.startswith("#") and len(input_jobs) - 1 not in titles:
+                        titles[len(input_jobs) - 1] = input_line[1:].strip()
+            elif end_line is None and len(input_jobs[0]) == 0:
+                header.append(line)
+            continue
+
+        if line.find("JOB NUMBER") > -1 and line.find("$$$") > -1:
+            # ORCA only prints the normal termination at the end of the run, so it's added to the
+            # jobs followed by another job (unless the job shows an error)
+            job_header = get_orca_job_header(header, input_jobs[min(n_job, len(input_jobs) - 1)], end_line)
+            if not job_error:
+                job_lines.append("\n                             ****ORCA TERMINATED NORMALLY****\n")
+            yield job_header, titles.get(n_job), job_lines
+            job_lines, n_job, job_error = [line], n_job + 1, False
+            continue
+
+        job_lines.append(line)
+        if not job_error and orca_error_pattern.search(line) is not None:
+            job_error = True
+
+    if job_lines is not None:
+        job_header = get_orca_job_header(header, input_jobs[min(n_job, len(input_jobs) - 1)], end_line)
+        yield job_header, titles.get(n_job), job_lines
+
+
+def get_job_name(title, file_name, n_job, used_names):
+    """
+    Name of the file of a job from a packed input or output: the title of the job, or
+    FILE_job_N if the title isn't valid or is repeated
+    """
+
+    if title is None or title in used_names or re.fullmatch(r"[\w\-\.]+", title) is None:
+        return f"{file_name}_job_{n_job}"
+
+    return title
+
+
+def get_packed_input(file):
+    """
+    Returns the input file of an output (FILE.com, FILE.gjf or FILE.inp in the same folder)
+    if it contains several jobs (None otherwise)
+    """
+
+    file_name = os.path.basename(Path(file)).split(".")[0]
+    for extension in [".com", ".gjf", ".inp"]:
+        input_file = Path(file).parent.joinpath(f"{file_name}{extension}")
+        if os.path.exists(input_file):
+            if len(split_packed_input(input_file)) > 1:
+                return input_file
+            return None
+
+    return None
+
+
+def split_packed_input(file):
+    """
+    Returns the title and the text of each job of a Gaussian (jobs separated by --Link1--)
+    or ORCA (jobs separated by $new_job) input file. The titles are the title section
+    (Gaussian) or the first comment (ORCA) of each job, as written by QPREP.
+    """
+
+    with open_file(file) as F:
+        input_text = F.read()
+
+    input_jobs = []
+    if str(file).lower().endswith(".inp"):
+        for job_text in re.split(r"\n[ \t]*\$new_job[ \t]*\n", input_text, flags=re.IGNORECASE):
+            title = None
+            for line in job_text.split("\n"):
+                if line.strip().startswith("#"):
+                    title = line.strip()[1:].strip()
+                    break
+            input_jobs.append((title, f"{job_text.strip()}\n"))
+    else:
+        for job_text in re.split(r"^--link1--[ \t]*\n", input_text, flags=re.IGNORECASE | re.MULTILINE):
+            # the title is the first line after the blank line that ends the route section
+            title, route_found, route_end = None, False, False
+            for line in job_text.split("\n"):
+                if not route_found:
+                    route_found = line.strip().startswith("#")
+                elif not route_end:
+                    route_end = line.strip() == ""
+                elif line.strip() != "":
+                    title = line.strip()
+                    break
+            input_jobs.append((title, f"{job_text.strip()}\n\n"))
+
+    return input_jobs
+
+
+def split_packed_output(file, destination=None, min_jobs=2):
+    """
+    Splits a Gaussian or ORCA output with several jobs (i.e. from the pack_inputs option of
+    QPREP) into one output file per job, named as the title of each job (or FILE_job_N if the
+    title isn't valid or is repeated). The output is read once and only one job is kept in
+    memory at a time. Returns the list of files created (empty if the output has fewer jobs
+    than min_jobs).
+
+    Parameters
+    ----------
+    file : str
+        Output file
+    destination : str or Path, default=None
+        Folder where the new output files are created (by default, the folder of the file)
+    min_jobs : int, default=2
+        Minimum number of jobs of the outputs that are split (1 is used for outputs of packed
+        inputs, since the jobs after an error termination are never run)
+    """
+
+    if destination is None:
+        destination = Path(file).parent
+    destination = Path(destination)
+    file_name = os.path.basename(file).split(".")[0]
+    extension = os.path.basename(file).split(".")[1]
+
+    with open_file(file) as F:
+        # detect the program from the first lines
+        first_lines = list(islice(F, 200))
+        if any(line.find("Gaussian, Inc.") > -1 for line in first_lines):
+            job_iter = iter_gaussian_jobs(chain(first_lines, F))
+        elif any(line.find("O   R   C   A") > -1 for line in first_lines):
+            job_iter = iter_orca_jobs(chain(first_lines, F))
+        else:
+            return []
+
+        # the first jobs are only written when the output has enough jobs
+        first_jobs = list(islice(job_iter, min_jobs))
+        if len(first_jobs) == 0 or len(first_jobs) < min_jobs:
+            return []
+
+        split_files, used_names = [], set()
+        for n_job, (header, title, job_lines) in enumerate(chain(first_jobs, job_iter), start=1):
+            job_name = get_job_name(title, file_name, n_job, used_names)
+            used_names.add(job_name)
+            split_file = destination.joinpath(f"{job_name}.{extension}")
+            with open(split_file, "w") as split_output:
+                split_output.writelines(header)
+                split_output.writelines(job_lines)
+            split_files.append(split_file.as_posix())
+
+    return split_files
+
+
+# files with the data of previous calculations that are reused in the restart inputs
+restart_extensions = {"gaussian": ".chk", "orca": ".gbw"}
+
+
+def get_restart_file(file, program):
+    """
+    Returns the checkpoint (Gaussian) or wavefunction (ORCA) file of a calculation, placed in
+    the same folder as the output file with the same name (None if the file doesn't exist)
+    """
+
+    file_name = os.path.basename(Path(file)).split(".")[0]
+    restart_file = Path(file).parent.joinpath(f"{file_name}{restart_extensions[program]}")
+    if os.path.exists(restart_file):
+        return restart_file
+
+    return None
+
+
+def add_restart_keywords(keywords_line, program, restart_name, read_fc=True):
+    """
+    Adapts the keywords line of an input to reuse the data of a previous calculation:
+    1. Gaussian: the initial guess is read from the checkpoint and, if read_fc is True, the
+    OPT jobs read the force constants (replacing CalcFC) instead of starting from a new Hessian
+    2. ORCA: the initial orbitals are read from the previous GBW file
+    """
+
+    if program == "gaussian":
+        new_keywords = []
+        guess_found = False
+        for keyword in keywords_line.split():
+            if keyword.lower().startswith("guess"):
+                guess_found = True
+            elif read_fc and re.match(r"^opt(=|\(|$)", keyword.lower()):
+                opt_options = re.sub(r"^opt=?", "", keyword, flags=re.IGNORECASE).strip("()")
+                opt_options = [option for option in opt_options.split(",") if option != ""]
+                if "readfc" not in [option.lower() for option in opt_options] and "calcall" not in [option.lower() for option in opt_options]:
+                    opt_options = ["readfc"] + [option for option in opt_options if option.lower() != "calcfc"]
+                if len(opt_options) == 1:
+                    keyword = f"{keyword[:3]}={opt_options[0]}"
+                elif len(opt_options) > 1:
+                    keyword = f"{keyword[:3]}=({','.join(opt_options)})"
+            new_keywords.append(keyword)
+        if not guess_found:
+            new_keywords.append("guess=read")
+        keywords_line = " ".join(new_keywords)
+
+    elif program == "orca":
+        keywords_lines = keywords_line.split("\n")
+        if keywords_line.lower().find("moread") == -1:
+            keywords_lines[0] = f"{keywords_lines[0].rstrip()} MORead"
+        keywords_lines.insert(1, f'%moinp "{restart_name}"')
+        keywords_line = "\n".join(keywords_lines)
+
+    return keywords_line
+
 
 def get_cclib_params(cclib_data, errortype):
     """
@@ -671,3 +1454,584 @@ def get_cclib_params(cclib_data, errortype):
         ro_dup = None
     
     return E_dup, H_dup, G_dup, ro_dup, errortype
+
+
+class DuplicateIndex:
+    """
+    Index with the E, H, G and rotational constants of the calculations that finished
+    successfully, used to detect duplicated calculations. The index is loaded once
+    per QCORR run and it is saved in a CSV file next to the success folder, so only
+    the JSON files that are new (or that changed) are read in the following runs.
+    The entries are sorted by energy, so the candidates are found with a range search
+    instead of comparing against all the previous calculations.
+
+    Parameters
+    ----------
+    destination_json : Path
+        Folder with the JSON files of the successful calculations (success/json_files)
+    """
+
+    index_name = "QCORR_duplicate_index.csv"
+
+    def __init__(self, destination_json):
+        self.destination_json = Path(destination_json)
+        self.index_file = self.destination_json.parent.parent.joinpath(self.index_name)
+        # entries sorted by energy: (E, H, G, RO constants, file, JSON modification time)
+        self.energies, self.entries = [], []
+
+        previous_entries = {}
+        if os.path.exists(self.index_file):
+            try:
+                df_index = pd.read_csv(self.index_file, keep_default_na=False)
+                for _, row in df_index.iterrows():
+                    ro_dup = None
+                    if row["RO_constant"] != "":
+                        ro_dup = [float(ro) for ro in str(row["RO_constant"]).split()]
+                    previous_entries[str(row["File"])] = (float(row["Energies"]), float(row["Enthalpies"]), float(row["Gibbs"]), ro_dup, str(row["JSON_mtime"]))
+            except (KeyError, ValueError, pd.errors.ParserError, pd.errors.EmptyDataError):
+                previous_entries = {}
+
+        # only the JSON files that are not in the index (or were modified) are read
+        for previous_json in get_json_files(self.destination_json):
+            json_name = os.path.basename(previous_json)
+            json_mtime = str(get_file_mtime(previous_json))
+            if json_name in previous_entries and previous_entries[json_name][4] == json_mtime:
+                E_json, H_json, G_json, ro_json, _ = previous_entries[json_name]
+                name_json = json_name.split(".json")[0]
+            else:
+                with open_file(previous_json) as json_file:
+                    cclib_data_json = json.load(json_file)
+                E_json, H_json, G_json, ro_json, _ = get_cclib_params(cclib_data_json, "none")
+                name_json = cclib_data_json["name"]
+            self.add(name_json, E_json, H_json, G_json, ro_json, json_file=json_name, json_mtime=json_mtime)
+
+    def add(self, file_name, E_dup, H_dup, G_dup, ro_dup, json_file=None, json_mtime=None):
+        """
+        Adds a calculation to the index (keeping the entries sorted by energy)
+        """
+
+        idx = bisect.bisect_right(self.energies, E_dup)
+        self.energies.insert(idx, E_dup)
+        self.entries.insert(idx, (E_dup, H_dup, G_dup, ro_dup, file_name, json_file, json_mtime))
+
+    def find_duplicate(self, E_dup, H_dup, G_dup, ro_dup, dup_threshold, ro_threshold):
+        """
+        Returns the name of the calculation duplicated (None if there are no duplicates)
+        """
+
+        if ro_dup is None:
+            return None
+        dup_threshold = abs(float(dup_threshold))
+        dup_off = None
+        min_E_diff = None
+        # only the calculations inside the energy window are compared
+        start = bisect.bisect_right(self.energies, E_dup - dup_threshold)
+        end = bisect.bisect_left(self.energies, E_dup + dup_threshold)
+        for E_json, H_json, G_json, ro_json, file_json, _, _ in self.entries[start:end]:
+            E_diff = abs(E_dup - E_json)
+            if max([E_diff, abs(H_dup - H_json), abs(G_dup - G_json)]) < dup_threshold and ro_json is not None:
+                ro_diff = np.linalg.norm(np.array(ro_dup) - np.array(ro_json))
+                if ro_diff < ro_threshold and (min_E_diff is None or E_diff < min_E_diff):
+                    dup_off = file_json
+                    min_E_diff = E_diff
+
+        return dup_off
+
+    def save(self):
+        """
+        Stores the entries of the calculations with JSON files in the success folder
+        """
+
+        if not os.path.exists(self.destination_json):
+            return
+        index_rows = []
+        for E_json, H_json, G_json, ro_json, file_json, json_file, json_mtime in self.entries:
+            if json_file is None:
+                json_file = f"{file_json}.json"
+                if not os.path.exists(self.destination_json.joinpath(json_file)):
+                    json_file += ".gz"
+            json_path = self.destination_json.joinpath(json_file)
+            # calculations analyzed in this run that didn't end in the success folder are discarded
+            if not os.path.exists(json_path):
+                continue
+            if json_mtime is None:
+                json_mtime = str(os.stat(json_path).st_mtime_ns)
+            ro_txt = "" if ro_json is None else " ".join([str(ro) for ro in ro_json])
+            index_rows.append([json_file, E_json, H_json, G_json, ro_txt, json_mtime])
+        df_index = pd.DataFrame(index_rows, columns=["File", "Energies", "Enthalpies", "Gibbs", "RO_constant", "JSON_mtime"])
+        df_index.to_csv(self.index_file, index=False)
+
+
+class ResultsStore:
+    """
+    SQLite database with the data parsed from the QM calculations that finished
+    successfully (metadata, energies, thermochemistry, frequencies, coordinates and
+    NMR tensors). The database is indexed by name, level of theory and energy, so the
+    results can be queried without reading the JSON files, and the full cclib data is
+    also stored to export the results as JSON files.
+
+    Parameters
+    ----------
+    db_file : str
+        Database file (it is created if it doesn't exist)
+    """
+
+    db_name = "QCORR_results.db"
+    columns = {
+        "name": "TEXT PRIMARY KEY",
+        "folder": "TEXT",
+        "program": "TEXT",
+        "functional": "TEXT",
+        "basis_set": "TEXT",
+        "level_of_theory": "TEXT",
+        "grid_type": "TEXT",
+        "dispersion": "TEXT",
+        "solvation": "TEXT",
+        "state": "TEXT",
+        "charge": "INTEGER",
+        "mult": "INTEGER",
+        "n_atoms": "INTEGER",
+        "energy": "REAL",
+        "enthalpy": "REAL",
+        "free_energy": "REAL",
+        "frequencies": "TEXT",
+        "elements": "TEXT",
+        "coords": "TEXT",
+        "nmr": "TEXT",
+        "cclib_json": "TEXT",
+    }
+
+    def __init__(self, db_file):
+        self.db_file = str(db_file)
+        self.connection = sqlite3.connect(self.db_file)
+        columns_txt = ", ".join([f"{column} {col_type}" for column, col_type in self.columns.items()])
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS calcs ({columns_txt})")
+        for column in ["level_of_theory", "energy"]:
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS idx_{column} ON calcs ({column})")
+        self.connection.commit()
+
+    def add(self, name, cclib_data, folder="", cclib_json=None):
+        """
+        Adds (or replaces) the data of a calculation. If cclib_json is included, that
+        text is stored as the JSON file of the calculation.
+        """
+
+        program, grid_type, level_of_theory, dispersion, solvation = get_fullcheck_props(cclib_data)
+        energies = cclib_data["properties"].get("energy", {})
+        energy = energies.get("total")
+        if energy is not None:
+            # in eV, converted to hartree using the conversion factor from cclib
+            energy = cclib.parser.utils.convertor(energy, "eV", "hartree")
+        frequencies = cclib_data.get("vibrations", {}).get("frequencies")
+        nmr = cclib_data["properties"].get("NMR")
+
+        values = {
+            "name": name,
+            "folder": str(folder),
+            "program": program,
+            "functional": cclib_data["metadata"]["functional"],
+            "basis_set": cclib_data["metadata"]["basis set"],
+            "level_of_theory": level_of_theory,
+            "grid_type": grid_type,
+            "dispersion": dispersion,
+            "solvation": solvation,
+            "state": cclib_data["metadata"].get("ground or transition state"),
+            "charge": cclib_data["properties"].get("charge"),
+            "mult": cclib_data["properties"].get("multiplicity"),
+            "n_atoms": cclib_data["properties"].get("number of atoms"),
+            "energy": energy,
+            "enthalpy": cclib_data["properties"].get("enthalpy"),
+            "free_energy": energies.get("free energy"),
+            "frequencies": None if frequencies is None else json.dumps(frequencies),
+            "elements": json.dumps(cclib_data["atoms"]["elements"]["number"]),
+            "coords": json.dumps(cclib_data["atoms"]["coords"]["3d"]),
+            "nmr": None if nmr is None else json.dumps(nmr),
+            "cclib_json": json.dumps(cclib_data) if cclib_json is None else cclib_json,
+        }
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO calcs ({', '.join(values)}) VALUES ({', '.join(['?'] * len(values))})",
+            list(values.values()),
+        )
+
+    def query(self, where="", params=(), columns=None):
+        """
+        Returns a DataFrame with the calculations that match an SQL condition
+        (i.e. where="level_of_theory = ? AND energy < ?", params=("wB97XD/def2SVP", -40.5))
+        """
+
+        if columns is None:
+            columns = [column for column in self.columns if column != "cclib_json"]
+        sql_query = f"SELECT {', '.join(columns)} FROM calcs"
+        if where != "":
+            sql_query += f" WHERE {where}"
+
+        return pd.read_sql_query(sql_query, self.connection, params=params)
+
+    def get_fullcheck_props(self, names, chunk_size=500):
+        """
+        Returns the parameters used in full_check() for the calculations stored (by name).
+        The names are queried in chunks through the primary key (SQLite limits the number
+        of parameters of each query).
+        """
+
+        fullcheck_props = {}
+        names = list(dict.fromkeys(names))
+        for start in range(0, len(names), chunk_size):
+            chunk = names[start:start + chunk_size]
+            rows = self.connection.execute(
+                "SELECT name, program, grid_type, level_of_theory, dispersion, solvation FROM calcs "
+                f"WHERE name IN ({','.join(['?'] * len(chunk))})",
+                chunk,
+            )
+            for row in rows:
+                fullcheck_props[row[0]] = row[1:]
+
+        return fullcheck_props
+
+    def get_json_data(self, name):
+        """
+        Returns the cclib data of a calculation (None if the calculation is not stored)
+        """
+
+        row = self.connection.execute("SELECT cclib_json FROM calcs WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+
+        return json.loads(row[0])
+
+    def export_json(self, destination, names=None, compress=False):
+        """
+        Writes the JSON files of the calculations stored (same files as in the json_files
+        folders from QCORR). Returns the list of JSON files created.
+        """
+
+        destination = Path(destination)
+        destination.mkdir(exist_ok=True, parents=True)
+        json_files = []
+        for name, cclib_json in self.connection.execute("SELECT name, cclib_json FROM calcs ORDER BY name"):
+            if names is not None and name not in names:
+                continue
+            json_file = destination.joinpath(f"{name}.json")
+            if compress:
+                json_file = destination.joinpath(f"{name}.json.gz")
+            with open_file(json_file, "w") as F:
+                F.write(dump_json(json.loads(cclib_json)))
+            json_files.append(str(json_file))
+
+        return json_files
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+def get_file_signature(file):
+    """
+    Returns the size and the modification time (in ns) of a file
+    """
+
+    file_stat = os.stat(file)
+
+    return file_stat.st_size, file_stat.st_mtime_ns
+
+
+def get_file_hash(file, block_size=1048576):
+    """
+    Returns the SHA-256 hash of the content of a file (read by blocks)
+    """
+
+    file_hash = hashlib.sha256()
+    with open(file, "rb") as F:
+        for block in iter(lambda: F.read(block_size), b""):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+class OutputManifest:
+    """
+    Manifest with the output files analyzed by QCORR (name, size, modification time,
+    content hash and result of the analysis), used in incremental mode to analyze only
+    the files that are new or that changed. The manifest is saved in a CSV file next
+    to the success folder.
+
+    Parameters
+    ----------
+    manifest_dir : Path
+        Folder that contains the success folder
+    """
+
+    manifest_name = "QCORR_manifest.csv"
+    columns = ["File", "Size", "Mtime", "Hash", "Termination", "Error type", "Run", "Restart file"]
+
+    def __init__(self, manifest_dir):
+        self.manifest_file = Path(manifest_dir).joinpath(self.manifest_name)
+        self.entries = {}
+        if os.path.exists(self.manifest_file):
+            df_manifest = pd.read_csv(self.manifest_file, dtype=str, keep_default_na=False)
+            for row in df_manifest.to_dict("records"):
+                self.entries[row["File"]] = row
+        # signatures of the files selected for the analysis
+        self.new_files = {}
+
+    def select_new_files(self, files):
+        """
+        Returns the files that are not in the manifest or that changed since they were analyzed.
+        The hash is only calculated when the size or the modification time are different.
+        """
+
+        selected_files = []
+        for file in files:
+            file_name = os.path.basename(file)
+            size, mtime = get_file_signature(file)
+            entry = self.entries.get(file_name)
+            if entry is not None and entry["Size"] == str(size):
+                if entry["Mtime"] == str(mtime):
+                    continue
+                file_hash = get_file_hash(file)
+                if entry["Hash"] == file_hash:
+                    # same content (i.e. copied again), only the modification time is updated
+                    entry["Mtime"] = str(mtime)
+                    continue
+            else:
+                file_hash = get_file_hash(file)
+            self.new_files[file_name] = [str(size), str(mtime), file_hash]
+            selected_files.append(file)
+
+        return selected_files
+
+    def add(self, file, termination, errortype, round_num, restart_file=""):
+        """
+        Adds the result of the analysis of a file selected with select_new_files(), including
+        the checkpoint file reused in the input created to fix the calculation (if any)
+        """
+
+        file_name = os.path.basename(file)
+        if file_name not in self.new_files:
+            return
+        size, mtime, file_hash = self.new_files[file_name]
+        self.entries[file_name] = dict(
+            zip(self.columns, [file_name, size, mtime, file_hash, termination, errortype, str(round_num), restart_file])
+        )
+
+    def save(self):
+        df_manifest = pd.DataFrame(list(self.entries.values()), columns=self.columns)
+        df_manifest.to_csv(self.manifest_file, index=False)
+
+
+# data of each calculation used in the cost report and ranges of molecule sizes used to group them
+cost_record_columns = [
+    "File",
+    "Program",
+    "Level of theory",
+    "Number of atoms",
+    "CPU time (s)",
+    "Wall time (s)",
+    "SCF cycles",
+    "Opt steps",
+    "Processors",
+    "Memory (MB)",
+]
+cost_size_bins = [0, 10, 25, 50, 100, 200, np.inf]
+cost_size_labels = ["1-10", "11-25", "26-50", "51-100", "101-200", ">200"]
+# memory units used in Gaussian and ORCA (in MB, Gaussian uses 8-byte words by default)
+mem_units = {"kb": 0.001, "mb": 1, "gb": 1000, "tb": 1000000, "kw": 0.008, "mw": 8, "gw": 8000, "": 0.000008}
+
+
+def get_size_label(n_atoms):
+    """
+    Returns the range of molecule sizes of the cost reports (cost_size_labels) that contains n_atoms
+    """
+
+    size_idx = int(np.searchsorted(cost_size_bins, n_atoms, side="left")) - 1
+
+    return cost_size_labels[max(size_idx, 0)]
+
+
+def mem_to_mb(mem):
+    """
+    Converts the memory of QM calculations to MB (i.e. 16GB or %maxcore values from ORCA). Returns None
+    if the memory isn't recognized
+    """
+
+    mem_match = re.match(r"\s*([\d.]+)\s*([a-zA-Z]*)\s*$", str(mem))
+    if mem_match is None or mem_match.group(2).lower() not in mem_units:
+        return None
+
+    return float(mem_match.group(1)) * mem_units[mem_match.group(2).lower()]
+
+
+def mb_to_mem(mem_mb):
+    """
+    Converts memory in MB to the format used in the mem option of QPREP (i.e. 16GB)
+    """
+
+    mem_mb = int(round(mem_mb))
+    if mem_mb >= 1000 and mem_mb % 1000 == 0:
+        return f"{mem_mb // 1000}GB"
+
+    return f"{mem_mb}MB"
+
+
+def get_cost_data(file_name, cclib_data):
+    """
+    Gets the computational cost of a calculation (CPU and wall times, SCF cycles, optimization steps
+    and resources used) from the data parsed in QCORR
+    """
+
+    metadata = cclib_data["metadata"]
+    program = "gaussian"
+    if metadata["QM program"].lower().find("orca") > -1:
+        program = "orca"
+
+    # level of theory, from the keywords line when the functional and basis set aren't available
+    if "functional" in metadata and "basis set" in metadata:
+        level_of_theory = f'{metadata["functional"]}/{metadata["basis set"]}'
+    else:
+        level_of_theory = metadata.get("keywords line", "").split("\n")[0].strip()
+
+    n_atoms = cclib_data.get("properties", {}).get("number of atoms")
+    if n_atoms is None:
+        n_atoms = len(cclib_data["atoms"]["elements"]["number"])
+
+    optimization = cclib_data.get("optimization", {})
+    # the SCF cycles are only printed by some programs (i.e. ORCA or Gaussian with #p)
+    scf_cycles = None
+    if "values" in optimization.get("scf", {}):
+        scf_cycles = sum(len(scf_values) for scf_values in optimization["scf"]["values"])
+    opt_steps = len(optimization.get("geometric values", []))
+
+    try:
+        processors = int(metadata["processors"])
+    except (KeyError, ValueError):
+        processors = None
+
+    return dict(
+        zip(
+            cost_record_columns,
+            [
+                file_name,
+                program,
+                level_of_theory,
+                n_atoms,
+                metadata.get("cpu time"),
+                metadata.get("wall time"),
+                scf_cycles,
+                opt_steps,
+                processors,
+                mem_to_mb(metadata.get("memory")),
+            ],
+        )
+    )
+
+
+def get_cost_report(cost_records):
+    """
+    Aggregates the cost of the calculations analyzed per program, level of theory and molecule size
+    (number of atoms). The times are averaged, while the resources used are the median number of
+    processors and the maximum memory of each group.
+    """
+
+    df_cost = pd.DataFrame(cost_records, columns=cost_record_columns)
+    df_cost = df_cost.astype({column: float for column in cost_record_columns[3:]})
+    df_cost["Level of theory"] = df_cost["Level of theory"].fillna("")
+    df_cost["Atoms"] = pd.cut(df_cost["Number of atoms"], bins=cost_size_bins, labels=cost_size_labels)
+
+    cost_report = df_cost.groupby(["Program", "Level of theory", "Atoms"], observed=True).agg(
+        **{
+            "Calculations": ("File", "count"),
+            "Mean atoms": ("Number of atoms", "mean"),
+            "Mean CPU time (h)": ("CPU time (s)", lambda times: times.mean() / 3600),
+            "Mean wall time (h)": ("Wall time (s)", lambda times: times.mean() / 3600),
+            "Mean SCF cycles": ("SCF cycles", "mean"),
+            "Mean opt steps": ("Opt steps", "mean"),
+            "Processors": ("Processors", "median"),
+            "Memory (MB)": ("Memory (MB)", "max"),
+        }
+    )
+
+    return cost_report.reset_index().round(3)
+
+
+def select_cost_rows(cost_report, program, qm_input, n_atoms, columns):
+    """
+    Selects the rows of a cost report that describe a new calculation: the calculations with the
+    same program and level of theory (all the calculations of the program if the level of theory
+    wasn't analyzed) and the closest range of molecule sizes (the larger range if there is a tie).
+    Only the rows with data in columns are used. Returns None when there is no data.
+    """
+
+    rows = cost_report[cost_report["Program"] == program.lower()]
+    rows = rows.dropna(subset=columns)
+
+    # the level of theory is found when all its keywords are used in the new keywords line
+    input_keywords = set(re.split(r"[\s/]+", qm_input.lower().strip()))
+    same_level = rows["Level of theory"].apply(
+        lambda level: pd.notna(level)
+        and len(str(level).strip()) > 0
+        and set(re.split(r"[\s/]+", str(level).lower().strip())) <= input_keywords
+    )
+    if same_level.any():
+        rows = rows[same_level]
+    if len(rows) == 0:
+        return None
+
+    size_idx = cost_size_labels.index(
+        str(pd.cut([n_atoms], bins=cost_size_bins, labels=cost_size_labels)[0])
+    )
+    row_idx = rows["Atoms"].astype(str).apply(cost_size_labels.index)
+    size_distance = (row_idx - size_idx).abs()
+    closest_idx = row_idx[size_distance == size_distance.min()].max()
+
+    return rows[row_idx == closest_idx]
+
+
+def suggest_resources(cost_report, program, qm_input, n_atoms):
+    """
+    Suggests the number of processors and memory of a new calculation from a cost report of QCORR,
+    using the calculations selected with select_cost_rows(). Returns None when there is no data.
+
+    Parameters
+    ----------
+    cost_report : pd.DataFrame
+        Cost report created with get_cost_report()
+    program : str
+        Program of the new calculation ('gaussian' or 'orca')
+    qm_input : str
+        Keywords line of the new calculation (i.e. 'B3LYP/6-31G opt freq')
+    n_atoms : int
+        Number of atoms of the system
+
+    Returns
+    -------
+    nprocs : int
+        Number of processors suggested
+    mem : str
+        Memory suggested (i.e. '16GB')
+    """
+
+    selected_rows = select_cost_rows(cost_report, program, qm_input, n_atoms, ["Processors", "Memory (MB)"])
+    if selected_rows is None:
+        return None
+
+    nprocs = int(round(selected_rows["Processors"].median()))
+    mem = mb_to_mem(selected_rows["Memory (MB)"].max())
+
+    return nprocs, mem
+
+
+def estimate_wall_time(cost_report, program, qm_input, n_atoms):
+    """
+    Estimates the wall time (in hours) of a new calculation from a cost report of QCORR, using the
+    calculations selected with select_cost_rows(). The mean wall time is scaled with the cube of the
+    number of atoms (relative to the mean number of atoms of the calculations). Returns None when
+    there is no data.
+    """
+
+    selected_rows = select_cost_rows(cost_report, program, qm_input, n_atoms, ["Mean wall time (h)", "Mean atoms"])
+    if selected_rows is None:
+        return None
+
+    scaled_times = selected_rows["Mean wall time (h)"] * (n_atoms / selected_rows["Mean atoms"]) ** 3
+
+    return float(scaled_times.mean())
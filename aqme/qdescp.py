@@ -103,8 +103,10 @@ from aqme.utils import (
     check_files,
     check_dependencies,
     set_destination,
-    load_sdf
+    load_sdf,
+    get_sdf_index
 )
+from aqme.ensemble import ensemble_to_sdf, ens_extension
 from aqme.qdescp_utils import (
     assign_prefix_atom_props,
     get_rdkit_properties,
@@ -245,10 +247,13 @@ class qdescp:
             self.args.log.write(f'\nx  No files were found! Please provide the correct PATH to your input files (i.e. --files "*.sdf")')
             valid_input = False
         else:
-            if os.path.basename(self.args.files[0]).split('.')[-1].lower() != "sdf":
-                self.args.log.write(f"\nx  The format used ({os.path.basename(self.args.files[0]).split('.')[-1]}) is not compatible with the 'files' option! Formats accepted: sdf")
+            if os.path.basename(self.args.files[0]).split('.')[-1].lower() not in ["sdf", "ens"]:
+                self.args.log.write(f"\nx  The format used ({os.path.basename(self.args.files[0]).split('.')[-1]}) is not compatible with the 'files' option! Formats accepted: sdf, ens")
                 valid_input = False
             qdescp_files = self.args.files
+            # the SDF files of binary ensemble stores are only generated when they are needed
+            if valid_input:
+                qdescp_files = [ensemble_to_sdf(file) if os.path.splitext(file)[1].lower() == ens_extension else file for file in qdescp_files]
 
         if not valid_input:
             self.args.log.finalize()
@@ -1233,20 +1238,18 @@ class qdescp:
         unique_smiles = []
         for file in self.args.files:
             smi = None
-            with open(file, "r") as F:
-                lines = F.readlines()
-                smi_exist = False
-                for i, line in enumerate(lines):
-                    if ">  <SMILES>" in line:
-                        smi = lines[i + 1].split()[0]
-                        if smi not in unique_smiles:
-                            unique_smiles.append(smi)
-                            unique_files.append(file)
-                            smi_exist = True
-                if smi_exist:
-                    continue
-                elif smi is not None:
-                    self.args.log.write(f'x  WARNING! "{os.path.basename(file)}" will not be calculated since it has the same SMILES as "{os.path.basename(unique_files[unique_smiles.index(smi)])}"')
+            smi_exist = False
+            for smi_sdf in get_sdf_index(file).smiles:
+                if smi_sdf is not None:
+                    smi = smi_sdf.split()[0]
+                    if smi not in unique_smiles:
+                        unique_smiles.append(smi)
+                        unique_files.append(file)
+                        smi_exist = True
+            if smi_exist:
+                continue
+            elif smi is not None:
+                self.args.log.write(f'x  WARNING! "{os.path.basename(file)}" will not be calculated since it has the same SMILES as "{os.path.basename(unique_files[unique_smiles.index(smi)])}"')
 
         if not unique_smiles:
             unique_files = self.args.files
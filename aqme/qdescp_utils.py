@@ -16,7 +16,7 @@ from rdkit.Chem import Descriptors
 import warnings
 warnings.filterwarnings('ignore')
 from morfeus import SASA, Dispersion, BuriedVolume, ConeAngle, SolidAngle, Pyramidalization, read_xyz, read_geometry
-from aqme.utils import load_sdf, periodic_table
+from aqme.utils import load_sdf, periodic_table, get_sdf_index
 
 GAS_CONSTANT = 8.3144621  # J / K / mol
 J_TO_AU = 4.184 * 627.509541 * 1000.0  # UNIT CONVERSION
@@ -1365,20 +1365,17 @@ def get_mols_qdescp(qdescp_files):
     
     mol_list = []
     for file in qdescp_files:
-        with open(file, "r") as F:
-            lines = F.readlines()
-            smi_exist = False
-            for i, line in enumerate(lines):
-                if ">  <SMILES>" in line:
-                    smi = lines[i + 1].split()[0]
-                    mol_indiv = Chem.AddHs(Chem.MolFromSmiles(smi))
-                    mol_list.append(mol_indiv)
-                    smi_exist = True
-                    break
-            if not smi_exist:
-                mols = load_sdf(file)
-                mol_indiv = mols[0]
+        smi_exist = False
+        for smi in get_sdf_index(file).smiles:
+            if smi is not None:
+                mol_indiv = Chem.AddHs(Chem.MolFromSmiles(smi.split()[0]))
                 mol_list.append(mol_indiv)
+                smi_exist = True
+                break
+        if not smi_exist:
+            mols = load_sdf(file)
+            mol_indiv = mols[0]
+            mol_list.append(mol_indiv)
     
     return mol_list
 
@@ -1389,15 +1386,12 @@ def get_mol_assign(name_initial):
     '''
 
     sdf_file = f'{name_initial}.sdf'
-    with open(sdf_file, "r") as F:
-        lines = F.readlines()
 
     smi_exist = False
-    for i, line in enumerate(lines):
-        if ">  <SMILES>" in line:
-            smi = lines[i + 1].split()[0]
-            mol = Chem.AddHs(Chem.MolFromSmiles(smi))
-            smi_exist = True
+    smiles = [smi for smi in get_sdf_index(sdf_file).smiles if smi is not None]
+    if len(smiles) > 0:
+        mol = Chem.AddHs(Chem.MolFromSmiles(smiles[-1].split()[0]))
+        smi_exist = True
     if not smi_exist:
         mols = load_sdf(sdf_file)
         mol = mols[0]
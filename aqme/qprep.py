@@ -3,8 +3,10 @@ Parameters
 ----------
    files : mol object, str or list of str, default=None
       This module prepares input QM file(s). Formats accepted: mol object(s), 
-      Gaussian or ORCA LOG/OUT output files, JSON, XYZ, SDF, PDB. Also, 
+      Gaussian or ORCA LOG/OUT output files, JSON, XYZ, SDF, ENS, PDB. Also, 
       lists can be used (i.e. [FILE1.log, FILE2.log] or \*.FORMAT such as \*.json).
+      LOG/OUT and JSON files compressed with gzip, xz or bzip2 are read directly 
+      (i.e. FILE.log.gz or FILE.out.xz), as well as the files of ZIP/TAR bundles (see bundle).
    atom_types : list of str, default=[]
       (If files is None) List containing the atoms of the system
    cartesians : list of str, default=[]
@@ -43,6 +45,11 @@ Parameters
       Memory for the QM calculations (i) Gaussian: total memory; (ii) ORCA: memory per processor
    nprocs : int, default=None
       Number of processors used in the QM calculations
+   cost_report : str, default=''
+      Cost report created by QCORR (QCORR-run_X-cost.csv) used to suggest nprocs and mem 
+      for each input file. The resources are taken from the calculations analyzed with the 
+      same program, level of theory (keywords included in qm_input) and closest number of 
+      atoms. The nprocs and mem options are used when the report has no data for the program
    gen_atoms : list of str, default=[]
       Atoms included in the gen(ECP) basis set (i.e. ['I','Pd'])
    bs_gen : str, default=''
@@ -56,6 +63,59 @@ Parameters
    e_threshold_qprep : float, default=None
       Only create inputs for conformers below the energy threshold (to the lowest conformer)
       of the SDF file
+   workers_qprep : int, default=1
+      Number of processes used to write the input files of the conformers of each SDF file
+      (useful for SDF files with many conformers)
+   pack_inputs : int, default=1
+      Number of conformers of each SDF file included in the same input file, as consecutive 
+      jobs (Gaussian: --Link1--, ORCA: $new_job). The files are named SDFNAME_pack_1, 
+      SDFNAME_pack_2, etc. This avoids the startup and queueing overhead of running many small 
+      calculations as separate jobs. The outputs can be split into the results of each 
+      conformer with the split_outputs option of QCORR (if the packed inputs are kept in 
+      the folder of the outputs, QCORR also recovers the jobs that never started)
+   dup_qprep : bool, default=False
+      Remove duplicated conformers before writing the input files. Two conformers are 
+      duplicates if their energy difference is lower than energy_threshold and their RMSD 
+      is lower than rms_threshold (heavyonly and max_matches_rmsd are also used). The 
+      conformers of files with the same molecule (i.e. SDF files from different CMIN or 
+      CREST runs) are compared only by RMSD, and the files are processed in alphabetical 
+      order (the first file keeps the shared conformers). The results are stored in QPREP_dup_cache.csv 
+      (inside the destination folder), so the filter is not repeated for files that 
+      didn't change
+   boltz_pop : float, default=None
+      Only create inputs for the smallest set of conformers of each SDF file that covers 
+      this cumulative Boltzmann population (i.e. 0.95 for 95%), using the energies of the 
+      SDF file at boltz_temp. The selection is applied after lowest_only, lowest_n, 
+      e_threshold_qprep and dup_qprep
+   boltz_temp : float, default=298.15
+      Temperature (in K) used to calculate the Boltzmann populations of boltz_pop
+   boltz_cluster_rms : float, default=None
+      Combined with boltz_pop, the conformers are grouped with a Butina clustering using 
+      this RMSD threshold (heavyonly and max_matches_rmsd are also used) and the most 
+      stable conformer of each cluster is also included
+   job_array : str, default=''
+      Create a job manifest (QPREP_jobs.csv) and a script to run the input files as a job 
+      array in the destination folder. Options: 'slurm' and 'pbs' (other names can be used 
+      with job_template). The input files are distributed in array tasks with similar 
+      estimated costs (wall times from cost_report if available, otherwise number of atoms^3). 
+      The script requests the largest nprocs and mem of the inputs (plus 20% of memory) and it 
+      must be submitted from the destination folder
+   array_tasks : int, default=None
+      Number of tasks of the job array (by default, one task per input file)
+   job_template : str, default=''
+      Template used to create the job array script instead of the default SLURM and PBS 
+      templates. The template can include $job_name, $n_tasks, $nprocs, $mem_mb, $manifest 
+      and $qm_command (the command that runs each $input)
+   job_status : str, default=''
+      Job manifest created with job_array (i.e. QCALC/QPREP_jobs.csv). Instead of writing input 
+      files, QPREP checks the outputs of the inputs from each task and writes QPREP_jobs_status.csv, 
+      listing the tasks with missing or failed calculations
+   bundle : str, default=''
+      Store all the input files in a single archive (QPREP_inputs.zip or .tar) inside the 
+      destination folder instead of individual files. Options: 'zip' and 'tar'. The job 
+      array scripts extract each input before running it. Bundles can also be used as files 
+      (i.e. the JSON files of QCORR, files='success/json_files/QCORR_json.zip'), and their 
+      JSON, LOG and OUT files are read without extracting them
 """
 ######################################################.
 #        This file stores the QPREP class            #
@@ -67,29 +127,478 @@ import sys
 import glob
 import time
 import json
+import hashlib
+import heapq
+import math
+import string
 import pandas as pd
+from functools import lru_cache
+from itertools import islice
+from collections import deque
+from concurrent import futures
 from pkg_resources import resource_filename
 
 from aqme.utils import (
     cclib_atoms_coords,
-    QM_coords,
-    read_file,
-    move_file,
+    QM_file_coords,
     load_variables,
     read_xyz_charge_mult,
     mol_from_sdf_or_mol_or_mol2,
     add_prefix_suffix,
     check_files,
     check_dependencies,
-    set_destination
+    set_destination,
+    get_file_format,
+    open_file
 )
 
+from aqme.qcorr_utils import (
+    suggest_resources,
+    estimate_wall_time,
+    get_size_label,
+    get_file_hash,
+    classify_termination,
+    mem_to_mb,
+)
+from aqme.filter import qprep_dup_filter, boltz_pop_filter
+from aqme.bundle import BundleWriter, get_bundle_format, list_bundle
+from aqme.argument_parser import set_options
 from aqme.csearch.crest import xyzall_2_xyz
 from pathlib import Path
 from rdkit import Chem
 
 TEMPLATES_PATH = Path(resource_filename("aqme", "templates"))
 
+# commands used to run each input in the job array scripts and extensions of the outputs
+job_commands = {
+    "gaussian": ('g16 < "$input" > "${input%.*}.log"', "log"),
+    "orca": ('"$(which orca)" "$input" > "${input%.*}.out"', "out"),
+}
+# memory requested to the scheduler, relative to the memory used by the QM program
+job_mem_margin = 1.2
+# formats of the files read from bundles (i.e. the JSON files of QCORR) and commands used to
+# extract the inputs from bundles in the job array scripts
+bundle_input_formats = [f"{ext}{comp}" for ext in [".json", ".log", ".out"] for comp in ["", ".gz", ".xz", ".bz2"]]
+bundle_extract_commands = {
+    "zip": 'unzip -o -q QPREP_inputs.zip "$input" && ',
+    "tar": 'tar -xf QPREP_inputs.tar "$input" && ',
+}
+
+class InputWriter:
+    """
+    Writes Gaussian (COM) and ORCA (INP) input files from atom types, coordinates, charge
+    and multiplicity. Creating the writer doesn't run the setup of the qprep class
+    (loading variables, checking dependencies, files and level of theory), so the same
+    writer can be used to write many input files (i.e. the inputs from QCORR fixes).
+
+    Parameters
+    ----------
+    args : argument class
+        Options used to write the inputs (i.e. from aqme.argument_parser.set_options()),
+        including program, qm_input, mem, nprocs, chk, qm_end and the gen(ECP) options
+    """
+
+    # options that change the header and tail of the inputs (the templates are created
+    # once for each combination of these options)
+    template_options = [
+        "program",
+        "qm_input",
+        "qm_end",
+        "mem",
+        "nprocs",
+        "chk",
+        "oldchk",
+        "chk_path",
+        "oldchk_path",
+        "gen_atoms",
+        "bs_gen",
+        "bs_nogen",
+        "prefix",
+        "suffix",
+    ]
+    # placeholders of the templates replaced in each input
+    template_marks = {"name": "\0name\0", "charge": "\0charge\0", "mult": "\0mult\0"}
+    coords_format = "%2s %12.8f %12.8f %12.8f"
+
+    def __init__(self, args):
+        self.args = args
+        self.templates = {}
+        self.destinations = set()
+        # BundleWriter used to store the inputs in a single archive (None writes individual files)
+        self.bundle = None
+
+    def get_header(self, qprep_data):
+        """
+        Gets the part of the input file above the molecular coordinates.
+        """
+
+        txt = ""
+        name_file = add_prefix_suffix(qprep_data["name"], self.args)
+
+        if self.args.program.lower() == "gaussian":
+            if self.args.chk_path != '':
+                txt += f'%chk={self.args.chk_path}\n'
+            elif self.args.chk:
+                txt += f'%chk={name_file}.chk\n'
+            if self.args.oldchk_path != '':
+                txt += f'%oldchk={self.args.oldchk_path}\n'
+            elif self.args.oldchk:
+                txt += f'%oldchk={name_file}.chk\n'
+            txt += f"%nprocshared={self.args.nprocs}\n"
+            txt += f"%mem={self.args.mem}\n"
+            if self.args.qm_input[:2] not in ['p ','P ']:
+                txt += f"# {self.args.qm_input}\n\n"
+            else: # for #p in Gaussian inputs
+                txt += f"#{self.args.qm_input}\n\n"
+            txt += f'{name_file}\n\n'
+            txt += f'{qprep_data["charge"]} {qprep_data["mult"]}\n'
+
+        elif self.args.program.lower() == "orca":
+            txt += f'# {name_file}\n'
+            if "GB" in self.args.mem:
+                mem_orca = int(self.args.mem.split("GB")[0]) * 1000
+            elif "MB" in self.args.mem:
+                mem_orca = self.args.mem.split("MB")[0]
+            elif "MW" in self.args.mem:
+                mem_orca = self.args.mem.split("MW")[0]
+            else:
+                mem_orca = self.args.mem
+            if '%maxcore' not in self.args.qm_input:
+                txt += f"%maxcore {mem_orca}\n"
+            pal_included = False
+            pal_list = ['%pal','pal1','pal3','pal3','pal4','pal5','pal6','pal7','pal8']
+            for keyword in self.args.qm_input.split():
+                if keyword.rstrip("\n").lower() in pal_list:
+                    pal_included = True
+            if not pal_included:
+                txt += f"%pal nprocs {self.args.nprocs} end\n"
+            txt += f"! {self.args.qm_input}\n"
+            txt += f'* xyz {qprep_data["charge"]} {qprep_data["mult"]}\n'
+
+        return txt
+
+
+    def get_tail(self, qprep_data):
+        """
+        Gets the part of the input file below the molecular coordinates.
+        """
+
+        txt = ""
+        # if the radius is modified for SMD, it has to be after the genecp info
+        modifysph_line = "" 
+
+        if self.args.program.lower() == "gaussian":
+            # writes final section if selected
+            if self.args.qm_end != "":
+
+                qm_end_local = self.args.qm_end
+
+                # check if the 'modifysph' line is in qm_end
+                if "modifysph" in qm_end_local.lower():
+                    end_lines = qm_end_local.split("\n")
+                    for idx, line in enumerate(end_lines):
+                        if "modifysph" in line.lower():
+                            modifysph_idx = idx
+                            break
+
+                    # Remove empty lines after "modifysph"
+                    while end_lines[modifysph_idx+1].strip() == "":
+                        del end_lines[modifysph_idx+1]
+
+                    modifysph_line = end_lines[modifysph_idx] + "\n\n" + end_lines[modifysph_idx+1] + "\n\n"
+                    del end_lines[modifysph_idx:modifysph_idx+2]
+                    qm_end_local = "\n".join(end_lines)
+
+                txt += f"{qm_end_local}\n\n"
+
+            if self.args.gen_atoms != [] and len(self.args.gen_atoms) > 0:
+                # writes part for Gen/GenECP
+                ecp_used, ecp_not_used, gen_type = [], [], "gen"
+                if self.args.qm_input.lower().find("genecp") > -1:
+                    gen_type = "genecp"
+
+                for _, element_ecp in enumerate(qprep_data["atom_types"]):
+                    if (
+                        element_ecp in self.args.gen_atoms
+                        and element_ecp not in ecp_used
+                    ):
+                        ecp_used.append(element_ecp)
+                    elif (
+                        element_ecp not in self.args.gen_atoms
+                        and element_ecp not in ecp_not_used
+                    ):
+                        ecp_not_used.append(element_ecp)
+
+                if len(ecp_not_used) > 0:
+                    elements_not_used = " ".join([f"{sym}" for sym in ecp_not_used])
+                    txt += f"{elements_not_used} 0\n{self.args.bs_nogen}\n****\n"
+                if len(ecp_used) > 0:
+                    elements_used = " ".join([f"{sym}" for sym in ecp_used])
+                    txt += f"{elements_used} 0\n{self.args.bs_gen}\n****\n"
+
+                if gen_type == "genecp" and len(ecp_used) > 0:
+                    txt += "\n"
+                    txt += f"{elements_used} 0\n{self.args.bs_gen}\n"
+
+                txt += "\n"
+                
+        txt = txt.lstrip('\n')
+        txt += modifysph_line
+        return txt
+        
+    def get_templates(self, atom_types):
+        """
+        Gets the header and tail of the inputs with placeholders for the name, charge and
+        multiplicity. The templates are only created once for each combination of options
+        (and elements, when gen(ECP) is used).
+        """
+
+        template_key = tuple(str(getattr(self.args, option)) for option in self.template_options)
+        if len(self.args.gen_atoms) > 0:
+            template_key += tuple(dict.fromkeys(atom_types))
+        if template_key not in self.templates:
+            template_data = dict(self.template_marks)
+            template_data["atom_types"] = atom_types
+            self.templates[template_key] = (
+                self.get_header(template_data),
+                self.get_tail(template_data),
+            )
+
+        return self.templates[template_key]
+
+    def render(self, qprep_data):
+        """
+        Returns the name and the text of the input file of a system
+        """
+
+        if self.args.program.lower() == "gaussian":
+            extension = "com"
+            coords_end = "\n\n"
+        elif self.args.program.lower() == "orca":
+            extension = "inp"
+            coords_end = "\n*"
+
+        header, tail = self.get_templates(qprep_data["atom_types"])
+        header = (
+            header.replace(self.template_marks["name"], qprep_data["name"])
+            .replace(self.template_marks["charge"], str(qprep_data["charge"]))
+            .replace(self.template_marks["mult"], str(qprep_data["mult"]))
+        )
+
+        cartesians = qprep_data["cartesians"]
+        if hasattr(cartesians, "tolist"):
+            cartesians = cartesians.tolist()
+        coords = "\n".join(
+            [self.coords_format % (atom, x, y, z) for atom, (x, y, z) in zip(qprep_data["atom_types"], cartesians)]
+        )
+
+        comfile = f'{add_prefix_suffix(qprep_data["name"], self.args)}.{extension}'
+
+        return comfile, f"{header}{coords}{coords_end}{tail}"
+
+    def write(self, qprep_data, destination=None, **options):
+        """
+        Writes the input file of a system and returns the name of the file.
+
+        Parameters
+        ----------
+        qprep_data : dict
+            Dictionary with the atom types, cartesian coordinates, charge, multiplicity
+            and name of the system
+        destination : str or Path, default=None
+            Folder where the input is written (by default, w_dir_main)
+        options : keyword arguments
+            Options that overwrite the options of the writer from this input on
+            (i.e. program, qm_input, mem or nprocs)
+        """
+
+        for option, value in options.items():
+            setattr(self.args, option, value)
+
+        comfile, input_text = self.render(qprep_data)
+        self.save(comfile, input_text, destination)
+
+        return comfile
+
+    def save(self, comfile, input_text, destination=None):
+        """
+        Writes the text of an input file in the destination folder (or in the bundle of the writer)
+        """
+
+        if self.bundle is not None:
+            self.bundle.write(comfile, input_text)
+            return
+
+        if destination is None:
+            destination = self.args.w_dir_main
+        destination = Path(destination)
+        if destination not in self.destinations:
+            destination.mkdir(exist_ok=True, parents=True)
+            self.destinations.add(destination)
+
+        with open(destination / comfile, "w") as fileout:
+            fileout.write(input_text)
+
+    def write_pack(self, inputs, pack_name, destination=None):
+        """
+        Writes the inputs of several systems in a single input file, as consecutive jobs of the
+        same run (--Link1-- in Gaussian and $new_job in ORCA). Returns the name of the file.
+
+        Parameters
+        ----------
+        inputs : list of (dict, dict)
+            qprep_data and options of each job (as in write())
+        pack_name : str
+            Name of the input file (without extension)
+        destination : str or Path, default=None
+            Folder where the input is written (by default, w_dir_main)
+        """
+
+        comfile, pack_text = self.render_pack(inputs, pack_name)
+        self.save(comfile, pack_text, destination)
+
+        return comfile
+
+    def render_pack(self, inputs, pack_name):
+        """
+        Returns the name and the text of an input file with the jobs of several systems
+
+        Parameters
+        ----------
+        inputs : list of (dict, dict)
+            qprep_data and options of each job (as in write())
+        pack_name : str
+            Name of the input file (without extension)
+        """
+
+        job_texts = []
+        for qprep_data, options in inputs:
+            for option, value in options.items():
+                setattr(self.args, option, value)
+            _, input_text = self.render(qprep_data)
+            job_texts.append(input_text)
+
+        if self.args.program.lower() == "gaussian":
+            extension = "com"
+            # each job must end with a blank line before --Link1--
+            job_texts = [job_text if job_text.endswith("\n\n") else f"{job_text.rstrip()}\n\n" for job_text in job_texts]
+            pack_text = "--Link1--\n".join(job_texts)
+        elif self.args.program.lower() == "orca":
+            extension = "inp"
+            pack_text = "\n\n$new_job\n".join(job_texts)
+
+        comfile = f"{add_prefix_suffix(pack_name, self.args)}.{extension}"
+
+        return comfile, pack_text
+
+    def write_batch(self, inputs, destination=None, workers=1, chunk_size=500, pack_size=1, pack_name=None):
+        """
+        Writes the input files of many systems and returns the names of the files. The
+        inputs are written in chunks in a pool of processes when workers > 1 (only a
+        limited number of chunks are kept in memory).
+
+        Parameters
+        ----------
+        inputs : iterable of (dict, dict)
+            qprep_data and options of each input file (as in write())
+        destination : str or Path, default=None
+            Folder where the inputs are written (by default, w_dir_main)
+        workers : int, default=1
+            Number of processes used to write the inputs
+        chunk_size : int, default=500
+            Number of input files written by each process at a time
+        pack_size : int, default=1
+            Number of systems included in each input file (see write_pack()). The files
+            are named PACK_NAME_pack_1, PACK_NAME_pack_2, etc.
+        pack_name : str, default=None
+            Name used for the files with several systems
+        """
+
+        # each job writes one input file, with one system or a pack of systems
+        if pack_size > 1:
+            inputs_iter = iter(inputs)
+            input_jobs = (
+                (f"{pack_name}_pack_{n_pack}", pack_inputs)
+                for n_pack, pack_inputs in enumerate(
+                    iter(lambda: list(islice(inputs_iter, pack_size)), []), start=1
+                )
+            )
+        else:
+            input_jobs = ((None, [single_input]) for single_input in inputs)
+
+        if workers <= 1:
+            return write_inputs(self, input_jobs, destination)
+
+        # with bundles, the processes only render the inputs and they are stored in this process
+        render_only = self.bundle is not None
+
+        # the processes use a copy of the writer without the parts of the options that can't be
+        # sent to other processes (i.e. the log file)
+        writer_args = set_options(
+            {option: getattr(self.args, option) for option in self.template_options + ["w_dir_main"]}
+        )
+        worker_writer = InputWriter(writer_args)
+        comfiles = []
+        with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            while True:
+                chunk = list(islice(input_jobs, chunk_size))
+                if len(chunk) > 0:
+                    pending.append(executor.submit(write_inputs, worker_writer, chunk, destination, render_only))
+                if len(pending) > 0 and (len(chunk) == 0 or len(pending) >= 2 * workers):
+                    chunk_results = pending.popleft().result()
+                    if render_only:
+                        for comfile, input_text in chunk_results:
+                            self.save(comfile, input_text, destination)
+                        chunk_results = [comfile for comfile, _ in chunk_results]
+                    comfiles.extend(chunk_results)
+                elif len(chunk) == 0:
+                    break
+
+        return comfiles
+
+
+def write_inputs(writer, input_jobs, destination, render_only=False):
+    """
+    Writes a chunk of input files with an InputWriter (used in write_batch()). Each job contains
+    the name of the pack (None for inputs with a single system) and the inputs of the systems.
+    With render_only, the names and texts of the inputs are returned instead of writing them.
+    """
+
+    results = []
+    for pack_name, inputs in input_jobs:
+        if pack_name is None:
+            qprep_data, options = inputs[0]
+            for option, value in options.items():
+                setattr(writer.args, option, value)
+            comfile, input_text = writer.render(qprep_data)
+        else:
+            comfile, input_text = writer.render_pack(inputs, pack_name)
+        if render_only:
+            results.append((comfile, input_text))
+        else:
+            writer.save(comfile, input_text, destination)
+            results.append(comfile)
+
+    return results
+
+
+@lru_cache(maxsize=None)
+def load_level_of_theory(program):
+    """
+    Reads the predefined lists of functionals and basis sets of a program (only once),
+    as sets of names in upper case
+    """
+
+    functional_data = pd.read_csv(TEMPLATES_PATH / Path('functionals.csv'))
+    basis_set_data = pd.read_csv(TEMPLATES_PATH / Path('basis_sets.csv'))
+
+    functional_list = {str(x).upper() for x in functional_data[program].dropna()}
+    basis_set_list = {str(x).upper() for x in basis_set_data[program].dropna()}
+
+    return functional_list, basis_set_list
+
+
 class qprep:
     """
     Class containing all the functions from the QPREP module related to Gaussian input files
@@ -102,15 +611,42 @@ class qprep:
         # load default and user-specified variables
         self.args = load_variables(kwargs, "qprep", create_dat=create_dat)
 
+        # track the outputs of a job array created with QPREP (no input files are written)
+        if self.args.job_status != "":
+            self.unfinished_tasks = self.job_array_status()
+            self.args.log.finalize()
+            return
+
         # check whether dependencies are installed
         _ = check_dependencies(self)
 
         # retrieves the different files to run in QPREP
         _ = check_files(self,'qprep')
 
-        file_format = os.path.basename(Path(self.args.files[0])).split('.')[-1]
-        if file_format.lower() not in ['sdf', 'xyz', 'pdb', 'log', 'out', 'json']:
-            self.args.log.write(f"\nx  The format used ({file_format}) is not compatible with QPREP! Formats accepted: sdf, xyz, pdb, log, out, json")
+        # the files stored in bundles are read directly from the archives
+        if self.args.bundle not in ["", "zip", "tar"]:
+            self.args.log.write(f"\nx  The bundle format used ({self.args.bundle}) is not valid! Options: zip, tar")
+            self.args.log.finalize()
+            sys.exit()
+        input_files = []
+        for file in self.args.files:
+            if get_bundle_format(file) is not None:
+                input_files.extend(list_bundle(file, bundle_input_formats))
+            else:
+                input_files.append(file)
+        if len(input_files) == 0:
+            self.args.log.write(f"\nx  The bundles used don't contain files compatible with QPREP (formats accepted: json, log, out)")
+            self.args.log.finalize()
+            sys.exit()
+        self.args.files = input_files
+        # the conformers shared by different files are kept in the first file, so the files
+        # are sorted to make the results of the duplicate filter independent of the glob order
+        if self.args.dup_qprep:
+            self.args.files = sorted(self.args.files, key=str)
+
+        file_format = get_file_format(self.args.files[0])
+        if file_format.lower() not in ['sdf', 'ens', 'xyz', 'pdb', 'log', 'out', 'json']:
+            self.args.log.write(f"\nx  The format used ({file_format}) is not compatible with QPREP! Formats accepted: sdf, ens, xyz, pdb, log, out, json")
             self.args.log.finalize()
             sys.exit()
 
@@ -129,8 +665,65 @@ class qprep:
         if self.args.nprocs is None:
             self.args.nprocs = 8
 
+        # cost report of previous calculations (from QCORR) used to suggest nprocs and mem
+        self.default_resources = {"nprocs": self.args.nprocs, "mem": self.args.mem}
+        self.cost_data = None
+        # the suggestions only depend on the range of molecule sizes, so they're reused across conformers
+        self.resource_suggestions = {}
+        if self.args.cost_report != "":
+            if not os.path.exists(self.args.cost_report):
+                self.args.log.write(f"\nx  The cost report specified ({self.args.cost_report}) does not exist!")
+                self.args.log.finalize()
+                sys.exit()
+            self.cost_data = pd.read_csv(self.args.cost_report)
+
+        # conformer selection based on Boltzmann populations
+        if self.args.boltz_pop is not None:
+            if not 0 < float(self.args.boltz_pop) <= 1:
+                self.args.log.write(f"\nx  The Boltzmann population specified (boltz_pop={self.args.boltz_pop}) must be between 0 and 1 (i.e. 0.95 for 95%)!")
+                self.args.log.finalize()
+                sys.exit()
+            if float(self.args.boltz_temp) <= 0:
+                self.args.log.write(f"\nx  The temperature specified (boltz_temp={self.args.boltz_temp}) must be higher than 0 K!")
+                self.args.log.finalize()
+                sys.exit()
+
+        # job manifest and script for job arrays
+        if self.args.job_array != "":
+            self.args.job_array = self.args.job_array.lower()
+            if self.args.job_template == "" and self.args.job_array not in ["slurm", "pbs"]:
+                self.args.log.write(f"\nx  Job array type not supported ({self.args.job_array})! Specify: job_array='slurm' (or 'pbs'), or use a template with job_template")
+                self.args.log.finalize()
+                sys.exit()
+            if self.args.job_template != "" and not os.path.exists(self.args.job_template):
+                self.args.log.write(f"\nx  The job template specified ({self.args.job_template}) does not exist!")
+                self.args.log.finalize()
+                sys.exit()
+        # number of atoms and resources of the systems written, and input files of the job array
+        self.job_systems, self.array_jobs = [], []
+
+        # writer used for all the input files
+        self.writer = InputWriter(self.args)
+
         destination = set_destination(self,'QCALC')
 
+        # all the inputs are stored in a single archive
+        if self.args.bundle != "":
+            Path(destination).mkdir(exist_ok=True, parents=True)
+            self.writer.bundle = BundleWriter(Path(destination).joinpath(f"QPREP_inputs.{self.args.bundle}"))
+
+        # results of the duplicate filter from previous runs
+        if self.args.dup_qprep:
+            self.dup_cache_file = Path(destination).joinpath("QPREP_dup_cache.csv")
+            self.dup_cache = {}
+            if os.path.exists(self.dup_cache_file):
+                df_dup_cache = pd.read_csv(self.dup_cache_file, dtype=str, keep_default_na=False)
+                for row in df_dup_cache.to_dict("records"):
+                    self.dup_cache[row["Key"]] = row
+            # unique conformers of each molecule (to compare conformers from different files)
+            self.dup_pool = {}
+            self.n_dups = 0
+
         # check if qm_input is not empty
         if self.args.qm_input == "" and create_dat:
             self.args.log.write("x  No keywords line was specified! (i.e. qm_input=KEYWORDS_LINE).")
@@ -156,7 +749,7 @@ class qprep:
         # write input files
         for file in self.args.files:
             name = os.path.basename(Path(file)).split(".")[0]
-            if file_format.lower() in ["sdf", "xyz", "pdb"]:
+            if file_format.lower() in ["sdf", "ens", "xyz", "pdb"]:
                 sdf_files = []
                 if file_format.lower() == "xyz":
                     # separate the parent XYZ file into individual XYZ files
@@ -243,12 +836,27 @@ class qprep:
                     "mult": mult,
                     "name": name,
                 }
-                comfile = self.write(qprep_data)
+                resources = self.get_resources(qprep_data)
+                comfile = self.writer.write(qprep_data, destination=destination, **resources)
+                if self.args.job_array != "":
+                    self.job_systems.append((len(atom_types), resources))
+                    self.add_array_jobs([comfile])
 
-                move_file(destination, self.args.w_dir_main, comfile)
                 if create_dat:
                     self.args.log.write(f"o  {name} successfully processed at {destination}")
 
+        if self.writer.bundle is not None:
+            self.writer.bundle.close()
+            self.args.log.write(f"\no  The input files were stored in {self.writer.bundle.bundle_file}")
+
+        if self.args.job_array != "" and len(self.array_jobs) > 0:
+            self.write_job_array(destination)
+
+        if self.args.dup_qprep:
+            self.args.log.write(f"\no  {self.n_dups} duplicated conformer(s) removed before writing the input files")
+            dup_rows = list(self.dup_cache.values())
+            pd.DataFrame(dup_rows, columns=["Key", "File", "Conformers", "Unique conformers"]).to_csv(self.dup_cache_file, index=False)
+
         if create_dat:
             elapsed_time = round(time.time() - start_time_overall, 2)
             self.args.log.write(f"\nTime QPREP: {elapsed_time} seconds\n")
@@ -266,6 +874,97 @@ class qprep:
         if self.args.e_threshold_qprep is not None:
             low_check=float(self.args.e_threshold_qprep)
         mols = mol_from_sdf_or_mol_or_mol2(sdf_file, "qprep", self.args, low_check=low_check)
+        if self.args.dup_qprep:
+            mols = self.dup_filter(sdf_file, [mol for mol in mols], low_check)
+        if self.args.boltz_pop is not None:
+            mols = self.boltz_filter(sdf_file, [mol for mol in mols])
+
+        comfiles = self.writer.write_batch(
+            self.iter_sdf_inputs(sdf_name, mols, sdf_file, file_format),
+            destination=destination,
+            workers=self.args.workers_qprep,
+            pack_size=self.args.pack_inputs,
+            pack_name=sdf_name,
+        )
+        if self.args.job_array != "":
+            self.add_array_jobs(comfiles, pack_size=self.args.pack_inputs)
+
+    def boltz_filter(self, sdf_file, mols):
+        """
+        Keeps the conformers of an SDF file that cover the target Boltzmann population
+        (and the representatives of the RMSD clusters if boltz_cluster_rms is used)
+        """
+
+        if len(mols) == 0:
+            return mols
+
+        selected_idx, pops = boltz_pop_filter(mols, self.args)
+        if selected_idx is None:
+            self.args.log.write(f"x  WARNING! Some conformers of {os.path.basename(sdf_file)} don't have energies, all the conformers will be used (boltz_pop is disabled)")
+            return mols
+
+        covered_pop = sum([pops[idx] for idx in selected_idx]) * 100
+        self.args.log.write(f"o  {len(selected_idx)} of {len(mols)} conformer(s) of {os.path.basename(sdf_file)} selected ({covered_pop:.1f}% of the Boltzmann population at {float(self.args.boltz_temp)} K)")
+
+        return [mols[idx] for idx in selected_idx]
+
+    def dup_filter(self, sdf_file, mols, low_check):
+        """
+        Removes the conformers of an SDF file that are duplicates of other conformers of the
+        same file or of previous files with the same molecule. The unique conformers are
+        reused from the cache when the file, the options and the previous files didn't change.
+        """
+
+        if len(mols) == 0:
+            return mols
+
+        # conformers with the same topology, charge and multiplicity are compared
+        try:
+            mol_key = Chem.MolToSmiles(mols[0])
+        except (RuntimeError, ValueError):
+            mol_key = os.path.basename(sdf_file)
+        for prop in ["Real charge", "Mult"]:
+            if mols[0].HasProp(prop):
+                mol_key += f" {mols[0].GetProp(prop)}"
+        mol_pool = self.dup_pool.setdefault(mol_key, {"keys": [], "mols": []})
+
+        options = [
+            self.args.energy_threshold,
+            self.args.rms_threshold,
+            self.args.heavyonly,
+            self.args.max_matches_rmsd,
+            low_check,
+        ]
+        key_text = " ".join([get_file_hash(sdf_file)] + [str(option) for option in options] + mol_pool["keys"])
+        dup_key = hashlib.sha256(key_text.encode("utf-8")).hexdigest()
+
+        cache_entry = self.dup_cache.get(dup_key)
+        if cache_entry is not None and cache_entry["Conformers"] == str(len(mols)):
+            selected_idx = [int(idx) for idx in cache_entry["Unique conformers"].split()]
+        else:
+            selected_idx = qprep_dup_filter(mols, self.args, mol_pool["mols"])
+            self.dup_cache[dup_key] = {
+                "Key": dup_key,
+                "File": os.path.basename(sdf_file),
+                "Conformers": str(len(mols)),
+                "Unique conformers": " ".join([str(idx) for idx in selected_idx]),
+            }
+
+        unique_mols = [mols[idx] for idx in selected_idx]
+        mol_pool["keys"].append(dup_key)
+        mol_pool["mols"].extend(unique_mols)
+
+        n_dups = len(mols) - len(unique_mols)
+        if n_dups > 0:
+            self.args.log.write(f"o  {n_dups} of {len(mols)} conformer(s) of {os.path.basename(sdf_file)} removed as duplicates")
+        self.n_dups += n_dups
+
+        return unique_mols
+
+    def iter_sdf_inputs(self, sdf_name, mols, sdf_file, file_format):
+        """
+        Yields the data and options used to write the input file of each conformer of an SDF file
+        """
 
         for i, mol in enumerate(mols):
             (
@@ -289,168 +988,11 @@ class qprep:
                 "name": name_conf,
             }
 
-            comfile = self.write(qprep_data)
-            move_file(destination, self.args.w_dir_main, comfile)
-
-    def get_header(self, qprep_data):
-        """
-        Gets the part of the input file above the molecular coordinates.
-        """
-
-        txt = ""
-        name_file = add_prefix_suffix(qprep_data["name"], self.args)
-
-        if self.args.program.lower() == "gaussian":
-            if self.args.chk_path != '':
-                txt += f'%chk={self.args.chk_path}\n'
-            elif self.args.chk:
-                txt += f'%chk={name_file}.chk\n'
-            if self.args.oldchk_path != '':
-                txt += f'%oldchk={self.args.oldchk_path}\n'
-            elif self.args.oldchk:
-                txt += f'%oldchk={name_file}.chk\n'
-            txt += f"%nprocshared={self.args.nprocs}\n"
-            txt += f"%mem={self.args.mem}\n"
-            if self.args.qm_input[:2] not in ['p ','P ']:
-                txt += f"# {self.args.qm_input}\n\n"
-            else: # for #p in Gaussian inputs
-                txt += f"#{self.args.qm_input}\n\n"
-            txt += f'{name_file}\n\n'
-            txt += f'{qprep_data["charge"]} {qprep_data["mult"]}\n'
-
-        elif self.args.program.lower() == "orca":
-            txt += f'# {name_file}\n'
-            if "GB" in self.args.mem:
-                mem_orca = int(self.args.mem.split("GB")[0]) * 1000
-            elif "MB" in self.args.mem:
-                mem_orca = self.args.mem.split("MB")[0]
-            elif "MW" in self.args.mem:
-                mem_orca = self.args.mem.split("MW")[0]
-            else:
-                mem_orca = self.args.mem
-            if '%maxcore' not in self.args.qm_input:
-                txt += f"%maxcore {mem_orca}\n"
-            pal_included = False
-            pal_list = ['%pal','pal1','pal3','pal3','pal4','pal5','pal6','pal7','pal8']
-            for keyword in self.args.qm_input.split():
-                if keyword.rstrip("\n").lower() in pal_list:
-                    pal_included = True
-            if not pal_included:
-                txt += f"%pal nprocs {self.args.nprocs} end\n"
-            txt += f"! {self.args.qm_input}\n"
-            txt += f'* xyz {qprep_data["charge"]} {qprep_data["mult"]}\n'
-
-        return txt
+            resources = self.get_resources(qprep_data)
+            if self.args.job_array != "":
+                self.job_systems.append((len(atom_types), resources))
 
-
-    def get_tail(self, qprep_data):
-        """
-        Gets the part of the input file below the molecular coordinates.
-        """
-
-        txt = ""
-        # if the radius is modified for SMD, it has to be after the genecp info
-        modifysph_line = "" 
-
-        if self.args.program.lower() == "gaussian":
-            # writes final section if selected
-            if self.args.qm_end != "":
-
-                qm_end_local = self.args.qm_end
-
-                # check if the 'modifysph' line is in qm_end
-                if "modifysph" in qm_end_local.lower():
-                    end_lines = qm_end_local.split("\n")
-                    for idx, line in enumerate(end_lines):
-                        if "modifysph" in line.lower():
-                            modifysph_idx = idx
-                            break
-
-                    # Remove empty lines after "modifysph"
-                    while end_lines[modifysph_idx+1].strip() == "":
-                        del end_lines[modifysph_idx+1]
-
-                    modifysph_line = end_lines[modifysph_idx] + "\n\n" + end_lines[modifysph_idx+1] + "\n\n"
-                    del end_lines[modifysph_idx:modifysph_idx+2]
-                    qm_end_local = "\n".join(end_lines)
-
-                txt += f"{qm_end_local}\n\n"
-
-            if self.args.gen_atoms != [] and len(self.args.gen_atoms) > 0:
-                # writes part for Gen/GenECP
-                ecp_used, ecp_not_used, gen_type = [], [], "gen"
-                if self.args.qm_input.lower().find("genecp") > -1:
-                    gen_type = "genecp"
-
-                for _, element_ecp in enumerate(qprep_data["atom_types"]):
-                    if (
-                        element_ecp in self.args.gen_atoms
-                        and element_ecp not in ecp_used
-                    ):
-                        ecp_used.append(element_ecp)
-                    elif (
-                        element_ecp not in self.args.gen_atoms
-                        and element_ecp not in ecp_not_used
-                    ):
-                        ecp_not_used.append(element_ecp)
-
-                if len(ecp_not_used) > 0:
-                    elements_not_used = " ".join([f"{sym}" for sym in ecp_not_used])
-                    txt += f"{elements_not_used} 0\n{self.args.bs_nogen}\n****\n"
-                if len(ecp_used) > 0:
-                    elements_used = " ".join([f"{sym}" for sym in ecp_used])
-                    txt += f"{elements_used} 0\n{self.args.bs_gen}\n****\n"
-
-                if gen_type == "genecp" and len(ecp_used) > 0:
-                    txt += "\n"
-                    txt += f"{elements_used} 0\n{self.args.bs_gen}\n"
-
-                txt += "\n"
-                
-        txt = txt.lstrip('\n')
-        txt += modifysph_line
-        return txt
-        
-    def write(self, qprep_data):
-
-        if self.args.program.lower() == "gaussian":
-            extension = "com"
-        elif self.args.program.lower() == "orca":
-            extension = "inp"
-
-        name_file = add_prefix_suffix(qprep_data["name"], self.args)
-        comfile = f'{name_file}.{extension}'
-
-        if os.path.exists(self.args.w_dir_main / comfile):
-            os.remove(self.args.w_dir_main / comfile)
-
-        header = self.get_header(qprep_data)
-        tail = self.get_tail(qprep_data)
-
-        fileout = open(self.args.w_dir_main / comfile, "w")
-        fileout.write(header)
-
-        for atom_idx in range(0, len(qprep_data["atom_types"])):
-            fileout.write(
-                "{0:>2} {1:12.8f} {2:12.8f} {3:12.8f}".format(
-                    qprep_data["atom_types"][atom_idx],
-                    qprep_data["cartesians"][atom_idx][0],
-                    qprep_data["cartesians"][atom_idx][1],
-                    qprep_data["cartesians"][atom_idx][2],
-                )
-            )
-            if atom_idx != len(qprep_data["atom_types"]) - 1:
-                fileout.write("\n")
-
-        if self.args.program.lower() == "gaussian":
-            fileout.write("\n\n")
-        elif self.args.program.lower() == "orca":
-            fileout.write("\n*")
-
-        fileout.write(tail)
-        fileout.close()
-
-        return comfile
+            yield qprep_data, resources
 
     def qprep_coords(self, file, mol, file_format):
         """
@@ -461,69 +1003,40 @@ class qprep:
         charge, mult = None, None
         if self.args.atom_types == [] or self.args.cartesians == []:
             if mol is not None:
+                # the atoms are retrieved by index (faster than iterating over mol.GetAtoms())
+                atoms = [mol.GetAtomWithIdx(atom_idx) for atom_idx in range(mol.GetNumAtoms())]
                 atom_types = []
-                atom_data = [(atom, atom.GetIsotope()) for atom in mol.GetAtoms()]
-                for atom, isotope in atom_data:
+                for atom in atoms:
+                    isotope = atom.GetIsotope()
                     if isotope:
                         atom_types.append(atom.GetSymbol() + "(iso={})".format(isotope))
                     else:
                         atom_types.append(atom.GetSymbol())
-                cartesians = mol.GetConformers()[0].GetPositions()
-                try:
+                cartesians = mol.GetConformer().GetPositions()
+                if mol.HasProp("Real charge"):
                     charge = int(mol.GetProp("Real charge"))
-                except KeyError:
+                else:
                     charge = Chem.GetFormalCharge(mol)
-                try:
+                if mol.HasProp("Mult"):
                     mult = int(mol.GetProp("Mult"))
-                except KeyError:
+                else:
                     NumRadicalElectrons = 0
-                    for Atom in mol.GetAtoms():
+                    for Atom in atoms:
                         NumRadicalElectrons += Atom.GetNumRadicalElectrons()
                     TotalElectronicSpin = NumRadicalElectrons / 2
                     mult = int((2 * TotalElectronicSpin) + 1)
 
             elif file_format in ["log", "out"]:
-                # detect QM program and number of atoms
+                # only the last geometry and the charge/mult lines are parsed (the output isn't loaded)
                 if not self.args.command_line:
-                    outlines = read_file(os.getcwd(), self.args.w_dir_main, file)
+                    output_file = os.path.join(self.args.w_dir_main, file)
                 else:
                     # if command lines are used, the program is already in that folder
-                    outlines = read_file(os.getcwd(), os.getcwd(), file)
-                n_atoms = 0
-                resume_line = 0
-                found_n_atoms = False
-
-                for i, line in enumerate(outlines):
-                    if line.find("Gaussian, Inc."):
-                        program = "gaussian"
-                        resume_line = i
-                        break
-                    elif line[i].find("O   R   C   A"):
-                        program = "orca"
-                        resume_line = i
-                        break
-
-                for i in range(resume_line, len(outlines)):
-                    if program == "gaussian":
-                        # get charge and mult
-                        if outlines[i].find("Charge = ") > -1:
-                            charge = int(outlines[i].split()[2])
-                            mult = int(outlines[i].split()[5].rstrip("\n"))
-                        # get number of atoms
-                        elif outlines[i].find("Symbolic Z-matrix:") > -1:
-                            for j in range(i + 2, len(outlines)):
-                                if len(outlines[j].split()) > 0:
-                                    n_atoms += 1
-                                else:
-                                    found_n_atoms = True
-                                    break
-                        elif found_n_atoms:
-                            break
-
-                atom_types, cartesians = QM_coords(outlines, -1, n_atoms, program, "")
+                    output_file = file
+                atom_types, cartesians, charge, mult = QM_file_coords(output_file)
 
             elif file_format == "json":
-                with open(file) as json_file:
+                with open_file(file) as json_file:
                     cclib_data = json.load(json_file)
                 try:
                     atom_types, cartesians = cclib_atoms_coords(cclib_data)
@@ -558,34 +1071,182 @@ class qprep:
         return atom_types, cartesians, charge, mult, found_coords
 
 
+    def get_resources(self, qprep_data):
+        """
+        Gets the number of processors and memory used in an input file (suggested from
+        the cost report of QCORR, if any)
+        """
+
+        resources = dict(self.default_resources)
+        if self.cost_data is not None:
+            n_atoms = len(qprep_data["atom_types"])
+            suggestion_key = (self.args.program, self.args.qm_input, get_size_label(n_atoms))
+            if suggestion_key not in self.resource_suggestions:
+                self.resource_suggestions[suggestion_key] = suggest_resources(
+                    self.cost_data,
+                    self.args.program,
+                    self.args.qm_input,
+                    n_atoms,
+                )
+            suggestion = self.resource_suggestions[suggestion_key]
+            if suggestion is not None:
+                resources["nprocs"], resources["mem"] = suggestion
+
+        return resources
+
+    def add_array_jobs(self, comfiles, pack_size=1):
+        """
+        Adds the input files written to the jobs of the job array, with the number of atoms and
+        resources of their systems (several systems per file when the inputs are packed)
+        """
+
+        pack_size = max(1, pack_size)
+        for n_file, comfile in enumerate(comfiles):
+            systems = self.job_systems[n_file * pack_size:(n_file + 1) * pack_size]
+            self.array_jobs.append({"Input": comfile, "Systems": systems})
+        self.job_systems = []
+
+    def write_job_array(self, destination):
+        """
+        Distributes the input files in the tasks of a job array and writes the job manifest
+        (QPREP_jobs.csv) and the script of the job array. The inputs are sorted from highest
+        to lowest cost and each one is added to the task with the lowest total cost.
+        """
+
+        program = self.args.program.lower()
+        job_rows = []
+        # the estimations only depend on the number of atoms, which is shared by most systems
+        wall_time_estimates = {}
+        for job in self.array_jobs:
+            n_atoms = [system[0] for system in job["Systems"]]
+            nprocs = max(int(system[1]["nprocs"]) for system in job["Systems"])
+            mem_mb = 0
+            for _, resources in job["Systems"]:
+                system_mem = mem_to_mb(resources["mem"])
+                if system_mem is not None:
+                    if program == "orca":
+                        # the memory of ORCA is set per processor
+                        system_mem = system_mem * int(resources["nprocs"])
+                    mem_mb = max(mem_mb, system_mem)
+            wall_times = None
+            if self.cost_data is not None:
+                for atoms in n_atoms:
+                    if atoms not in wall_time_estimates:
+                        wall_time_estimates[atoms] = estimate_wall_time(self.cost_data, program, self.args.qm_input, atoms)
+                wall_times = [wall_time_estimates[atoms] for atoms in n_atoms]
+            job_rows.append(
+                {
+                    "Input": job["Input"],
+                    "Systems": len(n_atoms),
+                    "Atoms": sum(n_atoms),
+                    "Processors": nprocs,
+                    "Memory (MB)": int(round(mem_mb)),
+                    "Relative cost": sum(atoms**3 for atoms in n_atoms),
+                    "Wall times": wall_times,
+                }
+            )
+
+        # the wall times from the cost report are only used if all the inputs have an estimation
+        use_wall_times = all(
+            job_row["Wall times"] is not None and None not in job_row["Wall times"] for job_row in job_rows
+        )
+        for job_row in job_rows:
+            wall_times = job_row.pop("Wall times")
+            if use_wall_times:
+                job_row["Estimated cost"] = round(sum(wall_times), 4)
+            else:
+                job_row["Estimated cost"] = job_row["Relative cost"]
+            del job_row["Relative cost"]
+
+        n_tasks = len(job_rows)
+        if self.args.array_tasks is not None:
+            n_tasks = max(1, min(int(self.args.array_tasks), len(job_rows)))
+        task_loads = [(0, n_task) for n_task in range(1, n_tasks + 1)]
+        for job_row in sorted(job_rows, key=lambda job_row: -job_row["Estimated cost"]):
+            task_load, n_task = heapq.heappop(task_loads)
+            job_row["Task"] = n_task
+            heapq.heappush(task_loads, (task_load + job_row["Estimated cost"], n_task))
+
+        manifest_columns = ["Task", "Input", "Systems", "Atoms", "Processors", "Memory (MB)", "Estimated cost"]
+        df_jobs = pd.DataFrame(job_rows, columns=manifest_columns)
+        df_jobs = df_jobs.sort_values("Task", kind="stable")
+        manifest_file = Path(destination).joinpath("QPREP_jobs.csv")
+        df_jobs.to_csv(manifest_file, index=False)
+
+        if self.args.job_template != "":
+            template_file = self.args.job_template
+        else:
+            template_file = TEMPLATES_PATH / Path(f"job_array.{self.args.job_array}")
+        with open(template_file, "r") as F:
+            job_template = string.Template(F.read())
+        job_script = job_template.safe_substitute(
+            job_name=os.path.basename(Path(destination)),
+            n_tasks=n_tasks,
+            nprocs=df_jobs["Processors"].max(),
+            mem_mb=int(math.ceil(df_jobs["Memory (MB)"].max() * job_mem_margin)),
+            manifest=manifest_file.name,
+            qm_command=bundle_extract_commands.get(self.args.bundle, "") + job_commands[program][0],
+        )
+        script_file = Path(destination).joinpath(f"QPREP_jobs.{self.args.job_array}")
+        with open(script_file, "w") as F:
+            F.write(job_script)
+
+        cost_type = "wall times from the cost report (h)" if use_wall_times else "number of atoms^3"
+        self.args.log.write(f"\no  {len(job_rows)} input file(s) distributed in {n_tasks} task(s) of a job array, using {cost_type} as estimated costs ({manifest_file.name} and {script_file.name})")
+
+    def job_array_status(self):
+        """
+        Checks the outputs of the input files of each task in a job manifest of QPREP and writes
+        QPREP_jobs_status.csv. Returns the tasks with missing or failed calculations.
+        """
+
+        if not os.path.exists(self.args.job_status):
+            self.args.log.write(f"\nx  The job manifest specified ({self.args.job_status}) does not exist!")
+            return []
+
+        manifest_dir = os.path.dirname(os.path.abspath(self.args.job_status))
+        df_jobs = pd.read_csv(self.args.job_status)
+        status_rows = []
+        for job_row in df_jobs.to_dict("records"):
+            input_name = os.path.splitext(job_row["Input"])[0]
+            output, status = "", "missing"
+            for program in job_commands:
+                output_file = f"{input_name}.{job_commands[program][1]}"
+                if os.path.exists(Path(manifest_dir).joinpath(output_file)):
+                    output = output_file
+                    if classify_termination(Path(manifest_dir).joinpath(output_file)) == "normal":
+                        status = "normal"
+                    else:
+                        status = "failed"
+                    break
+            status_rows.append({"Task": job_row["Task"], "Input": job_row["Input"], "Output": output, "Status": status})
+
+        df_status = pd.DataFrame(status_rows, columns=["Task", "Input", "Output", "Status"])
+        df_status.to_csv(Path(manifest_dir).joinpath("QPREP_jobs_status.csv"), index=False)
+
+        n_tasks = df_status["Task"].nunique()
+        unfinished_tasks = sorted(df_status[df_status["Status"] != "normal"]["Task"].unique().tolist())
+        self.args.log.write(f"\no  {n_tasks - len(unfinished_tasks)} of {n_tasks} task(s) finished normally ({(df_status['Status'] == 'normal').sum()} normal, {(df_status['Status'] == 'failed').sum()} failed and {(df_status['Status'] == 'missing').sum()} missing output(s), see QPREP_jobs_status.csv)")
+        if len(unfinished_tasks) > 0:
+            self.args.log.write(f"o  Tasks to resubmit: {','.join([str(task) for task in unfinished_tasks])}")
+
+        return unfinished_tasks
+
     def check_level_of_theory(self):
         """
         Cross check a chosen functional and basis set against a precompiled list of available options.
         Not necessarily a definitive list!
         """
 
-        # read the predifined list of functionals and basis sets
-        functional_csv = TEMPLATES_PATH / Path('functionals.csv')
-        basis_set_csv = TEMPLATES_PATH / Path('basis_sets.csv')
-        
-        functional_data = pd.read_csv(functional_csv)
-        functional_data.drop_duplicates(inplace=True)
-
-        basis_set_data = pd.read_csv(basis_set_csv)
-        basis_set_data.drop_duplicates(inplace=True)
-
-        functional_list = functional_data[self.args.program].to_numpy().flatten()
-        functional_list = [x for x in functional_list if str(x) != 'nan'] # remove NaN
-        basis_set_list = basis_set_data[self.args.program].to_numpy().flatten()
-        basis_set_list = [x for x in basis_set_list if str(x) != 'nan'] # remove NaN
+        functional_list, basis_set_list = load_level_of_theory(self.args.program)
 
         found_func, found_basis = False, False
 
         # first, look for the basis set from gen/genecp, both sets of basis sets used (i.e. for
         # gen atoms and for other atoms)
         if self.args.bs_gen != '':
-            if self.args.bs_gen.upper() in (bs.upper() for bs in basis_set_list):
-                if self.args.bs_nogen.upper() in (bs.upper() for bs in basis_set_list):
+            if self.args.bs_gen.upper() in basis_set_list:
+                if self.args.bs_nogen.upper() in basis_set_list:
                     found_basis = True
 
         # for all the keywords in the qm_input option, check if there are compatible functionals and
@@ -593,9 +1254,9 @@ class qprep:
         for keyword in self.args.qm_input.split():
             for subkey in keyword.split('/'):
                 if subkey.count('opt') == 0 and subkey.count('freq') == 0 and subkey.count('scrf') == 0 and subkey.count('pop') == 0 and subkey.count('gen') == 0:
-                    if subkey.upper() in (func.upper() for func in functional_list):
+                    if subkey.upper() in functional_list:
                         found_func = True
-                    if subkey.upper() in (bs.upper() for bs in basis_set_list):
+                    if subkey.upper() in basis_set_list:
                         found_basis = True
 
         if not found_func:
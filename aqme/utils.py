@@ -4,7 +4,12 @@
 ######################################################.
 
 import os
+import io
 import re
+import mmap
+import gzip
+import lzma
+import bz2
 import subprocess
 import sys
 import time
@@ -13,11 +18,15 @@ import glob
 import yaml
 import ast
 from pathlib import Path
+from itertools import islice
+from functools import lru_cache
 from rdkit.Chem.rdMolAlign import GetBestRMS
 from rdkit.Chem.rdmolops import RemoveHs
 from rdkit.Chem import Mol
 from rdkit.Chem import AllChem as Chem
 from aqme.argument_parser import set_options, var_dict
+from aqme.ensemble import EnsembleStore, ens_extension
+from aqme.bundle import split_bundle_path, open_bundle_file
 from rdkit import RDLogger
 
 GAS_CONSTANT = 8.3144621  # J / K / mol
@@ -33,6 +42,12 @@ crest_version = '3.0.2'
 
 RDLogger.DisableLog("rdApp.*")
 
+# header of the data fields in SDF files (i.e. ">  <Energy>  (1) ")
+sdf_field_pattern = re.compile(r"^>.*?<(.+?)>")
+
+# compressed files that are read transparently (i.e. FILE.log.gz or FILE.out.xz)
+compressed_formats = {".gz": gzip, ".xz": lzma, ".bz2": bz2}
+
 
 def run_command(command, outfile, cwd=None):
     """
@@ -311,9 +326,17 @@ def command_line_args():
         "chk",
         "oldchk",
         "nodup_check",
+        "compress_json",
+        "restart_inputs",
+        "split_outputs",
+        "results_db",
+        "incremental",
+        "watch",
         "robert",
         "debug",
-        "pytest_testing"
+        "pytest_testing",
+        "ens_store",
+        "dup_qprep"
     ]
     list_args = [
         "files",
@@ -339,7 +362,12 @@ def command_line_args():
         "nrot_fullmonte",
         "nprocs",
         "crest_runs",
-        "sample"
+        "sample",
+        "cmin_checkpoint",
+        "stats_checkpoint",
+        "workers_qprep",
+        "pack_inputs",
+        "array_tasks"
     ]
     float_args = [
         "ewin_cmin",
@@ -359,6 +387,7 @@ def command_line_args():
         "s2_threshold",
         "vdwfrac",
         "covfrac",
+        "watch_interval",
         "bond_thres",
         "angle_thres",
         "dihedral_thres",
@@ -367,6 +396,9 @@ def command_line_args():
         "qdescp_acc",
         "dbstep_r",
         "crest_nclust",
+        "boltz_pop",
+        "boltz_temp",
+        "boltz_cluster_rms",
     ]
 
     for arg in var_dict:
@@ -572,64 +604,203 @@ def load_variables(kwargs, aqme_module, create_dat=True):
     return self
 
 
-def read_file(initial_dir, w_dir, file):
+def is_compressed(file):
+    """
+    Checks whether a file is compressed with gzip, xz or bzip2 (from its extension)
+    """
+
+    return os.path.splitext(str(file))[1].lower() in compressed_formats
+
+
+def open_file(file, mode="r"):
     """
-    Reads through a file and retrieves a list with all the lines.
+    Opens plain text and compressed files (gz, xz and bz2). Compressed files are
+    decompressed while they are read, without creating uncompressed copies. Files
+    inside ZIP/TAR bundles are read from their virtual paths (PATH/BUNDLE.zip/FILE).
     """
 
-    os.chdir(w_dir)
-    outfile = open(file, "r")
-    outlines = outfile.readlines()
-    outfile.close()
-    os.chdir(initial_dir)
+    if "r" in mode and not os.path.exists(file) and split_bundle_path(file) is not None:
+        bundle_stream = open_bundle_file(file, "rb")
+        if not is_compressed(file):
+            if "b" in mode:
+                return bundle_stream
+            return io.TextIOWrapper(bundle_stream, encoding="utf-8", errors="replace")
+        if "b" not in mode and "t" not in mode:
+            mode += "t"
+        return compressed_formats[os.path.splitext(str(file))[1].lower()].open(bundle_stream, mode)
+
+    if not is_compressed(file):
+        return open(file, mode)
+    if "b" not in mode and "t" not in mode:
+        mode += "t"
 
-    return outlines
+    return compressed_formats[os.path.splitext(str(file))[1].lower()].open(file, mode)
 
 
-def QM_coords(outlines, min_RMS, n_atoms, program, keywords_line):
+def get_file_format(file):
     """
-    Retrieves atom types and coordinates from QM output files
+    Returns the format of a file, ignoring the extension of compressed files
+    (i.e. 'log' for FILE.log.gz)
     """
 
-    atom_types, cartesians, range_lines = [], [], []
-    per_tab = periodic_table()
-    count_RMS = -1
+    file_name = os.path.basename(Path(file))
+    if is_compressed(file_name):
+        file_name = os.path.splitext(file_name)[0]
+
+    return file_name.split(".")[-1]
 
+
+# headers of the geometry blocks and patterns of the charge and multiplicity in QM output files
+geom_headers = {
+    "gaussian": [b"Standard orientation:", b"Input orientation:"],
+    "orca": [b"CARTESIAN COORDINATES (ANGSTROEM)"],
+}
+charge_mult_patterns = {
+    "gaussian": (
+        re.compile(rb"Charge\s*=\s*(-?\d+)\s+Multiplicity\s*=\s*(\d+)"),
+        None,
+    ),
+    "orca": (
+        re.compile(rb"Total Charge\s+Charge\s+\.+\s+(-?\d+)"),
+        re.compile(rb"Multiplicity\s+Mult\s+\.+\s+(\d+)"),
+    ),
+}
+
+
+def read_geom_block(lines, program):
+    """
+    Reads the atom types and coordinates of a geometry block from an iterator of lines (as bytes)
+    placed right after the header of the block
+    """
+
+    per_tab = periodic_table()
+    atom_types, cartesians = [], []
     if program == "gaussian":
-        if "nosymm" in keywords_line.lower():
-            target_ori = "Input orientation:"
+        # dashes, two title lines and dashes before the atoms
+        n_fields, skip_lines = 6, 4
+    else:
+        n_fields, skip_lines = 4, 1
+    for _ in range(skip_lines):
+        next(lines, b"")
+
+    for line in lines:
+        fields = line.split()
+        if len(fields) != n_fields:
+            break
+        if program == "gaussian":
+            massno = int(fields[1])
+            if massno < len(per_tab):
+                atom_types.append(per_tab[massno])
+            else:
+                atom_types.append("XX")
         else:
-            target_ori = "Standard orientation:"
-
-        if min_RMS > -1:
-            for i, line in enumerate(outlines):
-                if line.find(target_ori) > -1:
-                    count_RMS += 1
-                if count_RMS == min_RMS:
-                    range_lines = [i + 5, i + 5 + n_atoms]
+            atom_types.append(fields[0].decode())
+        cartesians.append([float(coord) for coord in fields[-3:]])
+
+    return atom_types, cartesians
+
+
+def QM_file_coords(file, min_RMS=-1, keywords_line=""):
+    """
+    Retrieves atom types, coordinates, charge and multiplicity from Gaussian and ORCA output
+    files without loading the whole file. Uncompressed files are memory-mapped: the last geometry
+    is found searching backwards from the end of the file (or forwards for the geometry of the
+    optimization step min_RMS) and only that block and the charge/multiplicity lines are parsed.
+    Compressed files (and files inside bundles) are streamed keeping only one geometry block in
+    memory. The charge and mult are None if they aren't found.
+    """
+
+    atom_types, cartesians, charge, mult = [], [], None, None
+
+    if is_compressed(file) or not os.path.exists(file):
+        with open_file(file, "rb") as F:
+            program = "gaussian"
+            for line in islice(F, 200):
+                if line.find(b"O   R   C   A") > -1:
+                    program = "orca"
                     break
-        else:
-            for i in reversed(range(len(outlines))):
-                if outlines[i].find(target_ori) > -1:
-                    range_lines = [i + 5, i + 5 + n_atoms]
+            headers = get_geom_headers(program, keywords_line)
+            charge_pattern, mult_pattern = charge_mult_patterns[program]
+            # the file is read again from the beginning, keeping the last block of each header
+            # (or the block of step min_RMS)
+            F.seek(0)
+            lines = iter(F)
+            geom_blocks = {header: [-1, [], []] for header in headers}
+            for line in lines:
+                if charge is None:
+                    charge_match = charge_pattern.search(line)
+                    if charge_match is not None:
+                        charge = int(charge_match.group(1))
+                        if mult_pattern is None:
+                            mult = int(charge_match.group(2))
+                if mult is None and mult_pattern is not None:
+                    mult_match = mult_pattern.search(line)
+                    if mult_match is not None:
+                        mult = int(mult_match.group(1))
+                for header in headers:
+                    geom_block = geom_blocks[header]
+                    if line.find(header) > -1 and (min_RMS == -1 or geom_block[0] < min_RMS):
+                        geom_block[0] += 1
+                        geom_block[1], geom_block[2] = read_geom_block(lines, program)
+            for header in headers:
+                n_block = geom_blocks[header][0]
+                if n_block > -1 and (min_RMS == -1 or n_block == min_RMS):
+                    atom_types, cartesians = geom_blocks[header][1:]
                     break
-        if len(range_lines) != 0:
-            for i in range(range_lines[0], range_lines[1]):
-                massno = int(outlines[i].split()[1])
-                if massno < len(per_tab):
-                    atom_symbol = per_tab[massno]
+
+        return atom_types, cartesians, charge, mult
+
+    with open(file, "rb") as F:
+        if os.fstat(F.fileno()).st_size == 0:
+            return atom_types, cartesians, charge, mult
+        with mmap.mmap(F.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            program = "gaussian"
+            if mm.find(b"O   R   C   A", 0, 1048576) > -1:
+                program = "orca"
+
+            # the first header type is used (i.e. Standard orientation), the others are only
+            # used if the file doesn't contain it (i.e. Input orientation for nosymm calcs)
+            block_pos = -1
+            for header in get_geom_headers(program, keywords_line):
+                if min_RMS > -1:
+                    for _ in range(min_RMS + 1):
+                        block_pos = mm.find(header, block_pos + 1)
+                        if block_pos == -1:
+                            break
                 else:
-                    atom_symbol = "XX"
-                atom_types.append(atom_symbol)
-                cartesians.append(
-                    [
-                        float(outlines[i].split()[3]),
-                        float(outlines[i].split()[4]),
-                        float(outlines[i].split()[5]),
-                    ]
-                )
+                    block_pos = mm.rfind(header)
+                if block_pos > -1:
+                    break
+            if block_pos > -1:
+                mm.seek(block_pos)
+                mm.readline()
+                atom_types, cartesians = read_geom_block(iter(mm.readline, b""), program)
+
+            # the charge and mult are printed at the beginning of the outputs
+            charge_pattern, mult_pattern = charge_mult_patterns[program]
+            charge_match = charge_pattern.search(mm)
+            if charge_match is not None:
+                charge = int(charge_match.group(1))
+                if mult_pattern is None:
+                    mult = int(charge_match.group(2))
+            if mult_pattern is not None:
+                mult_match = mult_pattern.search(mm)
+                if mult_match is not None:
+                    mult = int(mult_match.group(1))
+
+    return atom_types, cartesians, charge, mult
+
+
+def get_geom_headers(program, keywords_line):
+    """
+    Headers of the geometry blocks searched in QM output files, in order of preference
+    """
 
-    return atom_types, cartesians
+    headers = list(geom_headers[program])
+    if program == "gaussian" and "nosymm" in keywords_line.lower():
+        headers.reverse()
+
+    return headers
 
 
 def cclib_atoms_coords(cclib_data):
@@ -718,6 +889,20 @@ def mol_from_sdf_or_mol_or_mol2(input_file, module, args, low_check=None):
     mol object from SDF, MOL or MOL2 files
     """
     if module in ["qprep","cmin"]:
+        # binary ensemble stores only create the mol objects that are selected
+        if os.path.splitext(input_file)[1].lower() == ens_extension:
+            ens_store = EnsembleStore(input_file)
+            idx_list = None
+            if low_check is not None and len(ens_store) > 0:
+                idx_list = get_low_check_idx(ens_store.energies, low_check)
+            return ens_store.get_mols(idx_list)
+
+        # when only some mols are needed, the SDF index avoids parsing the rest of the records
+        if low_check is not None:
+            mols = select_sdf_mols(input_file, low_check)
+            if mols is not None:
+                return mols
+
         # using sanitize=False to avoid reading problems
         mols = Chem.SDMolSupplier(input_file, removeHs=False, sanitize=False)
         # transform invalid SDF files created with GaussView into valid SDF from Open Babel
@@ -752,6 +937,9 @@ def mol_from_sdf_or_mol_or_mol2(input_file, module, args, low_check=None):
 
         if extension.lower() == "sdf":
             mols = load_sdf(input_file)
+        elif f'.{extension.lower()}' == ens_extension:
+            ens_store = EnsembleStore(input_file)
+            mols = ens_store.get_mols()
 
         elif extension.lower() == "mol":
             mols = [Chem.MolFromMolFile(input_file, removeHs=False)]
@@ -760,19 +948,21 @@ def mol_from_sdf_or_mol_or_mol2(input_file, module, args, low_check=None):
 
         IDs, charges, mults = [], [], []
 
-        with open(input_file, "r") as F:
-            lines = F.readlines()
-
-        for i, line in enumerate(lines):
-            if line.find(">  <ID>") > -1:
-                ID = ' '.join(lines[i + 1].split()[:-1])
-                IDs.append(ID)
-            if line.find(">  <Real charge>") > -1:
-                charge = lines[i + 1].split()[0]
-                charges.append(charge)
-            if line.find(">  <Mult>") > -1:
-                mult = lines[i + 1].split()[0]
-                mults.append(mult)
+        # IDs, charges and mults are read from the SDF index (or from the properties of ENS files)
+        if f'.{extension.lower()}' == ens_extension:
+            ID_props, charge_props, mult_props = ens_store.get_prop("ID"), ens_store.get_prop("Real charge"), ens_store.get_prop("Mult")
+        else:
+            sdf_index = get_sdf_index(input_file)
+            ID_props, charge_props, mult_props = sdf_index.ids, sdf_index.charges, sdf_index.mults
+        for ID in ID_props:
+            if ID is not None:
+                IDs.append(' '.join(ID.split()[:-1]))
+        for charge in charge_props:
+            if charge is not None:
+                charges.append(charge.split()[0])
+        for mult in mult_props:
+            if mult is not None:
+                mults.append(mult.split()[0])
 
         suppl = []
         for i, mol in enumerate(mols):
@@ -806,6 +996,139 @@ def mol_from_sdf_or_mol_or_mol2(input_file, module, args, low_check=None):
         return suppl, charges, mults, IDs
 
 
+class SDFIndex:
+    """
+    Index of an SDF file built in one pass. It stores the byte offsets of each
+    record and the small data fields used by AQME (name, energy, charge, mult,
+    SMILES and ID), so the records can be parsed lazily only when needed.
+
+    Parameters
+    ----------
+    sdf_file : str
+        SDF (or MOL) file to index
+    """
+
+    # SDF data fields stored in the index and their attributes
+    fields = {"Energy": "energies", "Real charge": "charges", "Mult": "mults", "SMILES": "smiles", "ID": "ids"}
+
+    def __init__(self, sdf_file):
+        self.sdf_file = sdf_file
+        self.offsets, self.names = [], []
+        for attribute in self.fields.values():
+            setattr(self, attribute, [])
+
+        with open(sdf_file, "rb") as F:
+            start, pos = 0, 0
+            name, field, record_fields, content = None, None, {}, False
+            for line in F:
+                pos += len(line)
+                text = line.decode("utf-8", errors="replace").rstrip("\r\n")
+                if text.strip() == "$$$$":
+                    self.add_record(start, pos, name, record_fields)
+                    start, name, field, record_fields, content = pos, None, None, {}, False
+                    continue
+                if text.strip() != "":
+                    content = True
+                if name is None:
+                    name = text.strip()
+                elif field is not None:
+                    record_fields[field] = text.strip()
+                    field = None
+                else:
+                    field_match = sdf_field_pattern.match(text)
+                    if field_match is not None and field_match.group(1) in self.fields:
+                        field = field_match.group(1)
+            # files without the final $$$$ (i.e. MOL files)
+            if content:
+                self.add_record(start, pos, name, record_fields)
+
+    def add_record(self, start, end, name, record_fields):
+        self.offsets.append((start, end))
+        self.names.append(name)
+        for field, attribute in self.fields.items():
+            getattr(self, attribute).append(record_fields.get(field))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_mols(self, idx_list, sanitize=False, removeHs=False):
+        """
+        Parses only the records selected (None is returned for records that RDKit can't read)
+        """
+
+        mols = []
+        with open(self.sdf_file, "rb") as F:
+            for idx in idx_list:
+                start, end = self.offsets[idx]
+                F.seek(start)
+                suppl = Chem.SDMolSupplier()
+                suppl.SetData(F.read(end - start).decode("utf-8", errors="replace"), sanitize=sanitize, removeHs=removeHs)
+                mols.append(suppl[0] if len(suppl) > 0 else None)
+
+        return mols
+
+
+@lru_cache(maxsize=32)
+def load_sdf_index(sdf_file, size, mtime_ns):
+    """
+    SDF indexes of the files used recently (the size and modification time of the files
+    are part of the key, so the indexes of modified files are built again)
+    """
+
+    return SDFIndex(sdf_file)
+
+
+def get_sdf_index(sdf_file):
+    """
+    Returns the SDFIndex of a file, the index is only built again when the file changes
+    """
+
+    file_stat = os.stat(sdf_file)
+
+    return load_sdf_index(os.path.abspath(sdf_file), file_stat.st_size, file_stat.st_mtime_ns)
+
+
+def select_sdf_mols(input_file, low_check):
+    """
+    Parses only the mols selected with low_check (lowest_only, lowest_n or e_threshold_qprep)
+    from the SDF index. Returns None if the selection can't be done from the index.
+    """
+
+    sdf_index = get_sdf_index(input_file)
+    if len(sdf_index) == 0:
+        return None
+    idx_list = get_low_check_idx(sdf_index.energies, low_check)
+    if idx_list is None:
+        return None
+
+    mols = sdf_index.get_mols(idx_list, sanitize=False)
+    if None in mols:
+        return None
+
+    return mols
+
+
+def get_low_check_idx(energies, low_check):
+    """
+    Indexes of the conformers selected with low_check (lowest_only, lowest_n or e_threshold_qprep).
+    Returns None if the selection can't be done (i.e. missing energies).
+    """
+
+    if low_check=='lowest_only':
+        idx_list = [0]
+    elif isinstance(low_check, int):
+        idx_list = list(range(min(len(energies),low_check)))
+    elif isinstance(low_check, float):
+        if None in energies:
+            return None
+        energy_min = float(energies[0])
+        idx_list = [i for i, energy in enumerate(energies) if abs(float(energy) - energy_min) < low_check] # kcal/mol
+    else:
+        return None
+
+    return idx_list
+
+
 def load_sdf(input_file):
     '''
     Get mols from SDF files
@@ -71,6 +71,28 @@ def test_cmin_methods(
         assert coord not in outlines[4]
     os.chdir(w_dir_main)
 
+# tests of the checkpoints that stop optimizations of duplicated conformers
+@pytest.mark.parametrize(
+    "program, sdf, cmin_checkpoint, output_nummols",
+    [
+        ("xtb", "pentane_rdkit_methods.sdf", 5, 4),
+        ("ani", "pentane_rdkit_methods.sdf", 20, 4),
+    ],
+)
+def test_cmin_checkpoint(
+    program, sdf, cmin_checkpoint, output_nummols, monkeypatch
+):
+
+    monkeypatch.chdir(cmin_methods_dir)
+    cmin(program=program,files=f'{cmin_methods_dir}/{sdf}',cmin_checkpoint=cmin_checkpoint)
+
+    file = f'{cmin_methods_dir}/CMIN/{sdf.split(".")[0]}_{program}.sdf'
+    assert os.path.exists(file)
+
+    # the duplicates stopped at the checkpoints should not remove unique conformers
+    mols = rdkit.Chem.SDMolSupplier(file, removeHs=False, sanitize=False)
+    assert len(mols) == output_nummols
+
 @pytest.mark.parametrize(
     "test",
     [
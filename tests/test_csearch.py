@@ -9,6 +9,8 @@ import os
 import pytest
 import glob
 from aqme.csearch import csearch
+from aqme.qprep import qprep
+from aqme.ensemble import EnsembleStore, ensemble_to_sdf
 import rdkit
 import shutil
 
@@ -570,10 +572,15 @@ def test_csearch_rdkit_parameters(
         datfile_rdkit = datfile.readlines()
         datfile.close()
         butina_found = False
+        prefilter_found = False
         for line in datfile_rdkit:
             if 'conformers using a combination of energies and Butina RMS-based clustering' in line:
                 butina_found = True
+            if 'The geometric prefilter avoided' in line:
+                prefilter_found = True
         assert butina_found
+        # check that the RMSD calculations avoided by the geometric prefilter are reported
+        assert prefilter_found
 
     # check that H atoms are included
     outfile = open(file,"r")
@@ -587,6 +594,87 @@ def test_csearch_rdkit_parameters(
     os.chdir(w_dir_main)
 
 
+# tests for the geometry rules of the geom option
+@pytest.mark.parametrize(
+    "smi, name, geom, output_nummols",
+    [
+        ("CCCCC", "pentane_geom", ["CCCC", 60], 3), # only gauche conformers
+        ("CCCCC", "pentane_geom_atom", ["Pd", 0], None), # rules that can't be matched discard all conformers
+    ],
+)
+def test_csearch_geom(smi, name, geom, output_nummols, monkeypatch):
+    monkeypatch.chdir(csearch_rdkit_summ_dir)
+    csearch(
+        w_dir_main=csearch_rdkit_summ_dir,
+        program="rdkit",
+        smi=smi,
+        name=name,
+        geom=geom,
+    )
+
+    file = str("CSEARCH/" + name + "_rdkit.sdf")
+    if output_nummols is None:
+        assert not os.path.exists(file)
+    else:
+        mols = rdkit.Chem.SDMolSupplier(file, removeHs=False)
+        assert len(mols) == output_nummols
+        for mol in mols:
+            dihedral = rdkit.Chem.rdMolTransforms.GetDihedralDeg(mol.GetConformer(), 0, 1, 2, 3)
+            assert geom[1] - 30 <= dihedral <= geom[1] + 30
+
+
+# tests for the binary ensemble stores (ENS files)
+@pytest.mark.parametrize(
+    "smi, name, output_nummols",
+    [
+        ("CCCCC", "pentane_ens", 4),
+    ],
+)
+def test_csearch_ens_store(smi, name, output_nummols, monkeypatch):
+    monkeypatch.chdir(csearch_rdkit_summ_dir)
+    csearch(
+        w_dir_main=csearch_rdkit_summ_dir,
+        program="rdkit",
+        smi=smi,
+        name=name,
+        ens_store=True,
+    )
+
+    # the SDF file is replaced by the ENS file
+    file = f"{csearch_rdkit_summ_dir}/CSEARCH/{name}_rdkit.ens"
+    assert os.path.exists(file)
+    assert not os.path.exists(file.replace(".ens", ".sdf"))
+
+    ens_store = EnsembleStore(file)
+    assert len(ens_store) == output_nummols
+    assert ens_store.coords.shape == (output_nummols, 17, 3)
+    mols = ens_store.get_mols()
+    assert mols[0].GetProp("Real charge") == "0"
+    assert mols[0].GetProp("Mult") == "1"
+    energies = [float(mol.GetProp("Energy")) for mol in mols]
+    assert energies == sorted(energies)
+
+    # ENS files are accepted by QPREP and the SDF is generated only on demand
+    qprep(files=file, program="gaussian", qm_input="wb97xd/def2svp", lowest_n=2, destination=f"{csearch_rdkit_summ_dir}/QCALC_ens")
+    assert len(glob.glob(f"{csearch_rdkit_summ_dir}/QCALC_ens/{name}_rdkit_conf_*.com")) == 2
+    sdf_file = ensemble_to_sdf(file)
+    assert len(rdkit.Chem.SDMolSupplier(sdf_file, removeHs=False)) == output_nummols
+    shutil.rmtree(f"{csearch_rdkit_summ_dir}/QCALC_ens")
+
+    # ENS files are also accepted as inputs of CSEARCH
+    csearch(
+        destination=f"{csearch_rdkit_summ_dir}/CSEARCH_ens",
+        program="rdkit",
+        input=file,
+    )
+    ens_files = glob.glob(f"{csearch_rdkit_summ_dir}/CSEARCH_ens/*_rdkit.sdf")
+    assert len(ens_files) == output_nummols
+    mols = rdkit.Chem.SDMolSupplier(ens_files[0], removeHs=False)
+    assert mols[0].GetNumAtoms() == 17
+    assert mols[0].GetProp("Real charge") == "0"
+    shutil.rmtree(f"{csearch_rdkit_summ_dir}/CSEARCH_ens")
+
+
 # tests for individual organic molecules and metal complexes with different types of csearch methods
 @pytest.mark.parametrize(
     "program, smi, name, complex, metal_complex, complex_type, constraints_dist, constraints_angle, constraints_dihedral, charge, mult, crest_keywords, destination, output_nummols",
@@ -7,11 +7,26 @@
 import os
 from os import path
 import glob
+import gzip
+import json
 import pytest
 import shutil
 import subprocess
 from pathlib import Path
 import pandas as pd
+from aqme.qcorr import qcorr
+from aqme.qcorr_utils import (
+    classify_termination,
+    check_isomerization,
+    gen_connectivity,
+    ResultsStore,
+    get_json_data,
+    cclib_to_json,
+    iter_reversed_lines,
+    full_check,
+    get_json_files,
+)
+from aqme.utils import Logger, open_file
 
 # saves the working directory
 path_main = os.getcwd()
@@ -939,6 +954,10 @@ def test_QCORR_analysis(init_folder, file, command_line, target_folder, restore_
         # ensure the output file moves to the right folder
         assert path.exists(f"{w_dir_main}/{target_folder}/{file}")
 
+        # ensure that the index used to detect duplicates is stored for the next runs
+        df_dup_index = pd.read_csv(f"{w_dir_main}/QCORR_duplicate_index.csv")
+        assert list(df_dup_index["File"]) == ["CH4.json"]
+
     elif init_folder == "QCORR_7":
         w_dir_main = f"{path_qcorr}/QCORR_7"
         cmd_aqme = [
@@ -983,3 +1002,389 @@ def test_QCORR_analysis(init_folder, file, command_line, target_folder, restore_
         for dat_file in dat_files:
             if "QCORR" in dat_file:
                 os.remove(dat_file)
+
+
+# tests for the fast classification of terminations from the last lines of the QM outputs
+@pytest.mark.parametrize(
+    "folder, file, termination",
+    [
+        ("QCORR_1", "Basis_set_error1.log", "atomicbasiserror"),
+        ("QCORR_1", "Basis_set_error2.log", "atomicbasiserror"),
+        ("QCORR_1", "MeOH_SCF_error.log", "SCFerror"),
+        ("QCORR_1", "CH4_SP.log", "normal"),
+        ("QCORR_7", "orca_TS_success.out", "normal"),
+    ],
+)
+def test_QCORR_classify_termination(folder, file, termination, monkeypatch):
+    monkeypatch.chdir(path_main)
+    assert classify_termination(f"{path_qcorr}/{folder}/{file}") == termination
+
+
+# tests for the metadata read from the beginning and the end of the QM outputs
+@pytest.mark.parametrize(
+    "folder, file, program, keywords_line",
+    [
+        ("QCORR_1", "TS_CH3HCH3.log", "Gaussian 09, Revision A.02", "opt=(calcfc,ts,noeigen) freq b3lyp/3-21g"),
+        ("QCORR_7", "orca_TS_success.out", "ORCA version 5.0.3", "wb97x-d3 6-31g(d,p) OPTTS NormalPNO TightSCF FREQ DEFGRID3 CPCM(CH2CL2)"),
+    ],
+)
+def test_QCORR_get_json_data(tmp_path, folder, file, program, keywords_line, monkeypatch):
+    monkeypatch.chdir(path_main)
+    qm_file = f"{path_qcorr}/{folder}/{file}"
+    with open(qm_file) as F:
+        outlines = F.readlines()
+    # the file is read backwards in blocks
+    assert list(iter_reversed_lines(qm_file, block_size=100)) == outlines[::-1]
+
+    shutil.copy(qm_file, tmp_path)
+    with open(qm_file, "rb") as F_in, gzip.open(tmp_path / f"{file}.gz", "wb") as F_out:
+        shutil.copyfileobj(F_in, F_out)
+    cclib_json = cclib_to_json(qm_file)
+    cclib_data = get_json_data(tmp_path, file, json.loads(cclib_json))
+    assert cclib_data["metadata"]["QM program"] == program
+    assert keywords_line in cclib_data["metadata"]["keywords line"]
+    assert cclib_data["metadata"]["ground or transition state"] == "transition_state"
+    # the working directory is not changed and compressed files give the same data
+    assert os.getcwd() == path_main
+    assert get_json_data(tmp_path, f"{file}.gz", json.loads(cclib_json)) == cclib_data
+
+
+# tests for the full check analysis (the files are grouped by the values of each property)
+def test_QCORR_full_check(tmp_path, monkeypatch):
+    monkeypatch.chdir(path_main)
+    json_file = f"{path_main}/Example_workflows/QPREP_generating_input_files/json_files/MeOH_NMR.json"
+    with open(json_file) as F:
+        cclib_data = json.load(F)
+    for i, grid_type in enumerate(["fine", "ultrafine", "fine"]):
+        cclib_data["metadata"]["grid type"] = grid_type
+        with open(tmp_path / f"calc_{i}.json", "w") as F:
+            json.dump(cclib_data, F)
+
+    log = Logger(tmp_path / "QCORR", "fullcheck")
+    full_check(w_dir_main=tmp_path, destination_fullcheck=tmp_path / "fullcheck", files=sorted(glob.glob(f"{tmp_path}/*.json")), log=log)
+    log.finalize()
+    with open(tmp_path / "fullcheck" / "--QCORR_Fullcheck_Analysis--.dat") as F:
+        fullcheck_txt = F.read()
+    assert "o  Same program (Gaussian 16, Revision C.01) used in all the calculations" in fullcheck_txt
+    assert "x  Different grid_type used in the calculations:\n     * fine in:" in fullcheck_txt
+    assert "       - calc_0\n       - calc_2\n     * ultrafine in:\n       - calc_1" in fullcheck_txt
+
+
+# tests for the isomerization filter using the initial connectivity from a CSV file
+def test_QCORR_isomerization_csv():
+    atoms = ["C", "H", "H", "H", "H"]
+    coords = [[0, 0, 0], [0, 0, 1.09], [1.03, 0, -0.36], [-0.5, 0.9, -0.36], [-0.5, -0.9, -0.36]]
+    isom_data = {"VdW radii fraction": 0.5, "Covalent radii fraction": 1.1}
+    init_connectiv = str(gen_connectivity(isom_data, atoms, coords).astype(float))
+
+    # the C-H1 bond is broken in the final structure
+    coords_output = [coord[:] for coord in coords]
+    coords_output[1] = [0, 0, 3.0]
+    init_csv = pd.DataFrame(
+        {"code_name": ["CH4"], "initial_connectiv": [init_connectiv], "TS_atom_idx": ["0,1"]}
+    ).set_index("code_name", drop=False)
+    isom_data["Atoms output"] = atoms
+    isom_data["Coords output"] = coords_output
+
+    # bonds from TS atoms are ignored
+    isom_data["Initial csv"] = init_csv
+    assert not check_isomerization(isom_data, "CH4_1.log")
+    isom_data["Initial csv"] = init_csv.drop(columns="TS_atom_idx")
+    assert check_isomerization(isom_data, "CH4_1.log")
+
+
+# tests for the SQLite database with the results from QCORR
+def test_QCORR_results_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(path_main)
+    json_file = f"{path_main}/Example_workflows/QPREP_generating_input_files/json_files/MeOH_NMR.json"
+    with open(json_file) as F:
+        cclib_data = json.load(F)
+
+    results_store = ResultsStore(tmp_path / ResultsStore.db_name)
+    results_store.add("MeOH_NMR", cclib_data, folder="success")
+    results_store.close()
+
+    # the data is queried from the database after reopening it
+    results_store = ResultsStore(tmp_path / ResultsStore.db_name)
+    df_results = results_store.query("energy < ?", (-100,))
+    assert list(df_results["name"]) == ["MeOH_NMR"]
+    assert df_results["n_atoms"][0] == 6
+    assert json.loads(df_results["nmr"][0]) == cclib_data["properties"]["NMR"]
+
+    # the JSON files exported are the same as the initial JSON files
+    json_files = results_store.export_json(tmp_path / "json_files")
+    with open(json_files[0]) as F:
+        assert json.load(F) == cclib_data
+
+    # the parameters of the full check are queried by name in chunks
+    names = [f"calc_{i}" for i in range(1200)] + ["MeOH_NMR"]
+    fullcheck_props = results_store.get_fullcheck_props(names, chunk_size=500)
+    assert list(fullcheck_props) == ["MeOH_NMR"]
+    assert fullcheck_props["MeOH_NMR"][0] == cclib_data["metadata"]["QM program"]
+    results_store.close()
+
+
+# tests for the incremental mode of QCORR
+def test_QCORR_incremental(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for file in ["CH4.log", "MeOH_SCF_error.log"]:
+        shutil.copy2(f"{path_qcorr}/QCORR_1/{file}", tmp_path)
+    qcorr(files="*.log", incremental=True)
+    assert path.exists(tmp_path / "success/CH4.log")
+
+    # files that were already analyzed are skipped, even if they are copied again
+    shutil.copy2(tmp_path / "success/CH4.log", tmp_path)
+    shutil.copy2(f"{path_qcorr}/QCORR_1/z_CH4_duplicate.log", tmp_path)
+    qcorr(files="*.log", incremental=True)
+    assert path.exists(tmp_path / "CH4.log")
+    assert path.exists(tmp_path / "failed/run_1/duplicates/z_CH4_duplicate.log")
+
+    df_manifest = pd.read_csv(tmp_path / "QCORR_manifest.csv")
+    assert list(df_manifest["File"]) == ["CH4.log", "MeOH_SCF_error.log", "z_CH4_duplicate.log"]
+    assert list(df_manifest["Error type"]) == ["none", "SCFerror", "duplicate_calc"]
+
+    # the stats of the second analysis are appended
+    df_stats = pd.read_csv(tmp_path / "QCORR-run_1-stats.csv")
+    assert list(df_stats["Total files"]) == [2, 1]
+    assert list(df_stats["Duplicates"]) == [0, 1]
+
+
+# tests for the JSON profiles (the duplicate filter works with the minimal JSON files)
+def test_QCORR_json_profile(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    shutil.copy2(f"{path_qcorr}/QCORR_1/CH4.log", tmp_path)
+    qcorr(files="CH4.log", json_profile="minimal", fullcheck=False)
+    with open(tmp_path / "success/json_files/CH4.json") as F:
+        json_text = F.read()
+    cclib_data = json.loads(json_text)
+    assert "orbitals" not in cclib_data["properties"]
+    assert list(cclib_data["vibrations"]) == ["frequencies"]
+    assert cclib_data["metadata"]["functional"] == "M062X"
+    assert cclib_data["properties"]["energy"]["free energy"] < 0
+    # the numeric arrays are written in a single line
+    assert '"number": [6,1,1,1,1]' in json_text
+
+    shutil.copy2(f"{path_qcorr}/QCORR_1/z_CH4_duplicate.log", tmp_path)
+    qcorr(files="z_CH4_duplicate.log", json_profile="minimal", fullcheck=False)
+    assert path.exists(tmp_path / "failed/run_1/duplicates/z_CH4_duplicate.log")
+
+
+def test_QCORR_restart_inputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    shutil.copy2(f"{path_qcorr}/QCORR_1/Imag_freq.log", tmp_path)
+    with open(tmp_path / "Imag_freq.chk", "w") as F:
+        F.write("checkpoint")
+    qcorr(files="Imag_freq.log", fullcheck=False, incremental=True, restart_inputs=True)
+    fixed_folder = tmp_path / "failed/run_1/fixed_QM_inputs"
+    assert path.exists(fixed_folder / "Imag_freq_restart.chk")
+    with open(fixed_folder / "Imag_freq.com") as F:
+        com_text = F.read()
+    assert "%chk=Imag_freq.chk" in com_text
+    assert "%oldchk=Imag_freq_restart.chk" in com_text
+    assert "guess=read" in com_text
+    assert "readfc" in com_text
+    manifest = pd.read_csv(glob.glob(f"{tmp_path}/**/QCORR_manifest.csv", recursive=True)[0])
+    assert manifest["Restart file"].tolist() == ["Imag_freq.chk"]
+
+    # the checkpoints are not used by default
+    shutil.copy2(f"{path_qcorr}/QCORR_1/Imag_freq.log", tmp_path)
+    qcorr(files="Imag_freq.log", fullcheck=False)
+    with open(fixed_folder / "Imag_freq.com") as F:
+        com_text = F.read()
+    assert "oldchk" not in com_text and "guess=read" not in com_text
+
+    # the orbitals of SCF errors are not reused, and the force constants are only read
+    # when the calculation completed at least one OPT step
+    shutil.copy2(f"{path_qcorr}/QCORR_1/MeOH_SCF_error.log", tmp_path)
+    with open(f"{path_qcorr}/QCORR_1/CH2OH2_unfinished.log") as F:
+        log_text = F.read()
+    with open(tmp_path / "CH2OH2_first_step.log", "w") as F:
+        F.write(log_text[:log_text.find("         Item               Value")])
+    for name in ["MeOH_SCF_error", "CH2OH2_first_step"]:
+        with open(tmp_path / f"{name}.chk", "w") as F:
+            F.write("checkpoint")
+    qcorr(files=["MeOH_SCF_error.log", "CH2OH2_first_step.log"], fullcheck=False, restart_inputs=True)
+    with open(fixed_folder / "MeOH_SCF_error.com") as F:
+        com_text = F.read()
+    assert "scf=xqc" in com_text
+    assert "oldchk" not in com_text and "guess=read" not in com_text
+    with open(fixed_folder / "CH2OH2_first_step.com") as F:
+        com_text = F.read()
+    assert "%oldchk=CH2OH2_first_step_restart.chk" in com_text
+    assert "guess=read" in com_text and "readfc" not in com_text
+
+
+def test_QCORR_cost_report(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for file in ["H_freq.log", "MeOH_G09.log", "CH4.log"]:
+        shutil.copy2(f"{path_qcorr}/QCORR_1/{file}", tmp_path)
+    qcorr(files="*.log", fullcheck=False)
+    cost_report = pd.read_csv(tmp_path / "QCORR-run_1-cost.csv")
+    assert cost_report["Calculations"].sum() == 3
+    cost_report = cost_report.set_index("Level of theory")
+    assert cost_report.at["M062X/def2TZVP", "Atoms"] == "1-10"
+    assert cost_report.at["M062X/def2TZVP", "Processors"] == 12
+    assert cost_report.at["M062X/def2TZVP", "Memory (MB)"] == 24000
+    # CPU times of the opt and freq steps of CH4 (16 s + 6 s)
+    assert round(cost_report.at["M062X/3-21G", "Mean CPU time (h)"] * 3600) == 22
+    assert cost_report.at["M062X/3-21G", "Mean opt steps"] == 4
+
+
+def test_QCORR_split_outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Gaussian output with two jobs chained with --Link1-- (each job has opt and freq steps)
+    with open(f"{path_qcorr}/QCORR_1/H_freq.log") as F:
+        pack_lines = F.readlines()
+    with open(f"{path_qcorr}/QCORR_1/TS_CH3HCH3.log") as F:
+        ts_lines = F.readlines()
+    route_idx = [i for i, line in enumerate(ts_lines) if line.startswith(" #")][0]
+    pack_lines.append(" Link1:  Proceeding to internal job step number  3.\n")
+    pack_lines.extend(ts_lines[route_idx - 1:])
+    with open(tmp_path / "gaussian_pack.log", "w") as F:
+        F.writelines(pack_lines)
+    # the third job of the packed input never started
+    with open(tmp_path / "gaussian_pack.com", "w") as F:
+        F.write(
+            "--Link1--\n".join(
+                f"%nprocshared=8\n%mem=16GB\n# opt freq b3lyp/def2tzvp\n\n{title}\n\n0 1\nH 0.0 0.0 0.0\nH 0.0 0.0 0.74\n\n"
+                for title in ["H2_def2TZVP", "CH4", "H2_conf_3"]
+            )
+        )
+    # the normal outputs are not split
+    shutil.copy2(f"{path_qcorr}/QCORR_1/Imag_freq.log", tmp_path)
+
+    qcorr(files="*.log", fullcheck=False, split_outputs=True)
+    assert path.exists(tmp_path / "packed_outputs/gaussian_pack.log")
+    # the outputs are named as the titles of the jobs
+    assert path.exists(tmp_path / "success/H2_def2TZVP.log")
+    assert path.exists(tmp_path / "success/CH4.log")
+    assert path.exists(tmp_path / "failed/run_1/extra_imag_freq/Imag_freq.log")
+    with open(tmp_path / "success/CH4.log") as F:
+        split_text = F.read()
+    assert split_text.count("Normal termination") == 2
+    assert "Cite this work as:" in split_text
+    with open(tmp_path / "success/json_files/CH4.json") as F:
+        assert json.load(F)["metadata"]["ground or transition state"] == "transition_state"
+    # the jobs that never started are reported and their inputs are written
+    assert path.exists(tmp_path / "packed_outputs/gaussian_pack.com")
+    with open(tmp_path / "failed/run_1/fixed_QM_inputs/H2_conf_3.com") as F:
+        assert F.read() == "%nprocshared=8\n%mem=16GB\n# opt freq b3lyp/def2tzvp\n\nH2_conf_3\n\n0 1\nH 0.0 0.0 0.0\nH 0.0 0.0 0.74\n\n"
+    df_stats = pd.read_csv(tmp_path / "QCORR-run_1-stats.csv")
+    assert df_stats["Jobs not started"].tolist() == [1]
+
+
+@pytest.fixture
+def orca_pack(tmp_path):
+    """
+    ORCA output with four jobs ($new_job) and its packed input: the first job has an SCF
+    error, the second job finishes normally, the third job stops the run with an SCF error
+    and the fourth job never starts
+    """
+
+    with open(f"{path_qcorr}/QCORR_7/orca_TS_success.out") as F:
+        ts_lines = F.readlines()
+    with open(f"{path_qcorr}/QCORR_7/orca_imag_freq.out") as F:
+        imag_lines = F.readlines()
+    input_start = [i for i, line in enumerate(ts_lines) if line.startswith("|  1>")][0]
+    input_end = [i for i, line in enumerate(ts_lines) if line.find("****END OF INPUT****") > -1][0]
+    normal_end = [i for i, line in enumerate(ts_lines) if line.find("****ORCA TERMINATED NORMALLY****") > -1][0]
+    # the failed jobs stop after the first SCF (before the Hessian is calculated)
+    scf_end = [i for i, line in enumerate(imag_lines) if line.startswith("FINAL SINGLE POINT ENERGY")][0] + 1
+    scf_error = [
+        "\nORCA finished by error termination in SCF\n",
+        "Calling Command: orca_scf orca_pack.gbw b orca_pack\n",
+        "[file orca_tools/qcmsg.cpp, line 465]:\n",
+        "  .... aborting the run\n\n",
+    ]
+
+    job_input = "".join(line.split("> ", 1)[1] for line in ts_lines[input_start + 1:input_end])
+    titles = [f"pack_conf_{n_job}" for n_job in range(1, 5)]
+    input_text = "\n\n$new_job\n".join(f"# {title}\n{job_input.strip()}\n" for title in titles)
+    with open(tmp_path / "orca_pack.inp", "w") as F:
+        F.write(input_text)
+
+    # ORCA prints the input file with all the jobs at the beginning of the output
+    input_lines = input_text.split("\n") + ["**                         ****END OF INPUT****"]
+    pack_lines = ts_lines[:input_start]
+    pack_lines.extend(f"|{n_line:3}> {line}\n" for n_line, line in enumerate(input_lines, start=1))
+    pack_lines.extend(imag_lines[input_end + 1:scf_end] + scf_error)
+    pack_lines.append("\n                         $$$$$$$$$$$$$$$$  JOB NUMBER  2 $$$$$$$$$$$$$$\n")
+    pack_lines.extend(ts_lines[input_end + 1:normal_end])
+    pack_lines.append("\n                         $$$$$$$$$$$$$$$$  JOB NUMBER  3 $$$$$$$$$$$$$$\n")
+    pack_lines.extend(imag_lines[input_end + 1:scf_end] + scf_error)
+    with open(tmp_path / "orca_pack.out", "w") as F:
+        F.writelines(pack_lines)
+
+    return tmp_path
+
+
+def test_QCORR_split_outputs_orca(orca_pack, monkeypatch):
+    monkeypatch.chdir(orca_pack)
+    qcorr(files="orca_pack.out", fullcheck=False, split_outputs=True)
+    assert path.exists(orca_pack / "packed_outputs/orca_pack.out")
+    assert path.exists(orca_pack / "packed_outputs/orca_pack.inp")
+    # the jobs with errors are not marked as normal terminations
+    with open(orca_pack / "failed/run_1/error/scf_error/pack_conf_1.out") as F:
+        split_text = F.read()
+    assert "ORCA TERMINATED NORMALLY" not in split_text
+    assert "# pack_conf_1" in split_text and "# pack_conf_2" not in split_text
+    assert path.exists(orca_pack / "success/pack_conf_2.out")
+    assert path.exists(orca_pack / "failed/run_1/error/scf_error/pack_conf_3.out")
+    # the job that never started is written to the fixed inputs
+    fixed_folder = orca_pack / "failed/run_1/fixed_QM_inputs"
+    assert sorted(os.listdir(fixed_folder)) == ["pack_conf_1.inp", "pack_conf_3.inp", "pack_conf_4.inp"]
+    with open(fixed_folder / "pack_conf_4.inp") as F:
+        input_text = F.read()
+    assert input_text.startswith("# pack_conf_4\n%maxcore 10000")
+    assert "$new_job" not in input_text
+    df_stats = pd.read_csv(orca_pack / "QCORR-run_1-stats.csv")
+    assert df_stats["Jobs not started"].tolist() == [1]
+    assert df_stats["SCF error"].tolist() == [2]
+
+
+def test_QCORR_orca_opt_no_conv(tmp_path, monkeypatch):
+    # ORCA terminates normally when the optimization reaches the max. number of cycles
+    with open(f"{path_qcorr}/QCORR_7/orca_imag_freq.out") as F:
+        imag_lines = F.readlines()
+    scf_end = [i for i, line in enumerate(imag_lines) if line.startswith("FINAL SINGLE POINT ENERGY")][0] + 1
+    opt_no_conv = [
+        "\nThe optimization did not converge but reached the maximum number of\n",
+        "optimization cycles.\n",
+        "Please restart the calculation with the lowest energy geometry and/or\n",
+        "a larger maxiter for the geometry optimization.\n\n",
+        "                             ****ORCA TERMINATED NORMALLY****\n",
+    ]
+    with open(tmp_path / "orca_opt_no_conv.out", "w") as F:
+        F.writelines(imag_lines[:scf_end] + opt_no_conv)
+
+    monkeypatch.chdir(tmp_path)
+    qcorr(files="orca_opt_no_conv.out", fullcheck=False)
+    # the job is not mistaken for a single-point calculation
+    assert not path.exists(tmp_path / "success/orca_opt_no_conv.out")
+    assert path.exists(tmp_path / "failed/run_1/error/not_specified_error/orca_opt_no_conv.out")
+    assert path.exists(tmp_path / "failed/run_1/fixed_QM_inputs/orca_opt_no_conv.inp")
+
+
+@pytest.mark.parametrize("bundle_format", ["zip", "tar"])
+def test_QCORR_bundle(tmp_path, bundle_format, monkeypatch):
+    for file in ["CH4.log", "H_freq.log", "MeOH_G09.log"]:
+        shutil.copy2(f"{path_qcorr}/QCORR_1/{file}", tmp_path)
+    monkeypatch.chdir(tmp_path)
+    qcorr(files="*.log", fullcheck=True, bundle=bundle_format)
+    # the JSON files are stored in a single archive with its index
+    json_folder = tmp_path / "success/json_files"
+    bundle_file = json_folder / f"QCORR_json.{bundle_format}"
+    assert sorted(os.listdir(json_folder)) == sorted(
+        ["--QCORR_Fullcheck_Analysis--.dat", bundle_file.name, f"{bundle_file.name}.idx"]
+    )
+    assert sorted(os.path.basename(file) for file in get_json_files(json_folder)) == ["CH4.json", "H_freq.json", "MeOH_G09.json"]
+    with open_file(f"{bundle_file}/CH4.json") as F:
+        assert json.load(F)["metadata"]["ground or transition state"] == "ground_state"
+
+    # duplicates of the calculations stored in the bundle are detected and new JSON files are added
+    shutil.copy2(f"{path_qcorr}/QCORR_1/z_CH4_duplicate.log", tmp_path)
+    shutil.copy2(f"{path_qcorr}/QCORR_1/TS_CH3HCH3.log", tmp_path)
+    qcorr(files="*.log", fullcheck=False, bundle=bundle_format)
+    assert path.exists(tmp_path / "failed/run_1/duplicates/z_CH4_duplicate.log")
+    assert len(get_json_files(json_folder)) == 4
+    assert len(glob.glob(f"{json_folder}/*.json")) == 0
@@ -7,10 +7,18 @@
 import os
 from os import path
 import glob
+import gzip
+import lzma
 import pytest
 import shutil
 import subprocess
+import tarfile
+import zipfile
+import pandas as pd
 from pathlib import Path
+from rdkit import Chem
+from aqme.qprep import qprep
+from aqme.qcorr_utils import suggest_resources, estimate_wall_time
 
 # saves the working directory
 path_main = os.getcwd()
@@ -67,6 +75,11 @@ path_qprep = path_main + "/Example_workflows/QPREP_generating_input_files"
             False,
         ),  # test genecp and final line
         ("gen", "json_files", "gen_final_files", False),  # test gen
+        # selecting only some conformers from SDF files
+        ("lowest_n", "sdf_files", "lowest_files", False),  # test lowest_n
+        ("e_threshold_qprep", "sdf_files", "threshold_files", False),  # test e_threshold_qprep
+        # reading compressed output files
+        ("compressed", "log_files", "compressed_files", False),  # test LOG.gz and LOG.xz inputs
         # from YAML file (varfile=XX)
         ("yaml", "json_files", "yaml_files", False),  # test for yaml files
         # calling AQME from the parent folder where the files are located (omitting the w_dir_main keyword)
@@ -586,6 +599,71 @@ def test_QPREP_analysis(test_type, init_folder, target_folder, restore_folder):
         assert "Citation: AQME v" in outlines[1]
         assert "Time QPREP:" in outlines[-2]
 
+    elif test_type in ["lowest_n", "e_threshold_qprep"]:
+        if test_type == "lowest_n":
+            select_option = ["--lowest_n", "3"]
+            n_files = 3
+        else:
+            select_option = ["--e_threshold_qprep", "0.9"]
+            n_files = 4
+        cmd_aqme = [
+            "python",
+            "-m",
+            "aqme",
+            "--qprep",
+            "--destination",
+            destination,
+            "--files",
+            f"{w_dir_main}/quinine_rdkit.sdf",
+            "--program",
+            "gaussian",
+            "--qm_input",
+            qm_input,
+        ] + select_option
+        subprocess.run(cmd_aqme)
+
+        assert len(glob.glob(f"{destination}/quinine_rdkit_conf_*.com")) == n_files
+
+        outfile = open(f"{destination}/quinine_rdkit_conf_1.com", "r")
+        outlines = outfile.readlines()
+        outfile.close()
+
+        assert outlines[2].strip() == line_2
+        assert outlines[6].strip() == "0 1"
+        assert outlines[8].strip() == "O   2.93580000   2.55850000   2.17990000"
+
+    elif test_type == "compressed":
+        with open(f"{w_dir_main}/CH4.log", "rb") as f_log:
+            log_data = f_log.read()
+        with gzip.open(f"{w_dir_main}/CH4_gz.log.gz", "wb") as f_gz:
+            f_gz.write(log_data)
+        with lzma.open(f"{w_dir_main}/CH4_xz.log.xz", "wb") as f_xz:
+            f_xz.write(log_data)
+        cmd_aqme = [
+            "python",
+            "-m",
+            "aqme",
+            "--qprep",
+            "--destination",
+            destination,
+            "--files",
+            f"{w_dir_main}/CH4_*.log.*",
+            "--program",
+            "gaussian",
+            "--qm_input",
+            qm_input,
+        ]
+        subprocess.run(cmd_aqme)
+
+        for file in ["CH4_gz.com", "CH4_xz.com"]:
+            outfile = open(f"{destination}/{file}", "r")
+            outlines = outfile.readlines()
+            outfile.close()
+
+            assert outlines[2].strip() == line_2
+            assert outlines[6].strip() == "0 1"
+            assert outlines[8].strip() == "H   0.45703600  -0.46392100  -0.87651000"
+
     # leave the folders as they were initially to run a different batch of tests
     if restore_folder:
         os.chdir(path_main)
@@ -597,3 +675,253 @@ def test_QPREP_analysis(test_type, init_folder, target_folder, restore_folder):
         for dat_file in dat_files:
             if "QPREP" in dat_file:
                 os.remove(dat_file)
+
+def test_QPREP_cost_report(tmp_path, monkeypatch):
+    # nprocs and mem suggested from a cost report of QCORR
+    cost_csv = tmp_path / "QCORR-run_1-cost.csv"
+    with open(cost_csv, "w") as F:
+        F.write("Program,Level of theory,Atoms,Calculations,Processors,Memory (MB)\n")
+        F.write("gaussian,M062X/def2TZVP,1-10,2,4.0,8000.0\n")
+        F.write("gaussian,M062X/def2TZVP,26-50,1,16.0,32000.0\n")
+        F.write("gaussian,B3LYP/6-31G,1-10,5,2.0,2000.0\n")
+    shutil.copy2(f"{path_qprep}/log_files/CH4.log", tmp_path)
+    monkeypatch.chdir(tmp_path)
+    qm_inputs = {
+        "m062x def2tzvp opt freq": ("%nprocshared=4", "%mem=8GB"),
+        "b3lyp/6-31g": ("%nprocshared=2", "%mem=2GB"),
+        # all the calculations of the program are used for new levels of theory
+        # (median of processors and maximum memory)
+        "pbe1pbe/def2svp": ("%nprocshared=3", "%mem=8GB"),
+    }
+    for qm_input, (nprocs_line, mem_line) in qm_inputs.items():
+        qprep(
+            files="CH4.log",
+            destination=f"{tmp_path}/com_files",
+            program="gaussian",
+            qm_input=qm_input,
+            cost_report=str(cost_csv),
+        )
+        with open(tmp_path / "com_files/CH4.com") as F:
+            com_lines = F.read().splitlines()
+        assert nprocs_line in com_lines
+        assert mem_line in com_lines
+
+    # the suggestions are reused for conformers in the same range of molecule sizes
+    suggest_calls = []
+
+    def count_suggest_resources(*args):
+        suggest_calls.append(args[3])
+        return suggest_resources(*args)
+
+    monkeypatch.setattr("aqme.qprep.suggest_resources", count_suggest_resources)
+    shutil.copy2(f"{path_qprep}/sdf_files/quinine_rdkit.sdf", tmp_path)
+    qprep(
+        files="quinine_rdkit.sdf",
+        destination=f"{tmp_path}/com_files_conf",
+        program="gaussian",
+        qm_input="b3lyp/6-31g",
+        cost_report=str(cost_csv),
+    )
+    assert len(os.listdir(tmp_path / "com_files_conf")) == 10
+    assert len(suggest_calls) == 1
+    with open(tmp_path / "com_files_conf/quinine_rdkit_conf_10.com") as F:
+        assert "%mem=2GB" in F.read().splitlines()
+
+
+def test_QPREP_workers(tmp_path, monkeypatch):
+    # the inputs written with several processes are the same as the inputs written in serial
+    shutil.copy2(f"{path_qprep}/sdf_files/quinine_rdkit.sdf", tmp_path)
+    monkeypatch.chdir(tmp_path)
+    for workers in [1, 2]:
+        qprep(
+            files="quinine_rdkit.sdf",
+            destination=f"{tmp_path}/com_files_{workers}",
+            program="gaussian",
+            qm_input="wb97xd/genecp opt freq",
+            gen_atoms=["O"],
+            bs_gen="lanl2dz",
+            bs_nogen="6-31G*",
+            workers_qprep=workers,
+        )
+
+    com_files = sorted(os.listdir(tmp_path / "com_files_1"))
+    assert len(com_files) == 10
+    assert sorted(os.listdir(tmp_path / "com_files_2")) == com_files
+    for com_file in com_files:
+        with open(tmp_path / "com_files_1" / com_file) as F:
+            serial_text = F.read()
+        with open(tmp_path / "com_files_2" / com_file) as F:
+            assert F.read() == serial_text
+    assert "O 0\nlanl2dz\n****" in serial_text
+
+
+def test_QPREP_pack_inputs(tmp_path, monkeypatch):
+    # several conformers in the same input file (--Link1-- in Gaussian, $new_job in ORCA)
+    shutil.copy2(f"{path_qprep}/sdf_files/quinine_rdkit.sdf", tmp_path)
+    monkeypatch.chdir(tmp_path)
+    for program, extension, separator in [("gaussian", "com", "--Link1--\n"), ("orca", "inp", "\n$new_job\n")]:
+        qprep(
+            files="quinine_rdkit.sdf",
+            destination=f"{tmp_path}/{program}",
+            program=program,
+            qm_input="b3lyp/def2svp opt freq",
+            chk=True,
+            pack_inputs=4,
+        )
+        pack_files = sorted(os.listdir(tmp_path / program))
+        assert pack_files == [f"quinine_rdkit_pack_{n_pack}.{extension}" for n_pack in [1, 2, 3]]
+        with open(tmp_path / program / pack_files[0]) as F:
+            pack_text = F.read()
+        assert pack_text.count(separator) == 3
+        for n_conf in range(1, 5):
+            assert f"quinine_rdkit_conf_{n_conf}\n" in pack_text
+        with open(tmp_path / program / pack_files[2]) as F:
+            assert F.read().count(separator) == 1
+    assert "\n\n--Link1--\n%chk=quinine_rdkit_conf_2.chk\n" in open(tmp_path / "gaussian/quinine_rdkit_pack_1.com").read()
+
+
+def test_QPREP_dup_qprep(tmp_path, monkeypatch):
+    # b.sdf contains three conformers of a.sdf and a repeated conformer (the files are
+    # processed in alphabetical order, so a.sdf keeps the shared conformers)
+    shutil.copy2(f"{path_qprep}/sdf_files/quinine_rdkit.sdf", tmp_path / "a.sdf")
+    monkeypatch.chdir(tmp_path)
+    mols = [mol for mol in Chem.SDMolSupplier("a.sdf", removeHs=False)]
+    sdwriter = Chem.SDWriter("b.sdf")
+    for mol in mols[:3] + [mols[0]]:
+        sdwriter.write(mol)
+    sdwriter.close()
+
+    qprep(files="*.sdf", destination=f"{tmp_path}/QCALC", program="gaussian", qm_input="b3lyp/def2svp opt", dup_qprep=True)
+    com_files = sorted(glob.glob("QCALC/*.com"))
+    assert com_files == sorted([f"QCALC/a_conf_{i}.com" for i in range(1, 11)])
+    df_cache = pd.read_csv("QCALC/QPREP_dup_cache.csv", dtype=str, keep_default_na=False)
+    assert list(df_cache["File"]) == ["a.sdf", "b.sdf"]
+    assert list(df_cache["Unique conformers"]) == ["0 1 2 3 4 5 6 7 8 9", ""]
+    with open("QPREP_data.dat") as datfile:
+        assert "4 duplicated conformer(s) removed" in datfile.read()
+
+    # the unique conformers of files that didn't change are read from the cache
+    df_cache.loc[0, "Unique conformers"] = "0"
+    shutil.rmtree("QCALC")
+    os.makedirs("QCALC")
+    df_cache.to_csv("QCALC/QPREP_dup_cache.csv", index=False)
+    qprep(files="*.sdf", destination=f"{tmp_path}/QCALC", program="gaussian", qm_input="b3lyp/def2svp opt", dup_qprep=True)
+    assert glob.glob("QCALC/*.com") == ["QCALC/a_conf_1.com"]
+
+
+def test_QPREP_job_array(tmp_path, monkeypatch):
+    shutil.copy2(f"{path_qprep}/sdf_files/quinine_rdkit.sdf", tmp_path)
+    monkeypatch.chdir(tmp_path)
+    qprep(
+        files="quinine_rdkit.sdf",
+        destination=f"{tmp_path}/QCALC",
+        program="gaussian",
+        qm_input="b3lyp/def2svp opt freq",
+        mem="8GB",
+        nprocs=4,
+        job_array="pbs",
+        array_tasks=4,
+    )
+    # the 10 inputs (same size) are distributed in 4 tasks
+    df_jobs = pd.read_csv("QCALC/QPREP_jobs.csv")
+    assert len(df_jobs) == 10
+    assert sorted(df_jobs["Task"].value_counts().tolist()) == [2, 2, 3, 3]
+    assert set(df_jobs["Atoms"]) == {48}
+    with open("QCALC/QPREP_jobs.pbs") as F:
+        job_script = F.read()
+    assert "#PBS -J 1-4\n" in job_script
+    assert "ncpus=4:mem=9600mb" in job_script
+    assert "QPREP_jobs.csv" in job_script
+    assert 'g16 < "$input" > "${input%.*}.log"' in job_script
+
+    # outputs of the calculations (normal terminations for the inputs of task 1 and an error)
+    path_outputs = f"{path_main}/Example_workflows/QCORR_processing_QM_outputs/QCORR_1"
+    task_1 = df_jobs[df_jobs["Task"] == 1]["Input"].tolist()
+    for input_file in task_1:
+        shutil.copy2(f"{path_outputs}/CH4.log", f"QCALC/{input_file.split('.')[0]}.log")
+    error_input = df_jobs[df_jobs["Task"] == 2]["Input"].tolist()[0]
+    shutil.copy2(f"{path_outputs}/MeOH_SCF_error.log", f"QCALC/{error_input.split('.')[0]}.log")
+
+    job_status = qprep(job_status="QCALC/QPREP_jobs.csv")
+    assert job_status.unfinished_tasks == [2, 3, 4]
+    df_status = pd.read_csv("QCALC/QPREP_jobs_status.csv")
+    assert df_status["Status"].value_counts().to_dict() == {"missing": 10 - len(task_1) - 1, "normal": len(task_1), "failed": 1}
+
+    # wall times from a cost report, estimated once for all the systems with the same number of atoms
+    cost_csv = tmp_path / "QCORR-run_1-cost.csv"
+    with open(cost_csv, "w") as F:
+        F.write("Program,Level of theory,Atoms,Calculations,Mean atoms,Mean wall time (h),Processors,Memory (MB)\n")
+        F.write("gaussian,B3LYP/def2SVP,26-50,2,24.0,1.0,4.0,8000.0\n")
+    wall_time_calls = []
+
+    def count_estimate_wall_time(*args):
+        wall_time_calls.append(args[3])
+        return estimate_wall_time(*args)
+
+    monkeypatch.setattr("aqme.qprep.estimate_wall_time", count_estimate_wall_time)
+    qprep(
+        files="quinine_rdkit.sdf",
+        destination=f"{tmp_path}/QCALC_cost",
+        program="gaussian",
+        qm_input="b3lyp/def2svp opt freq",
+        cost_report=str(cost_csv),
+        job_array="pbs",
+        array_tasks=4,
+    )
+    assert wall_time_calls == [48]
+    df_jobs = pd.read_csv("QCALC_cost/QPREP_jobs.csv")
+    assert set(df_jobs["Estimated cost"]) == {8.0}
+
+
+def test_QPREP_bundle(tmp_path, monkeypatch):
+    shutil.copy2(f"{path_qprep}/sdf_files/quinine_rdkit.sdf", tmp_path)
+    monkeypatch.chdir(tmp_path)
+    # the inputs stored in the bundle are the same as the individual input files
+    qprep(files="quinine_rdkit.sdf", destination=f"{tmp_path}/files", program="gaussian", qm_input="b3lyp/def2svp opt")
+    qprep(
+        files="quinine_rdkit.sdf",
+        destination=f"{tmp_path}/bundle",
+        program="gaussian",
+        qm_input="b3lyp/def2svp opt",
+        bundle="tar",
+        workers_qprep=2,
+    )
+    assert sorted(os.listdir("bundle")) == ["QPREP_inputs.tar", "QPREP_inputs.tar.idx"]
+    with tarfile.open("bundle/QPREP_inputs.tar") as bundle_tar:
+        assert len(bundle_tar.getnames()) == 10
+        for com_file in os.listdir("files"):
+            with open(f"files/{com_file}", "rb") as F:
+                assert bundle_tar.extractfile(com_file).read() == F.read()
+
+    # the files of a bundle are used as inputs without extracting them
+    with zipfile.ZipFile("QCORR_json.zip", "w") as bundle_zip:
+        bundle_zip.write(f"{path_main}/Example_workflows/QPREP_generating_input_files/json_files/CH4.json", "CH4.json")
+    qprep(files="QCORR_json.zip", destination=f"{tmp_path}/from_bundle", program="orca", qm_input="b3lyp def2-svp")
+    assert os.listdir("from_bundle") == ["CH4.inp"]
+
+
+def test_QPREP_boltz_pop(tmp_path, monkeypatch):
+    shutil.copy2(f"{path_qprep}/sdf_files/quinine_rdkit.sdf", tmp_path)
+    monkeypatch.chdir(tmp_path)
+    # the 6 most stable conformers cover 91.5% of the population at 298.15 K
+    qprep(files="quinine_rdkit.sdf", destination=f"{tmp_path}/QCALC", program="gaussian", qm_input="b3lyp/def2svp opt", boltz_pop=0.9)
+    com_files = sorted(glob.glob("QCALC/*.com"))
+    assert com_files == [f"QCALC/quinine_rdkit_conf_{i}.com" for i in range(1, 7)]
+    with open("QPREP_data.dat") as datfile:
+        assert "6 of 10 conformer(s) of quinine_rdkit.sdf selected (91.5% of the Boltzmann population at 298.15 K)" in datfile.read()
+
+    # higher temperatures need more conformers to reach the same population
+    qprep(files="quinine_rdkit.sdf", destination=f"{tmp_path}/QCALC_1000K", program="gaussian", qm_input="b3lyp/def2svp opt", boltz_pop=0.9, boltz_temp=1000)
+    assert len(glob.glob("QCALC_1000K/*.com")) == 9
+
+    # the most stable conformers of the RMSD clusters are added to the selection
+    qprep(files="quinine_rdkit.sdf", destination=f"{tmp_path}/QCALC_clust", program="gaussian", qm_input="b3lyp/def2svp opt", boltz_pop=0.5, boltz_cluster_rms=0.3)
+    com_files = sorted(glob.glob("QCALC_clust/*.com"))
+    assert com_files == [f"QCALC_clust/quinine_rdkit_conf_{i}.com" for i in range(1, 6)]
+
+    # the population must be a fraction
+    with pytest.raises(SystemExit):
+        qprep(files="quinine_rdkit.sdf", destination=f"{tmp_path}/QCALC_wrong", program="gaussian", qm_input="b3lyp/def2svp opt", boltz_pop=95)
+    assert not os.path.exists("QCALC_wrong")
+    with open("QPREP_data.dat") as datfile:
+        assert "must be between 0 and 1" in datfile.read()
@@ -1,5 +1,14 @@
+import os
+import gzip
+import shutil
+import io
+import tarfile
 import pytest
-from aqme.utils import check_run
+from aqme.utils import check_run, QM_file_coords, open_file, get_sdf_index, load_sdf_index
+from aqme.bundle import BundleWriter, BundleReader, get_bundle_reader, bundle_readers, max_bundle_readers
+
+path_main = os.getcwd()
+path_outputs = f"{path_main}/Example_workflows/QCORR_processing_QM_outputs"
 
 
 class FakePath:
@@ -77,4 +86,97 @@ def test_check_run(
             w_dir=w_dir
         )
     except UnboundLocalError as e:
-        pytest.fail(f":: {e}")
\ No newline at end of file
+        pytest.fail(f":: {e}")
+
+
+@pytest.mark.parametrize(
+    "file, min_RMS, keywords_line, n_atoms, charge, mult, first_atom, last_atom",
+    [
+        ("QCORR_1/TS_CH3HCH3.log", -1, "", 9, 0, 2, ("C", [0.0, 0.0, -1.348407]), ("H", [0.0, 0.0, 0.000024])),
+        ("QCORR_1/TS_CH3HCH3_unfinished.log", 1, "", 9, 0, 2, ("C", [0.0, 0.0, -1.346764]), ("H", [0.0, 0.0, -0.000046])),
+        ("QCORR_1/nosymm.log", -1, "nosymm", 52, 0, 1, ("C", [2.088416, -1.711022, -2.141356]), ("H", [3.781608, 0.101266, 1.982161])),
+        ("QCORR_7/orca_TS_success.out", -1, "", 50, 0, 3, ("C", [-4.315259, 1.793902, -0.427143]), ("H", [4.0612, 1.47793, 2.28227])),
+    ],
+)
+def test_QM_file_coords(tmp_path, file, min_RMS, keywords_line, n_atoms, charge, mult, first_atom, last_atom):
+    output_file = f"{path_outputs}/{file}"
+    atom_types, cartesians, charge_file, mult_file = QM_file_coords(output_file, min_RMS, keywords_line)
+    assert len(atom_types) == n_atoms
+    assert len(cartesians) == n_atoms
+    assert (charge_file, mult_file) == (charge, mult)
+    # geometry of the requested orientation block (last block if min_RMS is -1)
+    assert (atom_types[0], cartesians[0]) == first_atom
+    assert (atom_types[-1], cartesians[-1]) == last_atom
+    # compressed outputs are streamed
+    gz_file = tmp_path / f"{os.path.basename(file)}.gz"
+    with open(output_file, "rb") as F_in, gzip.open(gz_file, "wb") as F_out:
+        shutil.copyfileobj(F_in, F_out)
+    assert QM_file_coords(gz_file, min_RMS, keywords_line) == (atom_types, cartesians, charge, mult)
+
+
+def test_bundle_outdated_index(tmp_path):
+    bundle_file = tmp_path / "files.tar"
+    writer = BundleWriter(bundle_file)
+    writer.write("a.json", '{"a": 1}')
+    writer.close()
+    assert BundleReader(bundle_file).read("a.json") == b'{"a": 1}'
+
+    # files added with other programs are found although they are not in the index
+    with tarfile.open(bundle_file, "a") as archive:
+        tarinfo = tarfile.TarInfo("b.json")
+        tarinfo.size = 8
+        archive.addfile(tarinfo, io.BytesIO(b'{"b": 2}'))
+    reader = BundleReader(bundle_file)
+    assert sorted(reader.names()) == ["a.json", "b.json"]
+    assert reader.read("b.json") == b'{"b": 2}'
+
+    # the index is written while the bundle is open, and the files written after the
+    # last update of the index are found if the run stops before closing the bundle
+    writer = BundleWriter(tmp_path / "open.tar", index_interval=2)
+    for name in ["c.json", "d.json", "e.json"]:
+        writer.write(name, f'{{"{name}": 0}}')
+    writer.archive.fileobj.flush()
+    assert os.path.exists(tmp_path / "open.tar.idx")
+    reader = BundleReader(tmp_path / "open.tar")
+    assert sorted(reader.names()) == ["c.json", "d.json", "e.json"]
+    assert reader.read("e.json") == b'{"e.json": 0}'
+    writer.close()
+
+
+def test_bundle_readers_closed(tmp_path):
+    # the ZIP bundles are closed when their readers are dropped from the cache
+    bundle_files = [str(tmp_path / f"files_{n_bundle}.zip") for n_bundle in range(max_bundle_readers + 2)]
+    for n_bundle, bundle_file in enumerate(bundle_files):
+        writer = BundleWriter(bundle_file)
+        writer.write("a.json", f'{{"a": {n_bundle}}}')
+        writer.close()
+    readers = [get_bundle_reader(bundle_file, os.stat(bundle_file).st_mtime_ns) for bundle_file in bundle_files]
+    assert len(bundle_readers) == max_bundle_readers
+    assert [reader.archive is None for reader in readers] == [True] * 2 + [False] * max_bundle_readers
+    assert readers[-1].read("a.json") == b'{"a": 9}'
+
+    # updating the index of a bundle closes all the readers
+    writer = BundleWriter(bundle_file)
+    writer.write("b.json", '{"b": 0}')
+    writer.close()
+    assert len(bundle_readers) == 0
+    assert all(reader.archive is None for reader in readers)
+
+
+def test_get_sdf_index(tmp_path):
+    sdf_file = tmp_path / "quinine.sdf"
+    shutil.copy2(f"{path_main}/Example_workflows/QPREP_generating_input_files/sdf_files/quinine_rdkit.sdf", sdf_file)
+    load_sdf_index.cache_clear()
+    assert len(get_sdf_index(str(sdf_file))) == 10
+    assert get_sdf_index(str(sdf_file)) is get_sdf_index(str(sdf_file))
+
+    # the index is built again when the file changes, and only the recent indexes are kept
+    with open(sdf_file) as F:
+        first_mol = F.read().split("$$$$\n")[0]
+    with open(sdf_file, "w") as F:
+        F.write(f"{first_mol}$$$$\n")
+    assert len(get_sdf_index(str(sdf_file))) == 1
+    for n_copy in range(40):
+        shutil.copy2(sdf_file, tmp_path / f"copy_{n_copy}.sdf")
+        get_sdf_index(str(tmp_path / f"copy_{n_copy}.sdf"))
+    assert load_sdf_index.cache_info().currsize == load_sdf_index.cache_info().maxsize